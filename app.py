@@ -1,9 +1,11 @@
 import asyncio
 import json
 import os
+from contextlib import asynccontextmanager
 # base64, io, PIL.Image are no longer directly used in app.py
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, Request # WebSocketDisconnect needed for endpoint
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
 from starlette.websockets import WebSocketState # WebSocketState needed for endpoint
 
@@ -13,37 +15,86 @@ from starlette.websockets import WebSocketState # WebSocketState needed for endp
 # Image utils are no longer directly needed in app.py
 # from image_utils import ...
 
-# Import RPGSession from its new file
-from rpg_session import RPGSession
 import config # Import the config module directly
+from app_logging import log_pipeline, get_logger, bind_session
 
-app = FastAPI()
+log_pipeline.configure() # Before the other app modules start logging
+logger = get_logger("app")
 
-connected_clients = {}
+from image_utils import sprite_registry, upload_reducer, pixel_grid_normalizer
+from ws_protocol import parse_capabilities
+from image_store import image_store, MEDIA_URL_PREFIX
+from image_scheduler import image_scheduler
+from openai_service import image_retry_policy
+from session_manager import session_manager
+from image_cache import theme_image_cache, image_response_cache
+from prompt_layout import prompt_cache_stats
+from warmup import readiness, warm_up
+from metrics import metrics_registry, TURN_SECONDS, WebSocketMetricsMiddleware
+from tracing import tracer
+from provider_cassette import cassette
+from image_workers import image_workers
+from retention import retention_sweeper
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared agent, schema check, sprites and static assets before the first request, not during it.
+    await warm_up(readiness)
+    retention_sweeper.start()
+    yield
+    readiness.shutting_down = True # /readyz goes 503 so the load balancer drains this worker
+    retention_sweeper.stop()
+    await config.http_client.aclose()
+    image_workers.shutdown()
+    log_pipeline.stop() # Flush queued log records
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(WebSocketMetricsMiddleware)
+
+# Series the subsystems already count, read when /metrics is scraped.
+metrics_registry.callback("aurora_connected_clients", "Open WebSocket connections on this worker.", "gauge",
+    lambda: {(): session_manager.connection_count()})
+metrics_registry.callback("aurora_live_sessions", "Sessions held in memory by this worker.", "gauge",
+    lambda: {(): len(session_manager)})
+metrics_registry.callback("aurora_background_tasks", "Background tasks (image generation) alive across sessions.", "gauge",
+    lambda: {(): session_manager.background_task_count()})
+metrics_registry.callback("aurora_retries_total", "Provider call retries.", "counter",
+    lambda: {(image_retry_policy.name,): image_retry_policy.retries}, ("policy",))
+metrics_registry.callback("aurora_cache_hits_total", "Cache hits.", "counter",
+    lambda: {
+        ("theme_image",): theme_image_cache.hits,
+        ("image_response",): image_response_cache.hits,
+        ("speculation",): sum(session.speculation.hits for session in session_manager.sessions()),
+    }, ("cache",))
+metrics_registry.callback("aurora_cache_misses_total", "Cache misses.", "counter",
+    lambda: {
+        ("theme_image",): theme_image_cache.misses,
+        ("image_response",): image_response_cache.misses,
+        ("speculation",): sum(session.speculation.misses for session in session_manager.sessions()),
+    }, ("cache",))
 
 # RPGSession class definition is now removed from here
 
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
+    bind_session(session_id) # Every log line from this connection (and tasks it spawns) carries the session
     await websocket.accept()
-    print(f"[App] WebSocket {session_id} accepted.")
+    logger.info("WebSocket %s accepted.", session_id)
 
-    if session_id not in connected_clients:
-        print(f"[App] New session: {session_id}. Creating RPGSession.")
-        connected_clients[session_id] = RPGSession(session_id)
-    else:
-        print(f"[App] Reconnecting or existing session: {session_id}.")
-    
-    session = connected_clients[session_id]
-    print(f"[App] Session {session_id} obtained. Game concluded: {session.game_concluded}")
+    session = await session_manager.acquire(session_id)
+    session.client_capabilities = parse_capabilities(websocket.query_params.get("caps"))
+    logger.info("Session %s client capabilities: %s", session_id, sorted(session.client_capabilities) or 'none (legacy JSON)')
+    logger.info("Session %s obtained. Game concluded: %s", session_id, session.game_concluded)
 
     try:
-        if not session.game_concluded: 
-            print(f"[App Session {session_id}] Calling start_game...")
+        if not session.game_concluded and session.can_resume():
+            await session.resume_game(websocket)
+        elif not session.game_concluded: 
+            logger.info("Calling start_game...")
             await session.start_game(websocket)
-            print(f"[App Session {session_id}] start_game completed.")
+            logger.info("start_game completed.")
         else:
-            print(f"[App Session {session_id}] Game already concluded. Sending final state.")
+            logger.info("Game already concluded. Sending final state.")
             if websocket.client_state == WebSocketState.CONNECTED:
                 # Prepare objectives data safely
                 objectives_data = []
@@ -55,7 +106,7 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                         for obj in session.game_context.objectives
                     ]
                 else:
-                    print(f"[App Session {session_id}] No game_context.objectives to send for concluded game.")
+                    logger.info("No game_context.objectives to send for concluded game.")
                 
                 await websocket.send_text(json.dumps({
                     "type": "narration_block", 
@@ -68,21 +119,27 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
                     "turn_id": session.turn_number
                 }))
                 await websocket.send_text(json.dumps({"type": "game_end", "message": "This story has already concluded."}))
-            print(f"[App Session {session_id}] Final state sent for concluded game.")
+            logger.info("Final state sent for concluded game.")
 
         while True:
             if session.game_concluded:
-                print(f"[App Session {session_id}] Game is concluded. Breaking WebSocket receive loop.")
+                logger.info("Game is concluded. Breaking WebSocket receive loop.")
                 break 
+            if session.ownership_lost:
+                logger.info("Session was taken over by a newer connection. Closing this one.")
+                if websocket.client_state == WebSocketState.CONNECTED:
+                    await websocket.send_text(json.dumps({"type": "error", "content": "This game was continued from another connection."}))
+                    await websocket.close(code=4409)
+                break
 
-            print(f"[App Session {session_id}] Waiting for client message...")
+            logger.debug("Waiting for client message...")
             data = await websocket.receive_text()
-            print(f"[App Session {session_id}] Received data: {data[:100]}...")
+            logger.debug("Received data: %.100s...", data)
             
             try:
                 user_data = json.loads(data)
             except json.JSONDecodeError:
-                print(f"[App Session {session_id}] Invalid JSON received from client. Message: {data}")
+                logger.warning("Invalid JSON received from client. Message: %.200s", data)
                 if websocket.client_state == WebSocketState.CONNECTED:
                     await websocket.send_text(json.dumps({"type": "error", "content": "Invalid JSON input from client."}))
                 continue # Wait for next message
@@ -91,67 +148,121 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             turn_id_from_client = user_data.get("turn_id")
             
             if session.game_concluded: 
-                print(f"[App Session {session_id}] Game concluded (checked after receive). Ignoring choice: {choice}")
+                logger.info("Game concluded (checked after receive). Ignoring choice: %s", choice)
                 if websocket.client_state == WebSocketState.CONNECTED:
                      await websocket.send_text(json.dumps({"type": "game_end", "message": "The story has concluded."}))
                 break 
             
             if choice is not None and turn_id_from_client is not None: 
-                print(f"[App Session {session_id}] Processing choice: '{choice}' for new turn_id: {turn_id_from_client}")
-                await session.process_user_choice(choice, turn_id_from_client, websocket)
-                print(f"[App Session {session_id}] process_user_choice completed for turn_id: {turn_id_from_client}")
+                logger.info("Processing choice: '%s' for new turn_id: %s", choice, turn_id_from_client)
+                with TURN_SECONDS.labels("story" if session.theme_selected else "theme").time():
+                    await session.process_user_choice(choice, turn_id_from_client, websocket)
+                logger.info("process_user_choice completed for turn_id: %s", turn_id_from_client)
             elif choice is not None: 
-                print(f"[App Session {session_id}] Received choice '{choice}' without a turn_id. Ignoring.")
+                logger.warning("Received choice '%s' without a turn_id. Ignoring.", choice)
                 if websocket.client_state == WebSocketState.CONNECTED:
                     await websocket.send_text(json.dumps({"type": "error", "content": "Client choice message missing 'turn_id' from client."}))
             else: 
-                print(f"[App Session {session_id}] Malformed choice message. Data: {user_data}")
+                logger.warning("Malformed choice message. Data: %.200s", user_data)
                 if websocket.client_state == WebSocketState.CONNECTED:
                     await websocket.send_text(json.dumps({"type": "error", "content": "Malformed choice message from client."}))
 
     except WebSocketDisconnect:
-        print(f"[App Session {session_id}] WebSocket disconnected by client or network issue.")
+        logger.info("WebSocket disconnected by client or network issue.")
     except Exception as e:
-        print(f"[App Session {session_id}] Unexpected error in WebSocket handler for {session_id}: {type(e).__name__} - {e}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Unexpected error in WebSocket handler for %s: %s - %s", session_id, type(e).__name__, e)
         if websocket.client_state == WebSocketState.CONNECTED:
             try:
                 await websocket.send_text(json.dumps({"type": "error", "content": "Unexpected server error. Please check logs."}))
             except Exception as send_err:
-                print(f"[App Session {session_id}] Failed to send error to client after main exception: {send_err}")
+                logger.error("Failed to send error to client after main exception: %s", send_err)
     finally:
-        print(f"[App Session {session_id}] WebSocket endpoint 'finally' block. Game concluded: {session.game_concluded}")
+        logger.debug("WebSocket endpoint 'finally' block. Game concluded: %s", session.game_concluded)
+        session.speculation.cancel_all() # Nobody is left to pick a choice
         
         if hasattr(session, 'background_tasks') and session.background_tasks:
-            print(f"[App Session {session_id}] Waiting for {len(session.background_tasks)} background tasks...")
+            logger.debug("Waiting for %s background tasks...", len(session.background_tasks))
             results = await asyncio.gather(*list(session.background_tasks), return_exceptions=True)
             for i, result in enumerate(results):
                 if isinstance(result, Exception):
-                    print(f"[App Session {session_id}] Background task {i} failed: {result}")
-            print(f"[App Session {session_id}] Background tasks finalized.")
+                    logger.warning("Background task %s failed: %s", i, result)
+            logger.debug("Background tasks finalized.")
 
         if session.game_concluded and websocket.client_state == WebSocketState.CONNECTED:
             try:
-                print(f"[App Session {session_id}] Sending final game_end message from endpoint's finally block (if not already sent).")
+                logger.info("Sending final game_end message from endpoint's finally block (if not already sent).")
                 await websocket.send_text(json.dumps({"type": "game_end", "message": "The story has concluded."}))
             except Exception as e_final_send:
-                print(f"[App Session {session_id}] Exception sending final game_end from finally: {e_final_send}")
+                logger.warning("Exception sending final game_end from finally: %s", e_final_send)
 
-        if session_id in connected_clients:
-            print(f"[App Session {session_id}] Cleaning up RPGSession object from connected_clients.")
-            del connected_clients[session_id]
-            print(f"[App Session {session_id}] RPGSession object cleaned up.")
+        session_manager.release(session_id)
         
         if websocket.client_state != WebSocketState.DISCONNECTED:
-            print(f"[App Session {session_id}] Server is NOT explicitly closing WebSocket per design. Current state: {websocket.client_state}")
+            logger.debug("Server is NOT explicitly closing WebSocket per design. Current state: %s", websocket.client_state)
         else:
-            print(f"[App Session {session_id}] WebSocket was already disconnected.")
+            logger.debug("WebSocket was already disconnected.")
+
+        logger.debug("WebSocket connection handler (%s) fully exiting.", websocket_endpoint.__name__)
+
+@app.get("/debug/stats")
+async def debug_stats():
+    """Process-level stats for capacity debugging."""
+    return {
+        "connected_clients": len(session_manager),
+        "sessions": session_manager.stats(),
+        "openai_http_pool": config.http_transport.stats(),
+        "image_scheduler": image_scheduler.stats(),
+        "image_retries": image_retry_policy.stats(),
+        "theme_image_cache": theme_image_cache.stats(),
+        "image_response_cache": image_response_cache.stats(),
+        "sprites": sprite_registry.stats(),
+        "upload_reduction": upload_reducer.stats(),
+        "pixel_grid": pixel_grid_normalizer.stats(),
+        "image_workers": image_workers.stats(),
+        "retention": retention_sweeper.stats(),
+        "prompt_cache": prompt_cache_stats.stats(),
+        "readiness": readiness.stats(),
+        "logging": log_pipeline.stats(),
+        "tracing": tracer.stats(),
+        "provider_cassette": cassette.stats(),
+    }
+
+@app.get("/debug/traces/{session_id}")
+async def debug_traces(session_id: str, turns: int = 5):
+    """Span waterfall for the last `turns` turns of a session (full history is in TRACE_FILE)."""
+    return {"session_id": session_id, "turns": tracer.waterfall(session_id, max(1, turns))}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of this worker's metrics."""
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 200 once this worker has warmed up, 503 before that and while shutting down."""
+    return JSONResponse(readiness.stats(), status_code=200 if readiness.ready else 503)
 
-        print(f"[App Session {session_id}] WebSocket connection handler ({websocket_endpoint.__name__}) fully exiting.")
+@app.get(MEDIA_URL_PREFIX + "/{filename}")
+async def get_stored_image(filename: str, request: Request):
+    """Serves content-addressed images. Names never change meaning, so they are cacheable forever."""
+    path = image_store.path_for(filename)
+    if path is None:
+        return Response(status_code=404)
+    headers = {
+        "ETag": image_store.etag_for(filename),
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if headers["ETag"] in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    # FileResponse handles Range / If-Range requests and keeps our strong ETag.
+    return FileResponse(path, media_type=image_store.mime_for(filename), headers=headers)
 
 app.mount("/", StaticFiles(directory="static", html=True), name="static")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8020, reload=True)
+    if config.WEB_WORKERS > 1 and config.SESSION_STORE_BACKEND != "sqlite":
+        logger.warning("%s workers with SESSION_STORE_BACKEND=%s; sessions won't survive moving between workers.", config.WEB_WORKERS, config.SESSION_STORE_BACKEND)
+    # Auto-reload only works with a single worker.
+    uvicorn.run("app:app", host="0.0.0.0", port=8020, reload=config.WEB_WORKERS == 1, workers=config.WEB_WORKERS)
@@ -0,0 +1,125 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from typing import Any, Dict
+
+from config import LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE
+
+# Per-session / per-turn fields. asyncio tasks copy the context they were created in,
+# so binding them at the top of a connection or turn tags everything logged beneath it.
+session_id_var: contextvars.ContextVar[str | None] = contextvars.ContextVar("session_id", default=None)
+turn_id_var: contextvars.ContextVar[int | None] = contextvars.ContextVar("turn_id", default=None)
+
+ROOT_LOGGER_NAME = "aurora"
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the app's root. Use %-style arguments so disabled levels cost only a level check."""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+def bind_session(session_id: str | None):
+    """Tags subsequent logs in this task (and tasks it creates) with session_id."""
+    session_id_var.set(session_id)
+
+def bind_turn(turn_id: int | None):
+    turn_id_var.set(turn_id)
+
+class _ContextFilter(logging.Filter):
+    """Stamps the caller's session/turn onto the record before it leaves the caller's context."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.session_id = session_id_var.get()
+        record.turn_id = turn_id_var.get()
+        return True
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without blocking the caller's thread.
+
+    When the queue is full (stdout can't keep up), records are dropped and counted
+    instead of stalling the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge the message here (cheap); line formatting and tracebacks happen on the writer thread.
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if getattr(record, "session_id", None) is not None:
+            entry["session_id"] = record.session_id
+        if getattr(record, "turn_id", None) is not None:
+            entry["turn_id"] = record.turn_id
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        context = ""
+        if getattr(record, "session_id", None) is not None:
+            context = f" [S {record.session_id}" + (f" T{record.turn_id}]" if getattr(record, "turn_id", None) is not None else "]")
+        line = f"{time.strftime('%H:%M:%S', time.localtime(record.created))} {record.levelname:<7} {record.name}{context} {record.getMessage()}"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+class LogPipeline:
+    """Level-gated logging for the app: callers enqueue, one background thread writes to stdout."""
+
+    def __init__(self):
+        self._handler: _DroppingQueueHandler | None = None
+        self._listener: logging.handlers.QueueListener | None = None
+
+    def configure(self, level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE):
+        if self._listener is not None:
+            return # Already configured in this process
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+        self._handler = _DroppingQueueHandler(queue.Queue(maxsize=queue_size))
+        self._handler.addFilter(_ContextFilter())
+        root = logging.getLogger(ROOT_LOGGER_NAME)
+        root.setLevel(level.upper())
+        root.addHandler(self._handler)
+        root.propagate = False
+        self._listener = logging.handlers.QueueListener(self._handler.queue, stream_handler, respect_handler_level=True)
+        self._listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Flushes what is queued and stops the writer thread."""
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        handler = self._handler
+        return {
+            "level": logging.getLevelName(logging.getLogger(ROOT_LOGGER_NAME).level),
+            "queued": handler.queue.qsize() if handler else 0,
+            "dropped": handler.dropped if handler else 0,
+        }
+
+# Configured once per process by app.py.
+log_pipeline = LogPipeline()
@@ -0,0 +1,46 @@
+"""Micro-benchmarks for the image and session hot paths.
+
+    python -m benchmarks                          # run all, save results/<commit>.json
+    python -m benchmarks --filter image_utils     # only matching benchmarks
+    python -m benchmarks --save-baseline          # also save as results/baseline.json
+    python -m benchmarks --compare baseline       # compare with a baseline, a commit or a results file
+
+With --compare, the exit code is 1 if any benchmark lost more than --threshold
+percent of its throughput, so an optimization is measured rather than guessed.
+"""
+import argparse
+import os
+import sys
+
+# Offline settings for the app modules imported below: no provider calls, no disk state.
+for name, value in {"OPENAI_API_KEY": "benchmark", "SESSION_STORE_BACKEND": "none", "TRACE_FILE": "", "LOG_LEVEL": "WARNING"}.items():
+    os.environ.setdefault(name, value)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import bench_image_utils, bench_session # noqa: E402,F401 (registers the benchmarks)
+from benchmarks.harness import compare, load_results, print_results, run_all, save_results # noqa: E402
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Micro-benchmarks for image_utils and RPGSession hot paths.")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=1.0, help="Seconds of timed calls per benchmark")
+    parser.add_argument("--compare", metavar="REF", help="Baseline: 'baseline', a commit hash (prefix) or a results file")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Throughput loss in percent that counts as a regression")
+    parser.add_argument("--save-baseline", action="store_true", help="Also save this run as results/baseline.json")
+    parser.add_argument("--no-save", action="store_true", help="Don't write results")
+    args = parser.parse_args()
+
+    results = run_all(args.filter, args.min_time)
+    print_results(results)
+    if not args.no_save:
+        print(f"\nSaved {save_results(results, results['revision'])}")
+        if args.save_baseline:
+            print(f"Saved {save_results(results, 'baseline')}")
+    if args.compare:
+        regressions = compare(results, load_results(args.compare), args.threshold)
+        if regressions:
+            print(f"\nRegressed by more than {args.threshold:g}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
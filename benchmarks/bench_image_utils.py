@@ -0,0 +1,36 @@
+import base64
+import io
+
+from PIL import Image
+
+from benchmarks.harness import benchmark
+from image_utils import PLACEHOLDER_IMAGE_PATH, get_placeholder_image_data, load_image_from_path, process_base64_image, sprite_registry
+
+SPRITE_PATH = "images/aurora.png"
+
+def scene_png_1024() -> bytes:
+    """A 1024x1024 pixel-art PNG, the size and kind of image the image API returns."""
+    with Image.open(PLACEHOLDER_IMAGE_PATH) as img:
+        scene = img.convert("RGB").resize((1024, 1024), Image.NEAREST)
+    buffer = io.BytesIO()
+    scene.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+@benchmark("image_utils.load_image_from_path[sprite]")
+def bench_load_image_from_path():
+    return lambda: load_image_from_path(SPRITE_PATH)
+
+@benchmark("image_utils.process_base64_image[1024 base64]")
+def bench_process_base64_image():
+    payload = base64.b64encode(scene_png_1024()).decode("ascii")
+    return lambda: process_base64_image(payload)
+
+@benchmark("image_utils.process_base64_image[1024 data-url]")
+def bench_process_base64_image_data_url():
+    payload = "data:image/png;base64," + base64.b64encode(scene_png_1024()).decode("ascii")
+    return lambda: process_base64_image(payload)
+
+@benchmark("image_utils.get_placeholder_image_data")
+def bench_get_placeholder_image_data():
+    sprite_registry.preload([PLACEHOLDER_IMAGE_PATH]) # As the startup warm-up does
+    return get_placeholder_image_data
@@ -0,0 +1,47 @@
+from benchmarks.bench_image_utils import scene_png_1024
+from benchmarks.harness import benchmark
+from config import CHARACTER_IMAGE_PATHS
+from image_utils import sprite_registry
+from openai_agent_service import Character, Objective, QuestState
+from rpg_session import RPGSession
+
+def midgame_session(turn_number: int, characters_in_scene: list[str]) -> RPGSession:
+    """A session a few turns in: objectives set, some finished, a previous scene image held."""
+    sprite_registry.preload(CHARACTER_IMAGE_PATHS.values())
+    session = RPGSession("benchmark")
+    session.theme_selected = True
+    session.turn_number = turn_number
+    session.reference_image_bytes = scene_png_1024()
+    session.reference_image_mime = "image/png"
+    session.current_characters_in_scene = characters_in_scene
+    context = session.game_context
+    context.current_turn = turn_number
+    context.theme = "Uma aventura no parque de diversões"
+    context.environment = "A roda-gigante ao entardecer"
+    context.entities = ["bilheteria", "carrossel", "algodão-doce", "guardião"]
+    context.characters.extend(Character(name=name, description=f"Amigo {name}", in_scene=name in characters_in_scene) for name in ("barbara", "davi", "lari"))
+    context.objectives = [Objective(id=i, objective=f"Objetivo número {i}: encontrar a peça perdida do mapa", finished=i <= 2) for i in range(1, 6)]
+    context.objectives_initialized = True
+    context.next_objective_id = 6
+    context.quest_state = QuestState.IN_PROGRESS
+    return session
+
+@benchmark("rpg_session.assemble_scene_request[turn 1]")
+def bench_assemble_scene_request_first_turn():
+    session = midgame_session(1, ["aurora", "barbara", "davi"])
+    return lambda: session.assemble_scene_request("As crianças chegam ao parque e olham a roda-gigante.")
+
+@benchmark("rpg_session.assemble_scene_request[turn 4]")
+def bench_assemble_scene_request():
+    session = midgame_session(4, ["aurora", "lari"])
+    return lambda: session.assemble_scene_request("Aurora e Lari abrem o baú misterioso perto do carrossel.")
+
+@benchmark("rpg_session.objectives_message")
+def bench_objectives_message():
+    session = midgame_session(4, ["aurora"])
+    return lambda: session.objectives_message(4)
+
+@benchmark("GameContext.model_dump_json")
+def bench_game_context_dump():
+    context = midgame_session(4, ["aurora", "lari"]).game_context
+    return context.model_dump_json
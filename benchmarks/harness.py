@@ -0,0 +1,159 @@
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+class Benchmark:
+    """One hot path. `setup()` builds the inputs once and returns the zero-argument callable to time."""
+
+    def __init__(self, name: str, setup: Callable[[], Callable[[], Any]]):
+        self.name = name
+        self.setup = setup
+
+_registry: List[Benchmark] = []
+
+def benchmark(name: str):
+    """Registers a setup function as a benchmark."""
+    def register(setup):
+        _registry.append(Benchmark(name, setup))
+        return setup
+    return register
+
+def registered() -> List[Benchmark]:
+    return list(_registry)
+
+def _calibrate(func: Callable[[], Any], round_seconds: float) -> int:
+    """Iterations per round so that one round takes about `round_seconds`."""
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        elapsed = time.perf_counter() - started
+        if elapsed >= round_seconds / 10 or iterations >= 1 << 20:
+            return max(1, int(iterations * round_seconds / max(elapsed, 1e-9)))
+        iterations *= 10
+
+def measure(func: Callable[[], Any], min_time: float, rounds: int = 5, alloc_calls: int = 20) -> Dict[str, Any]:
+    """Throughput from the median of `rounds` timed rounds, then memory from a separate traced pass.
+
+    Memory is what tracemalloc sees (Python-level allocations; pixel buffers PIL mallocs
+    itself are not included): the peak above the starting point during one call, and
+    the bytes and blocks each call leaves allocated, averaged over up to `alloc_calls` calls.
+    """
+    func() # Warm caches, imports and lazy initialization out of the measurement
+    iterations = _calibrate(func, min_time / rounds)
+    round_times = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            round_times.append((time.perf_counter() - started) / iterations)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    alloc_calls = max(1, min(alloc_calls, iterations))
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        gc.collect()
+        snapshot_before = tracemalloc.take_snapshot()
+        for _ in range(alloc_calls):
+            func()
+        snapshot_after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = snapshot_after.compare_to(snapshot_before, "filename")
+    retained_bytes = sum(stat.size_diff for stat in diff)
+    retained_blocks = sum(stat.count_diff for stat in diff)
+
+    median = statistics.median(round_times)
+    return {
+        "ops_per_sec": round(1 / median, 2) if median > 0 else None,
+        "mean_us": round(statistics.fmean(round_times) * 1e6, 3),
+        "median_us": round(median * 1e6, 3),
+        "stdev_pct": round(100 * statistics.pstdev(round_times) / median, 2) if median > 0 else 0.0,
+        "iterations": iterations * rounds,
+        "peak_kb": round((peak_bytes - before_bytes) / 1024, 2),
+        "retained_bytes_per_op": round(retained_bytes / alloc_calls, 1),
+        "retained_blocks_per_op": round(retained_blocks / alloc_calls, 2),
+    }
+
+def git_revision() -> str:
+    """Short commit hash of the tree being measured, with "-dirty" if it has local changes."""
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True).stdout.strip()
+        return f"{sha}-dirty" if dirty else sha
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def save_results(results: Dict[str, Any], name: str) -> str:
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{name}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+def load_results(ref: str) -> Dict[str, Any]:
+    """Results by file path, or by name in RESULTS_DIR ("baseline", a commit hash or its prefix)."""
+    if os.path.isfile(ref):
+        path = ref
+    else:
+        names = sorted(n[:-5] for n in os.listdir(RESULTS_DIR) if n.endswith(".json")) if os.path.isdir(RESULTS_DIR) else []
+        matches = [n for n in names if n == ref] or [n for n in names if n.startswith(ref)]
+        if len(matches) != 1:
+            raise SystemExit(f"No unique benchmark results for {ref!r} in {RESULTS_DIR} (have: {', '.join(names) or 'none'})")
+        path = os.path.join(RESULTS_DIR, f"{matches[0]}.json")
+    with open(path) as f:
+        return json.load(f)
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold_pct: float) -> List[str]:
+    """Prints current vs. baseline per benchmark; returns the benchmarks slower by more than threshold_pct."""
+    regressions = []
+    print(f"\nvs. {baseline.get('revision', '?')} ({baseline.get('python', '?')})")
+    print(f"{'benchmark':<50}{'ops/s':>12}{'base':>12}{'change':>9}{'peak KB':>10}{'base':>10}")
+    for name, result in current["benchmarks"].items():
+        base = baseline.get("benchmarks", {}).get(name)
+        if base is None:
+            print(f"{name:<50}{result['ops_per_sec']:>12.1f}{'-':>12}{'new':>9}{result['peak_kb']:>10.1f}{'-':>10}")
+            continue
+        change = 100 * (result["ops_per_sec"] - base["ops_per_sec"]) / base["ops_per_sec"]
+        flag = ""
+        if change < -threshold_pct:
+            regressions.append(name)
+            flag = " !"
+        print(f"{name:<50}{result['ops_per_sec']:>12.1f}{base['ops_per_sec']:>12.1f}{change:>+8.1f}%{result['peak_kb']:>10.1f}{base['peak_kb']:>10.1f}{flag}")
+    return regressions
+
+def print_results(results: Dict[str, Any]):
+    print(f"{'benchmark':<50}{'ops/s':>12}{'median us':>12}{'+/-%':>7}{'peak KB':>10}{'retained B/op':>15}")
+    for name, r in results["benchmarks"].items():
+        print(f"{name:<50}{r['ops_per_sec']:>12.1f}{r['median_us']:>12.1f}{r['stdev_pct']:>7.1f}{r['peak_kb']:>10.1f}{r['retained_bytes_per_op']:>15.1f}")
+
+def environment() -> Dict[str, Any]:
+    return {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()}
+
+def run_all(selected: Optional[str], min_time: float) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"revision": git_revision(), "created_at": round(time.time()), **environment(), "benchmarks": {}}
+    for bench in registered():
+        if selected and selected not in bench.name:
+            continue
+        func = bench.setup()
+        results["benchmarks"][bench.name] = measure(func, min_time)
+    return results
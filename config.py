@@ -1,12 +1,27 @@
 import os
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI
+
+from http_pool import build_async_http_client
 
 # Load environment variables
 load_dotenv()
 
-# OpenAI Client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI Client: one async client per process, sharing a keep-alive connection pool
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "30"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() == "true" # Only used if the 'h2' package is installed
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "600"))
+
+http_client, http_transport = build_async_http_client(
+    max_connections=OPENAI_MAX_CONNECTIONS,
+    max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    http2=OPENAI_HTTP2,
+    timeout=OPENAI_TIMEOUT,
+)
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
 
 # System Prompt for Storyteller Agent
 def load_text_file(file_path: str, fallback_text: str) -> str:
@@ -61,6 +76,142 @@ INITIAL_IMAGE_PROMPT = os.getenv(
 )
 USE_PLACEHOLDER_INITIAL_IMAGE = os.getenv("USE_PLACEHOLDER_INITIAL_IMAGE", "false").lower() == "true"
 
+# Stream narration to the client as the storyteller generates it ("text" messages before "narration_block")
+STREAM_NARRATION = os.getenv("STREAM_NARRATION", "true").lower() == "true"
+
+# Speculative pre-generation of the next agent turn for each offered choice (off by default: it spends API calls)
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "false").lower() == "true"
+SPECULATION_MAX_BRANCHES = int(os.getenv("SPECULATION_MAX_BRANCHES", "4"))
+SPECULATION_MAX_CONCURRENCY = int(os.getenv("SPECULATION_MAX_CONCURRENCY", "8"))
+SPECULATION_MAX_RUNS_PER_SESSION = int(os.getenv("SPECULATION_MAX_RUNS_PER_SESSION", "60"))
+
+# Process-wide image generation scheduler (match the rate limit to your provider tier; 0 = no rate limit)
+IMAGE_MAX_CONCURRENCY = int(os.getenv("IMAGE_MAX_CONCURRENCY", "8"))
+IMAGE_RATE_LIMIT_PER_MINUTE = float(os.getenv("IMAGE_RATE_LIMIT_PER_MINUTE", "50"))
+IMAGE_RATE_BURST = int(os.getenv("IMAGE_RATE_BURST", "10"))
+
+# Image call retries: per-attempt deadline, jittered backoff, optional hedging, circuit breaker
+IMAGE_RETRY_MAX_ATTEMPTS = int(os.getenv("IMAGE_RETRY_MAX_ATTEMPTS", "3"))
+IMAGE_ATTEMPT_TIMEOUT = float(os.getenv("IMAGE_ATTEMPT_TIMEOUT", "180"))
+IMAGE_RETRY_BASE_DELAY = float(os.getenv("IMAGE_RETRY_BASE_DELAY", "0.5"))
+IMAGE_RETRY_MAX_DELAY = float(os.getenv("IMAGE_RETRY_MAX_DELAY", "8"))
+IMAGE_HEDGE_ENABLED = os.getenv("IMAGE_HEDGE_ENABLED", "false").lower() == "true"
+IMAGE_HEDGE_PERCENTILE = float(os.getenv("IMAGE_HEDGE_PERCENTILE", "0.95"))
+IMAGE_BREAKER_FAILURE_THRESHOLD = int(os.getenv("IMAGE_BREAKER_FAILURE_THRESHOLD", "5"))
+IMAGE_BREAKER_RESET_SECONDS = float(os.getenv("IMAGE_BREAKER_RESET_SECONDS", "30"))
+
+# Session snapshots for resuming after a disconnect and for serving one game from several workers:
+# "sqlite" (shared by all workers on a host), "memory" (single process, tests) or "none"
+SESSION_STORE_BACKEND = os.getenv("SESSION_STORE_BACKEND", "sqlite")
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "data/sessions.db")
+
+# Retention: a concluded game's snapshot is deleted right away; snapshots not saved for
+# SESSION_RETENTION_SECONDS and stored images not written or reused for IMAGE_STORE_RETENTION_SECONDS
+# are removed by a sweep at startup and every RETENTION_SWEEP_INTERVAL_SECONDS (0 = keep forever).
+SESSION_RETENTION_SECONDS = float(os.getenv("SESSION_RETENTION_SECONDS", str(7 * 24 * 3600)))
+IMAGE_STORE_RETENTION_SECONDS = float(os.getenv("IMAGE_STORE_RETENTION_SECONDS", str(SESSION_RETENTION_SECONDS)))
+RETENTION_SWEEP_INTERVAL_SECONDS = float(os.getenv("RETENTION_SWEEP_INTERVAL_SECONDS", "3600"))
+
+# Uvicorn worker processes when running app.py directly. Sessions move between workers
+# through the session store, so >1 needs the shared "sqlite" backend. Per-process limits
+# (IMAGE_MAX_CONCURRENCY, IMAGE_RATE_LIMIT_PER_MINUTE, ...) apply to each worker.
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "1"))
+
+# Theme-selection image shared by every new session: generated once, reused until the TTL
+# expires (0 = don't persist). Refresh by hand with `python image_cache.py refresh`.
+THEME_IMAGE_CACHE_DIR = os.getenv("THEME_IMAGE_CACHE_DIR", "data/theme_image_cache")
+THEME_IMAGE_CACHE_TTL_SECONDS = float(os.getenv("THEME_IMAGE_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# On-disk LRU cache of image API results, keyed on prompt + input images + parameters.
+# Set IMAGE_CACHE_BYPASS=true to always call the API (fresh variations every time).
+IMAGE_RESPONSE_CACHE_DIR = os.getenv("IMAGE_RESPONSE_CACHE_DIR", "data/image_response_cache")
+IMAGE_RESPONSE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_RESPONSE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_CACHE_BYPASS = os.getenv("IMAGE_CACHE_BYPASS", "false").lower() == "true"
+
+# Shrinking of reference images before upload to the image API. 0 disables downscaling /
+# palette quantization; alpha is only stripped from images that are fully opaque. Images no
+# step changes are sent as they are unless UPLOAD_OPTIMIZE_PNG forces a lossless re-encode
+# (about 1 s of CPU per scene image, for little or no saving on the API's own PNGs).
+UPLOAD_REDUCTION_ENABLED = os.getenv("UPLOAD_REDUCTION_ENABLED", "true").lower() == "true"
+UPLOAD_MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "0"))
+UPLOAD_PALETTE_COLORS = int(os.getenv("UPLOAD_PALETTE_COLORS", "0"))
+UPLOAD_OPTIMIZE_PNG = os.getenv("UPLOAD_OPTIMIZE_PNG", "false").lower() == "true"
+UPLOAD_STRIP_ALPHA = os.getenv("UPLOAD_STRIP_ALPHA", "true").lower() == "true"
+
+# Generated images are sent to the client at their logical pixel resolution (one pixel
+# per pixel-art cell) and upscaled there; the full-resolution image stays the reference
+# for the next turn. PIXEL_GRID_SIZE=0 detects the cell size per image.
+PIXEL_GRID_ENABLED = os.getenv("PIXEL_GRID_ENABLED", "true").lower() == "true"
+PIXEL_GRID_SIZE = int(os.getenv("PIXEL_GRID_SIZE", "0"))
+PIXEL_GRID_PALETTE_COLORS = int(os.getenv("PIXEL_GRID_PALETTE_COLORS", "64"))
+
+# Image backend: "openai" or "fake" (local, no network; for tests and load runs).
+# IMAGE_PARTIAL_IMAGES previews (0-3) are streamed to clients while an image renders.
+# FAKE_IMAGE_LATENCY_SECONDS is seconds or a distribution, e.g. "lognormal:3:0.4" (see latency_model.py).
+IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "openai")
+IMAGE_PARTIAL_IMAGES = int(os.getenv("IMAGE_PARTIAL_IMAGES", "2"))
+FAKE_IMAGE_LATENCY_SECONDS = os.getenv("FAKE_IMAGE_LATENCY_SECONDS", "3")
+
+# Storyteller backend: "openai" or "fake" (scripted responses, no network; for load runs).
+# The fake streams its narration after FAKE_AGENT_TTFT_SECONDS and finishes the run after
+# FAKE_AGENT_LATENCY_SECONDS (both distributions, like FAKE_IMAGE_LATENCY_SECONDS), and
+# completes each objective with FAKE_AGENT_OBJECTIVE_CHANCE per turn.
+AGENT_BACKEND = os.getenv("AGENT_BACKEND", "openai")
+FAKE_AGENT_TTFT_SECONDS = os.getenv("FAKE_AGENT_TTFT_SECONDS", "lognormal:0.8:0.3")
+FAKE_AGENT_LATENCY_SECONDS = os.getenv("FAKE_AGENT_LATENCY_SECONDS", "lognormal:4:0.35")
+FAKE_AGENT_OBJECTIVE_CHANCE = float(os.getenv("FAKE_AGENT_OBJECTIVE_CHANCE", "0.15"))
+
+# Story memory fed to the agent each turn: the last STORY_MEMORY_RECENT_TURNS turns in
+# detail, older ones folded into a capped summary every STORY_MEMORY_COMPACT_EVERY turns,
+# all fitted into STORY_MEMORY_TOKEN_BUDGET (approximate) tokens.
+STORY_MEMORY_RECENT_TURNS = int(os.getenv("STORY_MEMORY_RECENT_TURNS", "4"))
+STORY_MEMORY_COMPACT_EVERY = int(os.getenv("STORY_MEMORY_COMPACT_EVERY", "4"))
+STORY_MEMORY_SUMMARY_MAX_CHARS = int(os.getenv("STORY_MEMORY_SUMMARY_MAX_CHARS", "1500"))
+STORY_MEMORY_TOKEN_BUDGET = int(os.getenv("STORY_MEMORY_TOKEN_BUDGET", "600"))
+
+# Provider prompt-cache retention for agent runs ("in_memory" or "24h"; empty = provider default).
+AGENT_PROMPT_CACHE_RETENTION = os.getenv("AGENT_PROMPT_CACHE_RETENTION", "") or None
+
+# Logging: level gate, "text" or "json" lines, and how many records may wait for the writer thread.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Per-turn span tracing: kept in memory for /debug/traces and, if TRACE_FILE is set (e.g.
+# data/traces.jsonl), appended to it in Chrome trace-event format. The file is rotated to
+# TRACE_FILE.1 once it reaches TRACE_FILE_MAX_BYTES, so at most two files are kept.
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(64 * 1024 * 1024)))
+TRACE_TURNS_PER_SESSION = int(os.getenv("TRACE_TURNS_PER_SESSION", "20"))
+TRACE_MAX_SESSIONS = int(os.getenv("TRACE_MAX_SESSIONS", "1000"))
+
+# CPU-bound image work (base64 decoding, upload reduction, pixel-grid collapse, previews) runs
+# in IMAGE_WORKER_PROCESSES worker processes per web worker, so it uses every core instead of
+# stalling the event loop; 0 runs it in threads, the default on a single core, where a process
+# only adds IPC and serializes calls that threads would interleave. Byte buffers of
+# IMAGE_WORKER_SHM_THRESHOLD bytes or more cross to and from the workers through shared memory.
+_CPUS = os.cpu_count() or 1
+IMAGE_WORKER_PROCESSES = int(os.getenv("IMAGE_WORKER_PROCESSES", str(min(4, _CPUS) if _CPUS > 1 else 0)))
+IMAGE_WORKER_SHM_THRESHOLD = int(os.getenv("IMAGE_WORKER_SHM_THRESHOLD", str(256 * 1024)))
+
+# Provider record/replay. "live" calls the configured backends; "record" also saves every
+# agent run and image edit (outputs, tool calls, previews, timing) to PROVIDER_CASSETTE_DIR;
+# "replay" answers from that cassette with no network, waiting PROVIDER_REPLAY_DELAY_SCALE x
+# the recorded timing (1 = recorded speed, 0 = no delay). PROVIDER_REPLAY_STRICT fails calls
+# that were never recorded instead of reusing recorded calls of the same kind.
+PROVIDER_MODE = os.getenv("PROVIDER_MODE", "live")
+PROVIDER_CASSETTE_DIR = os.getenv("PROVIDER_CASSETTE_DIR", "data/cassette")
+PROVIDER_REPLAY_DELAY_SCALE = float(os.getenv("PROVIDER_REPLAY_DELAY_SCALE", "1"))
+PROVIDER_REPLAY_STRICT = os.getenv("PROVIDER_REPLAY_STRICT", "false").lower() == "true"
+
+# Startup warm-up: how many provider connections to open before reporting ready (0 = none).
+WARMUP_PROVIDER_CONNECTIONS = int(os.getenv("WARMUP_PROVIDER_CONNECTIONS", "0"))
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "10"))
+
+# Content-addressed store for generated images, served at /media/<sha256>.<ext>
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "generated_images")
+
 # Debug flag to repeat the first image instead of generating new ones
 DEBUG_IMAGE_REPEAT = False
 
@@ -0,0 +1,103 @@
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, Optional
+
+from config import (
+    CHARACTER_IMAGE_PATHS, FAKE_AGENT_TTFT_SECONDS, FAKE_AGENT_LATENCY_SECONDS, FAKE_AGENT_OBJECTIVE_CHANCE,
+)
+from latency_model import LatencyDistribution
+from openai_agent_service import GameContext, Objective, QuestState, StoryResponse
+from app_logging import get_logger
+
+logger = get_logger("fake_agent")
+
+_PLACES = ["a praça do bairro", "a biblioteca antiga", "o parque de diversões", "a floresta encantada", "o castelo de nuvens", "a estação espacial"]
+_OBJECTIVES = ["Encontrar o mapa perdido", "Ajudar o guardião da ponte", "Recuperar a chave dourada", "Descobrir o segredo da torre", "Acender o farol"]
+_ACTIONS = ["Explorar o caminho da esquerda", "Conversar com o guardião", "Abrir o baú misterioso", "Seguir as pegadas", "Subir na árvore", "Procurar pistas", "Chamar os amigos", "Atravessar a ponte"]
+_SENTENCES = [
+    "As crianças olham em volta, curiosas com cada detalhe.",
+    "Um vento suave traz o cheiro de aventura.",
+    "{name} aponta para algo brilhando ao longe.",
+    "Passos ecoam pelo caminho, e todos seguram a respiração.",
+    "Uma risada quebra o silêncio, e a coragem volta ao grupo.",
+    "O céu muda de cor, como se a história soubesse o que vem a seguir.",
+]
+
+class FakeStoryteller:
+    """Scripted storyteller for load runs: same StoryResponse shape and GameContext updates
+    as the real agent, with provider-like timing and no network.
+
+    Narration is streamed in small deltas between the sampled time to first token and
+    the sampled total run time, so time-to-narration and turn latency can be tuned
+    independently.
+    """
+
+    def __init__(self, ttft: LatencyDistribution, latency: LatencyDistribution, objective_chance: float, narration_sentences: int = 8, rng: Optional[random.Random] = None):
+        self.ttft = ttft
+        self.latency = latency
+        self.objective_chance = objective_chance
+        self.narration_sentences = narration_sentences
+        self.rng = rng or random.Random()
+        self.runs = 0
+
+    def _create_objectives(self, game_context: GameContext):
+        for text in self.rng.sample(_OBJECTIVES, 3):
+            game_context.objectives.append(Objective(id=game_context.next_objective_id, objective=text, finished=False))
+            game_context.next_objective_id += 1
+        game_context.objectives_initialized = True
+        game_context.quest_state = QuestState.IN_PROGRESS
+
+    def _advance_objectives(self, game_context: GameContext):
+        pending = [obj for obj in game_context.objectives if not obj.finished]
+        if pending and self.rng.random() < self.objective_chance:
+            pending[0].finished = True
+        if game_context.check_all_objectives_completed():
+            game_context.quest_state = QuestState.COMPLETED
+
+    def _compose(self, game_context: GameContext) -> StoryResponse:
+        characters = self.rng.sample(sorted(CHARACTER_IMAGE_PATHS), 2)
+        place = self.rng.choice(_PLACES)
+        sentences = [f"Turno {game_context.current_turn}: o grupo chega a {place}."]
+        sentences += [self.rng.choice(_SENTENCES).format(name=characters[0].capitalize()) for _ in range(self.narration_sentences - 1)]
+        concluded = game_context.quest_state == QuestState.COMPLETED
+        return StoryResponse(
+            narration=" ".join(sentences),
+            image_prompt=f"{' and '.join(characters)} at {place}, pixel art",
+            characters_in_scene=characters,
+            choices=[] if concluded else self.rng.sample(_ACTIONS, 3),
+        )
+
+    async def respond(self, game_context: GameContext, on_narration_delta: Callable[[str], Awaitable[None]] | None = None) -> StoryResponse:
+        self.runs += 1
+        started = time.monotonic()
+        ttft = self.ttft.sample(self.rng)
+        total = max(ttft, self.latency.sample(self.rng))
+        if not game_context.objectives_initialized:
+            self._create_objectives(game_context)
+        else:
+            self._advance_objectives(game_context)
+        response = self._compose(game_context)
+
+        await asyncio.sleep(ttft)
+        if on_narration_delta is not None:
+            words = response.narration.split(" ")
+            chunks = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+            gap = (total - ttft) / len(chunks)
+            for chunk in chunks:
+                try:
+                    await on_narration_delta(chunk)
+                except Exception as send_e:
+                    logger.warning("Failed to forward narration delta: %s", send_e)
+                await asyncio.sleep(gap)
+        else:
+            await asyncio.sleep(total - ttft)
+        logger.debug("Run %s took %.2fs (TTFT %.2fs).", self.runs, time.monotonic() - started, ttft)
+        return response
+
+# Shared by every session in the process when AGENT_BACKEND=fake.
+fake_storyteller = FakeStoryteller(
+    LatencyDistribution.parse(FAKE_AGENT_TTFT_SECONDS),
+    LatencyDistribution.parse(FAKE_AGENT_LATENCY_SECONDS),
+    FAKE_AGENT_OBJECTIVE_CHANCE,
+)
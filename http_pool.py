@@ -0,0 +1,85 @@
+import importlib.util
+
+try:
+    import httpx2 as httpx # openai>=3 ships on the httpx2 fork; the client must come from the same package
+except ImportError:
+    import httpx
+
+class _TrackedStream(httpx.AsyncByteStream):
+    """Response body wrapper that reports when the connection is handed back to the pool."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+        self._closed = False
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            if not self._closed:
+                self._closed = True
+                self._on_close()
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Keep-alive connection pool transport that counts in-flight requests and pool occupancy."""
+
+    def __init__(self, max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, http2: bool):
+        self.http2 = http2 and importlib.util.find_spec("h2") is not None # HTTP/2 needs the optional 'h2' package
+        self.max_connections = max_connections
+        self._transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            http2=self.http2,
+        )
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.total_requests = 0
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        self.total_requests += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            self._release()
+            raise
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_TrackedStream(response.stream, self._release),
+            extensions=response.extensions,
+        )
+
+    def _release(self):
+        self.in_flight -= 1
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+    def stats(self) -> dict:
+        connections = getattr(getattr(self._transport, "_pool", None), "connections", []) # httpcore internals, best effort
+        idle = sum(1 for conn in connections if conn.is_idle())
+        return {
+            "http2": self.http2,
+            "max_connections": self.max_connections,
+            "open_connections": len(connections),
+            "idle_connections": idle,
+            "active_connections": len(connections) - idle,
+            "in_flight_requests": self.in_flight,
+            "peak_in_flight_requests": self.peak_in_flight,
+            "total_requests": self.total_requests,
+        }
+
+def build_async_http_client(max_connections: int, max_keepalive_connections: int, keepalive_expiry: float, http2: bool, timeout: float) -> tuple[httpx.AsyncClient, InstrumentedTransport]:
+    """Creates the process-wide HTTP client used by the OpenAI SDK, plus its transport for stats."""
+    transport = InstrumentedTransport(max_connections, max_keepalive_connections, keepalive_expiry, http2)
+    return httpx.AsyncClient(transport=transport, timeout=timeout), transport
@@ -0,0 +1,159 @@
+import asyncio
+import base64
+import hashlib
+import io
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from PIL import Image, ImageFilter
+
+from config import client, IMAGE_BACKEND, IMAGE_PARTIAL_IMAGES, FAKE_IMAGE_LATENCY_SECONDS, PROVIDER_MODE
+from latency_model import LatencyDistribution
+from provider_cassette import Cassette, cassette, request_key
+
+# Called with (partial image base64, partial index) as the provider streams previews.
+PartialImageCallback = Callable[[str, int], Awaitable[None]]
+
+class ImageBackend(ABC):
+    """Where image edit requests go. `api_args` are images.edit keyword arguments."""
+
+    @abstractmethod
+    async def edit(self, api_args: Dict[str, Any], on_partial: Optional[PartialImageCallback] = None) -> str:
+        """Runs the edit and returns the final image as base64."""
+
+class OpenAIImageBackend(ImageBackend):
+    """The real API. With a partial-image callback, uses streaming mode so previews arrive while the image renders."""
+
+    def __init__(self, partial_images: int):
+        self.partial_images = partial_images
+
+    async def edit(self, api_args: Dict[str, Any], on_partial: Optional[PartialImageCallback] = None) -> str:
+        if on_partial is None or self.partial_images <= 0:
+            response = await client.images.edit(**api_args)
+            return response.data[0].b64_json
+        stream = await client.images.edit(**api_args, stream=True, partial_images=self.partial_images)
+        final_b64 = None
+        async for event in stream:
+            if event.type == "image_edit.partial_image":
+                await on_partial(event.b64_json, event.partial_image_index)
+            elif event.type == "image_edit.completed":
+                final_b64 = event.b64_json
+        if final_b64 is None:
+            raise RuntimeError("Image stream ended without a completed image")
+        return final_b64
+
+class FakeStreamingImageBackend(ImageBackend):
+    """Local stand-in for tests and load runs: no network, no cost.
+
+    Returns the first input image as the "edited" result after a latency drawn from
+    `latency`, emitting `partial_images` progressively sharper previews on the way, like the
+    real streaming API.
+    """
+
+    def __init__(self, latency: LatencyDistribution, partial_images: int):
+        self.latency = latency
+        self.partial_images = partial_images
+        self.calls = 0
+
+    @staticmethod
+    def _first_input_bytes(api_args: Dict[str, Any]) -> bytes:
+        image = api_args["image"]
+        first = image[0] if isinstance(image, list) else image
+        return first[1].getvalue()
+
+    @staticmethod
+    def _blurred_b64(image_bytes: bytes, radius: float) -> str:
+        pil_img = Image.open(io.BytesIO(image_bytes)).convert("RGB").filter(ImageFilter.GaussianBlur(radius))
+        png_buffer = io.BytesIO()
+        pil_img.save(png_buffer, format="PNG")
+        return base64.b64encode(png_buffer.getvalue()).decode("utf-8")
+
+    async def edit(self, api_args: Dict[str, Any], on_partial: Optional[PartialImageCallback] = None) -> str:
+        self.calls += 1
+        image_bytes = self._first_input_bytes(api_args)
+        steps = self.partial_images if on_partial else 0
+        latency = self.latency.sample()
+        for index in range(steps):
+            await asyncio.sleep(latency / (steps + 1))
+            radius = 12 * (steps - index) / steps
+            await on_partial(await asyncio.to_thread(self._blurred_b64, image_bytes, radius), index)
+        await asyncio.sleep(latency / (steps + 1))
+        return base64.b64encode(image_bytes).decode("utf-8")
+
+def image_request_key(api_args: Dict[str, Any]) -> str:
+    """Cassette key of an edit: every argument, with input images by content digest."""
+    images = api_args["image"] if isinstance(api_args["image"], list) else [api_args["image"]]
+    params = {k: v for k, v in api_args.items() if k != "image"}
+    return request_key(params, [[mime, hashlib.sha256(buffer.getvalue()).hexdigest()] for _, buffer, mime in images])
+
+class RecordingImageBackend(ImageBackend):
+    """Passes edits to `inner` and saves each result, its previews and their timing to the cassette."""
+
+    def __init__(self, inner: ImageBackend, cassette: Cassette):
+        self.inner = inner
+        self.cassette = cassette
+
+    async def edit(self, api_args: Dict[str, Any], on_partial: Optional[PartialImageCallback] = None) -> str:
+        started = time.monotonic()
+        partials = []
+
+        async def capture_partial(partial_b64: str, index: int):
+            offset = time.monotonic() - started
+            digest = await asyncio.to_thread(lambda: self.cassette.write_blob(base64.b64decode(partial_b64)))
+            partials.append([round(offset, 4), index, digest])
+            await on_partial(partial_b64, index)
+
+        final_b64 = await self.inner.edit(api_args, capture_partial if on_partial else None)
+        seconds = time.monotonic() - started
+        digest = await asyncio.to_thread(lambda: self.cassette.write_blob(base64.b64decode(final_b64)))
+        entry = {
+            "kind": "image",
+            "key": image_request_key(api_args),
+            "prompt": api_args.get("prompt"),
+            "image": digest,
+            "partials": partials,
+            "seconds": round(seconds, 4),
+        }
+        await asyncio.to_thread(self.cassette.record, entry)
+        return final_b64
+
+class ReplayImageBackend(ImageBackend):
+    """Answers edits from the cassette, replaying recorded previews and timing. No network."""
+
+    def __init__(self, cassette: Cassette):
+        self.cassette = cassette
+
+    async def _b64_blob(self, digest: str) -> str:
+        return await asyncio.to_thread(lambda: base64.b64encode(self.cassette.read_blob(digest)).decode("utf-8"))
+
+    async def edit(self, api_args: Dict[str, Any], on_partial: Optional[PartialImageCallback] = None) -> str:
+        started = time.monotonic()
+        entry = self.cassette.find("image", image_request_key(api_args))
+        if entry is None:
+            raise LookupError("Image edit not found in the provider cassette")
+        for offset, index, digest in entry["partials"]:
+            await self.cassette.wait_until(started, offset)
+            if on_partial is not None:
+                await on_partial(await self._b64_blob(digest), index)
+        final_b64 = await self._b64_blob(entry["image"])
+        await self.cassette.wait_until(started, entry["seconds"])
+        return final_b64
+
+def create_image_backend(name: str = IMAGE_BACKEND, mode: str = PROVIDER_MODE) -> ImageBackend:
+    if mode == "replay":
+        return ReplayImageBackend(cassette)
+    if name == "openai":
+        backend = OpenAIImageBackend(IMAGE_PARTIAL_IMAGES)
+    elif name == "fake":
+        backend = FakeStreamingImageBackend(LatencyDistribution.parse(FAKE_IMAGE_LATENCY_SECONDS), IMAGE_PARTIAL_IMAGES)
+    else:
+        raise ValueError(f"Unknown IMAGE_BACKEND: {name}")
+    if mode == "record":
+        return RecordingImageBackend(backend, cassette)
+    if mode != "live":
+        raise ValueError(f"Unknown PROVIDER_MODE: {mode}")
+    return backend
+
+# Shared by both image calls in openai_service.
+image_backend = create_image_backend()
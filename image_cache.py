@@ -0,0 +1,247 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Iterable, Optional
+
+from config import (
+    THEME_IMAGE_CACHE_DIR,
+    THEME_IMAGE_CACHE_TTL_SECONDS,
+    IMAGE_RESPONSE_CACHE_DIR,
+    IMAGE_RESPONSE_CACHE_MAX_BYTES,
+)
+from image_store import image_store
+
+class ThemeImageCache:
+    """Single-flight, persistent cache for generated images whose inputs are the same for every session.
+
+    Concurrent requests for the same key share one in-flight generation. Results are
+    kept in image_store; a small JSON index entry per key (under `index_dir`) records
+    which file it is and when it was made, so the cache survives restarts and is
+    shared by every worker on the host. Entries older than `ttl_seconds` are regenerated;
+    a TTL of 0 keeps nothing on disk (requests are still coalesced).
+    """
+
+    def __init__(self, index_dir: str, ttl_seconds: float):
+        self.index_dir = index_dir
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(self.index_dir, exist_ok=True)
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key_for(prompt: str, style_guide: str, input_image: bytes) -> str:
+        material = json.dumps([prompt, style_guide, hashlib.sha256(input_image).hexdigest()])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _index_path(self, key: str) -> str:
+        return os.path.join(self.index_dir, f"{key}.json")
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Returns the image_store filename for a fresh entry, or None."""
+        if self.ttl_seconds <= 0:
+            return None
+        try:
+            with open(self._index_path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry.get("created_at", 0) > self.ttl_seconds:
+            return None
+        filename = entry.get("filename", "")
+        return filename if image_store.path_for(filename) else None
+
+    def _record(self, key: str, filename: str):
+        if self.ttl_seconds <= 0:
+            return
+        path = self._index_path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp" # Unique per writer: sessions in several threads may record at once
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"filename": filename, "created_at": time.time()}, f)
+        os.replace(tmp_path, path)
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """Drops one entry (or all of them). Returns how many were removed."""
+        names = [f"{key}.json"] if key else [n for n in os.listdir(self.index_dir) if n.endswith(".json")]
+        removed = 0
+        for name in names:
+            try:
+                os.remove(os.path.join(self.index_dir, name))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def get_or_create(self, key: str, produce: Callable[[], Awaitable[str]], refresh: bool = False) -> str:
+        """Returns the cached filename for key, or runs produce() once for all concurrent callers.
+
+        produce() must store the image in image_store and return its filename.
+        """
+        if not refresh:
+            filename = await asyncio.to_thread(self.lookup, key)
+            if filename:
+                self.hits += 1
+                return filename
+        flight = self._in_flight.get(key)
+        if flight is None:
+            self.misses += 1
+            flight = asyncio.ensure_future(self._produce(key, produce))
+            self._in_flight[key] = flight
+            flight.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.coalesced += 1
+        # Shielded: one caller going away must not cancel the generation the others are waiting on.
+        return await asyncio.shield(flight)
+
+    async def _produce(self, key: str, produce: Callable[[], Awaitable[str]]) -> str:
+        filename = await produce()
+        await asyncio.to_thread(self._record, key, filename)
+        return filename
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "coalesced": self.coalesced, "in_flight": len(self._in_flight)}
+
+class ImageResponseCache:
+    """On-disk LRU cache of image API results, bounded by total bytes.
+
+    Keyed on a canonical digest of the request: prompt, parameters and the bytes and
+    MIME type of every input image, in order. Results are stored decoded (one PNG per
+    key); file mtimes carry the recency order across restarts. Each worker keeps its
+    own index, so a file evicted by another worker simply reads as a miss.
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        os.makedirs(self.root_dir, exist_ok=True)
+        self._entries: OrderedDict[str, int] = OrderedDict() # key -> size, least recently used first
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock() # Disk work runs in worker threads; guards the index
+        self._load_index()
+
+    def _load_index(self):
+        found = []
+        for name in os.listdir(self.root_dir):
+            if not name.endswith(".png"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.root_dir, name))
+            except FileNotFoundError:
+                continue
+            found.append((st.st_mtime, name[:-4], st.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self.total_bytes += size
+
+    @staticmethod
+    def key_for(prompt: str, params: dict, images: Iterable[tuple[bytes, str]]) -> str:
+        """Canonical digest of an image request. `images` is (bytes, mime) per input, in order."""
+        material = json.dumps(
+            {
+                "prompt": prompt,
+                "params": params,
+                "images": [[mime, hashlib.sha256(data).hexdigest()] for data, mime in images],
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, f"{key}.png")
+
+    def _forget(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self.total_bytes -= size
+
+    def _get_sync(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path) # Persist recency for the next restart's index
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return data
+
+    def _put_sync(self, key: str, data: bytes):
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp" # Unique per writer: the same response may be stored from two threads
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        evicted = []
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = len(data)
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+                oldest, _ = next(iter(self._entries.items()))
+                self._forget(oldest)
+                self.evictions += 1
+                evicted.append(oldest)
+        for oldest in evicted:
+            try:
+                os.remove(self._path(oldest))
+            except FileNotFoundError:
+                pass
+
+    async def get_b64(self, key: str) -> Optional[str]:
+        data = await asyncio.to_thread(self._get_sync, key)
+        if data is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return base64.b64encode(data).decode("utf-8")
+
+    async def put_b64(self, key: str, image_b64: str):
+        await asyncio.to_thread(self._put_sync, key, base64.b64decode(image_b64))
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+        }
+
+# Shared by every RPGSession in the process.
+theme_image_cache = ThemeImageCache(THEME_IMAGE_CACHE_DIR, THEME_IMAGE_CACHE_TTL_SECONDS)
+
+# Shared by both image calls in openai_service.
+image_response_cache = ImageResponseCache(IMAGE_RESPONSE_CACHE_DIR, IMAGE_RESPONSE_CACHE_MAX_BYTES)
+
+if __name__ == "__main__":
+    # python image_cache.py clear    -> forget cached theme images (next session regenerates)
+    # python image_cache.py refresh  -> regenerate the theme-selection image now
+    command = sys.argv[1] if len(sys.argv) > 1 else ""
+    if command == "clear":
+        print(f"Removed {theme_image_cache.invalidate()} cached theme image(s).")
+    elif command == "refresh":
+        from rpg_session import refresh_initial_theme_image # Imported here: rpg_session imports this module
+        print(f"Theme image refreshed: {asyncio.run(refresh_initial_theme_image())}")
+    else:
+        print("Usage: python image_cache.py [clear|refresh]")
+        sys.exit(2)
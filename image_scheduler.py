@@ -0,0 +1,156 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Awaitable, Callable, TypeVar
+
+from config import IMAGE_MAX_CONCURRENCY, IMAGE_RATE_LIMIT_PER_MINUTE, IMAGE_RATE_BURST
+
+T = TypeVar("T")
+
+class ImagePriority(IntEnum):
+    """Lower value is served first."""
+    SCENE = 0        # The scene for the turn the player is looking at
+    THEME = 1        # Theme-selection screen image
+    SPECULATIVE = 2  # Work that may be thrown away
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def seconds_until_token(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+class _Job:
+    __slots__ = ("session_id", "priority", "future", "enqueued_at")
+
+    def __init__(self, session_id: str, priority: ImagePriority):
+        self.session_id = session_id
+        self.priority = priority
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+class ImageJobScheduler:
+    """Admits image-generation calls from every session in the process.
+
+    - at most `max_concurrency` calls run at once;
+    - starts are paced by a token bucket matching the provider's images-per-minute limit (0 = unpaced);
+    - higher-priority work always goes first;
+    - within a priority, sessions take turns (round robin), so one busy session can't starve others.
+    """
+
+    def __init__(self, max_concurrency: int, rate_per_minute: float, burst: int):
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst) if rate_per_minute > 0 else None # 0 = no rate limit
+        self.running = 0
+        # priority -> OrderedDict(session_id -> deque[_Job]); dict order is the round-robin order
+        self._queues: dict[ImagePriority, OrderedDict[str, deque[_Job]]] = {p: OrderedDict() for p in ImagePriority}
+        self._wakeup: asyncio.TimerHandle | None = None
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+
+    async def run(self, session_id: str, priority: ImagePriority, job: Callable[[], Awaitable[T]]) -> T:
+        """Waits for a slot, runs job(), and releases the slot. Cancelling while queued leaves the queue."""
+        entry = _Job(session_id, priority)
+        self._queues[priority].setdefault(session_id, deque()).append(entry)
+        self._dispatch()
+        try:
+            await entry.future
+        except asyncio.CancelledError:
+            if entry.future.done() and not entry.future.cancelled():
+                self._release() # Granted a slot just as we were cancelled
+            else:
+                self._remove(entry)
+            raise
+        self.total_wait_seconds += time.monotonic() - entry.enqueued_at
+        try:
+            return await job()
+        finally:
+            self.completed += 1
+            self._release()
+
+    def _release(self):
+        self.running -= 1
+        self._dispatch()
+
+    def _remove(self, entry: _Job):
+        sessions = self._queues[entry.priority]
+        session_queue = sessions.get(entry.session_id)
+        if session_queue and entry in session_queue:
+            session_queue.remove(entry)
+            if not session_queue:
+                del sessions[entry.session_id]
+
+    def _next_job(self) -> _Job | None:
+        for priority in ImagePriority:
+            sessions = self._queues[priority]
+            if not sessions:
+                continue
+            session_id, session_queue = next(iter(sessions.items()))
+            entry = session_queue.popleft()
+            del sessions[session_id]
+            if session_queue:
+                sessions[session_id] = session_queue # Re-append: this session goes to the back of the line
+            return entry
+        return None
+
+    def _dispatch(self):
+        while self.running < self.max_concurrency and self.queued() > 0:
+            if self.bucket is not None and not self.bucket.try_take():
+                self._schedule_wakeup(self.bucket.seconds_until_token())
+                return
+            entry = self._next_job()
+            if entry.future.done():
+                if self.bucket is not None:
+                    self.bucket.tokens += 1 # Cancelled while queued; give the token back
+                continue
+            self.running += 1
+            entry.future.set_result(None)
+
+    def _schedule_wakeup(self, delay: float):
+        if self._wakeup is not None and not self._wakeup.cancelled():
+            return
+        def wake():
+            self._wakeup = None
+            self._dispatch()
+        self._wakeup = asyncio.get_running_loop().call_later(delay, wake)
+
+    def queued(self) -> int:
+        return sum(len(q) for sessions in self._queues.values() for q in sessions.values())
+
+    def stats(self) -> dict:
+        by_session: dict[str, int] = {}
+        for sessions in self._queues.values():
+            for session_id, session_queue in sessions.items():
+                by_session[session_id] = by_session.get(session_id, 0) + len(session_queue)
+        return {
+            "running": self.running,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued(),
+            "queued_by_priority": {p.name.lower(): sum(len(q) for q in self._queues[p].values()) for p in ImagePriority},
+            "queued_by_session": by_session,
+            "tokens_available": round(self.bucket.tokens, 2) if self.bucket is not None else None,
+            "completed": self.completed,
+            "avg_wait_seconds": round(self.total_wait_seconds / self.completed, 3) if self.completed else 0.0,
+        }
+
+# Shared by every RPGSession in the process.
+image_scheduler = ImageJobScheduler(IMAGE_MAX_CONCURRENCY, IMAGE_RATE_LIMIT_PER_MINUTE, IMAGE_RATE_BURST)
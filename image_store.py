@@ -0,0 +1,71 @@
+import hashlib
+import os
+import re
+import uuid
+
+from config import IMAGE_STORE_DIR
+
+MEDIA_URL_PREFIX = "/media"
+
+_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+_MIME_TYPES = {ext: mime for mime, ext in _EXTENSIONS.items()}
+_FILENAME_RE = re.compile(r"^[0-9a-f]{64}\.(png|jpg|webp)$")
+
+class ImageStore:
+    """Content-addressed, write-once image store on the local filesystem.
+
+    Files are named by the SHA-256 of their bytes, so a name never changes meaning
+    and can be served with a strong ETag and an immutable cache policy.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def put(self, image_bytes: bytes, mime: str = "image/png") -> str:
+        """Stores image_bytes (if not already present) and returns its filename."""
+        ext = _EXTENSIONS.get(mime, "png")
+        filename = f"{hashlib.sha256(image_bytes).hexdigest()}.{ext}"
+        final_path = os.path.join(self.root_dir, filename)
+        try:
+            os.utime(final_path) # Already stored (e.g. the shared theme image): restart its retention period
+        except FileNotFoundError:
+            tmp_path = f"{final_path}.{uuid.uuid4().hex}.tmp" # Unique per writer: threads of one process may store the same image at once
+            with open(tmp_path, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, final_path) # Atomic, so readers never see a partial file
+        return filename
+
+    def purge(self, older_than: float) -> int:
+        """Deletes images last written or reused before the `older_than` timestamp. Returns how many."""
+        removed = 0
+        for entry in os.scandir(self.root_dir):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < older_than:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass # Removed by another worker's sweep
+        return removed
+
+    def path_for(self, filename: str) -> str | None:
+        """Returns the on-disk path for a stored filename, or None if invalid or missing."""
+        if not _FILENAME_RE.match(filename):
+            return None
+        path = os.path.join(self.root_dir, filename)
+        return path if os.path.isfile(path) else None
+
+    @staticmethod
+    def etag_for(filename: str) -> str:
+        return f'"{filename.split(".", 1)[0]}"'
+
+    @staticmethod
+    def mime_for(filename: str) -> str:
+        return _MIME_TYPES.get(filename.rsplit(".", 1)[-1], "application/octet-stream")
+
+    @staticmethod
+    def url_for(filename: str) -> str:
+        return f"{MEDIA_URL_PREFIX}/{filename}"
+
+# Shared by every RPGSession in the process; the /media route in app.py serves from it.
+image_store = ImageStore(IMAGE_STORE_DIR)
@@ -1,13 +1,29 @@
 import base64
+import hashlib
 import io
 import os
-from PIL import Image
+from PIL import Image, ImageChops
+
+from config import (
+    UPLOAD_REDUCTION_ENABLED,
+    UPLOAD_MAX_SIDE,
+    UPLOAD_PALETTE_COLORS,
+    UPLOAD_OPTIMIZE_PNG,
+    UPLOAD_STRIP_ALPHA,
+    PIXEL_GRID_ENABLED,
+    PIXEL_GRID_SIZE,
+    PIXEL_GRID_PALETTE_COLORS,
+)
+from app_logging import get_logger
+from image_workers import image_workers
+
+logger = get_logger("image_utils")
 
 def load_image_from_path(file_path: str) -> tuple[bytes | None, str | None]:
     """Loads an image from a file path, converts to RGBA PNG, and returns bytes and MIME type."""
     try:
         if not os.path.isfile(file_path):
-            print(f"[Image Utils] File not found at path: {file_path}")
+            logger.warning("File not found at path: %s", file_path)
             return None, None
         
         with open(file_path, "rb") as f:
@@ -20,7 +36,7 @@ def load_image_from_path(file_path: str) -> tuple[bytes | None, str | None]:
         pil_img.close()
         return png_buffer.getvalue(), "image/png"
     except Exception as e:
-        print(f"[Image Utils] Error loading image from path '{file_path}': {e}")
+        logger.error("Error loading image from path '%s': %s", file_path, e)
         return None, None
 
 def process_base64_image(base64_image_str: str) -> tuple[bytes | None, str | None]:
@@ -39,13 +55,360 @@ def process_base64_image(base64_image_str: str) -> tuple[bytes | None, str | Non
         pil_img.close()
         return png_buffer.getvalue(), "image/png"
     except Exception as e:
-        print(f"[Image Utils] Error processing base64 image: {e}")
+        logger.error("Error processing base64 image: %s", e)
         return None, None
 
-def get_placeholder_image_data(placeholder_path: str = "images/aurora_first_image.png") -> tuple[bytes | None, str | None, str | None]:
-    """Loads, processes, and base64 encodes a placeholder image."""
-    img_bytes, img_mime = load_image_from_path(placeholder_path)
+PLACEHOLDER_IMAGE_PATH = "images/aurora_first_image.png"
+
+def get_placeholder_image_data(placeholder_path: str = PLACEHOLDER_IMAGE_PATH) -> tuple[bytes | None, str | None, str | None]:
+    """Loads (from the sprite registry, so normally preloaded), and base64 encodes a placeholder image."""
+    img_bytes, img_mime = sprite_registry.get(placeholder_path)
     if img_bytes and img_mime:
         base64_encoded_img = base64.b64encode(img_bytes).decode("utf-8")
         return img_bytes, img_mime, base64_encoded_img
-    return None, None, None 
\ No newline at end of file
+    return None, None, None 
+
+def make_preview(image_bytes: bytes, max_side: int = 256) -> tuple[bytes, str]:
+    """Shrinks a partial image into a small JPEG for progressive display."""
+    pil_img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    pil_img.thumbnail((max_side, max_side), Image.NEAREST)
+    jpeg_buffer = io.BytesIO()
+    pil_img.save(jpeg_buffer, format="JPEG", quality=70)
+    pil_img.close()
+    return jpeg_buffer.getvalue(), "image/jpeg"
+
+# Entry points for image_workers: module-level so worker processes can import them by name.
+# Base64 payloads are passed as ASCII bytes, which cross to workers as one buffer.
+
+def decode_image_b64(image_b64: bytes) -> bytes:
+    return base64.b64decode(image_b64)
+
+def make_preview_from_b64(partial_b64: bytes) -> tuple[bytes, str]:
+    return make_preview(base64.b64decode(partial_b64))
+
+def reduce_upload_image(image_bytes: bytes) -> bytes:
+    return upload_reducer._reduce(image_bytes)
+
+def normalize_pixel_grid(image_bytes: bytes) -> bytes | None:
+    return pixel_grid_normalizer._normalize(image_bytes)
+
+class SpriteRegistry:
+    """Process-wide cache of character sprites, normalized once to RGBA PNG.
+
+    Entries are keyed by the SHA-256 of the file contents, so identical sprites
+    stored under different paths share one normalized buffer. Each path remembers
+    the (mtime, size) it was loaded with and is reloaded when the file changes.
+    """
+
+    def __init__(self):
+        self._by_digest: dict[str, bytes] = {}
+        self._paths: dict[str, tuple[int, int, str]] = {} # path -> (mtime_ns, size, digest)
+
+    def preload(self, file_paths) -> int:
+        """Normalizes every sprite in file_paths. Returns how many were loaded."""
+        loaded = 0
+        for file_path in file_paths:
+            sprite_bytes, _ = self.get(file_path)
+            if sprite_bytes:
+                loaded += 1
+        logger.info("Sprite registry preloaded %s sprite(s), %s unique.", loaded, len(self._by_digest))
+        return loaded
+
+    def get(self, file_path: str) -> tuple[bytes | None, str | None]:
+        """Returns the normalized PNG bytes and MIME type for a sprite path.
+
+        The returned bytes object is shared, not copied; callers must not rely on
+        mutating it (bytes are immutable anyway).
+        """
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            logger.warning("File not found at path: %s", file_path)
+            self._paths.pop(file_path, None)
+            return None, None
+
+        entry = self._paths.get(file_path)
+        if entry and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+            cached = self._by_digest.get(entry[2])
+            if cached is not None:
+                return cached, "image/png"
+
+        return self._load(file_path, stat)
+
+    def _load(self, file_path: str, stat: os.stat_result) -> tuple[bytes | None, str | None]:
+        try:
+            with open(file_path, "rb") as f:
+                raw_bytes = f.read()
+        except OSError as e:
+            logger.error("Error reading sprite '%s': %s", file_path, e)
+            return None, None
+
+        digest = hashlib.sha256(raw_bytes).hexdigest()
+        previous = self._paths.get(file_path)
+        normalized = self._by_digest.get(digest)
+        if normalized is None:
+            try:
+                pil_img = Image.open(io.BytesIO(raw_bytes))
+                pil_img = pil_img.convert("RGBA")
+                png_buffer = io.BytesIO()
+                pil_img.save(png_buffer, format="PNG")
+                pil_img.close()
+            except Exception as e:
+                logger.error("Error normalizing sprite '%s': %s", file_path, e)
+                return None, None
+            normalized = png_buffer.getvalue()
+            self._by_digest[digest] = normalized
+
+        self._paths[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+        if previous and previous[2] != digest:
+            logger.info("Sprite '%s' changed on disk; cache entry refreshed.", file_path)
+            self._drop_unreferenced(previous[2])
+        return normalized, "image/png"
+
+    def _drop_unreferenced(self, digest: str):
+        if not any(entry[2] == digest for entry in self._paths.values()):
+            self._by_digest.pop(digest, None)
+
+    def stats(self) -> dict:
+        return {
+            "paths": len(self._paths),
+            "unique_sprites": len(self._by_digest),
+            "bytes": sum(len(b) for b in self._by_digest.values()),
+        }
+
+class UploadReducer:
+    """Shrinks reference images before they are uploaded to the image API.
+
+    Steps, each configurable:
+    - downscale so the longest side is at most `max_side` (nearest neighbour, keeps pixel art crisp);
+    - drop the alpha channel when every pixel is fully opaque (never when there is real transparency);
+    - quantize to `palette_colors` colours (paletted PNG);
+    - encode with PNG `optimize` at the highest compression level.
+    A PNG that none of the first three steps changes is returned as-is without
+    re-encoding, unless `optimize` is set. The original bytes are kept if the result
+    isn't smaller. Results are memoized by input digest, so sprites sent every turn
+    are only reduced once.
+    """
+
+    def __init__(self, enabled: bool, max_side: int, palette_colors: int, optimize: bool, strip_alpha: bool, memo_size: int = 32):
+        self.enabled = enabled
+        self.max_side = max_side
+        self.palette_colors = palette_colors
+        self.optimize = optimize
+        self.strip_alpha = strip_alpha
+        self.memo_size = memo_size
+        self._memo: dict[str, bytes] = {}
+        self.images = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    def reduce(self, image_bytes: bytes) -> bytes:
+        """Returns smaller PNG bytes, or image_bytes itself (in its own format) if reducing doesn't help. Safe to call from a worker thread."""
+        if not self.enabled:
+            return image_bytes
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        reduced = self._memo.get(digest)
+        if reduced is None:
+            try:
+                reduced = self._reduce(image_bytes)
+            except Exception as e:
+                logger.warning("Upload reduction failed, sending original: %s", e)
+                reduced = image_bytes
+            self._remember(digest, reduced)
+        return self._count(image_bytes, reduced)
+
+    async def reduce_async(self, image_bytes: bytes) -> bytes:
+        """reduce() with the pixel work on image_workers; the memo and stats stay in this process."""
+        if not self.enabled:
+            return image_bytes
+        digest = hashlib.sha256(image_bytes).hexdigest()
+        reduced = self._memo.get(digest)
+        if reduced is None:
+            try:
+                reduced = await image_workers.run("upload_reduce", reduce_upload_image, image_bytes)
+            except Exception as e:
+                logger.warning("Upload reduction failed, sending original: %s", e)
+                reduced = image_bytes
+            self._remember(digest, reduced)
+        return self._count(image_bytes, reduced)
+
+    def _remember(self, digest: str, reduced: bytes):
+        if len(self._memo) >= self.memo_size:
+            self._memo.pop(next(iter(self._memo)))
+        self._memo[digest] = reduced
+
+    def _count(self, image_bytes: bytes, reduced: bytes) -> bytes:
+        self.images += 1
+        self.bytes_before += len(image_bytes)
+        self.bytes_after += len(reduced)
+        return reduced
+
+    def _reduce(self, image_bytes: bytes) -> bytes:
+        pil_img = Image.open(io.BytesIO(image_bytes))
+        is_png = pil_img.format == "PNG"
+        has_alpha = pil_img.mode in ("RGBA", "LA", "PA") or "transparency" in pil_img.info
+        downscale = bool(self.max_side) and max(pil_img.size) > self.max_side
+        if is_png and not (downscale or self.palette_colors or self.optimize or (self.strip_alpha and has_alpha)):
+            pil_img.close()
+            return image_bytes # Nothing would change but the encoding
+        changed = not is_png or downscale or bool(self.palette_colors)
+        pil_img = pil_img.convert("RGBA")
+        if downscale:
+            scale = self.max_side / max(pil_img.size)
+            new_size = (max(1, round(pil_img.width * scale)), max(1, round(pil_img.height * scale)))
+            pil_img = pil_img.resize(new_size, Image.NEAREST)
+        if self.strip_alpha and pil_img.getchannel("A").getextrema()[0] == 255:
+            pil_img = pil_img.convert("RGB")
+            changed = changed or has_alpha
+        if self.palette_colors:
+            pil_img = pil_img.quantize(colors=self.palette_colors, method=Image.Quantize.FASTOCTREE)
+        if not changed and not self.optimize:
+            pil_img.close()
+            return image_bytes # Transparency is real, so there was no alpha to strip
+        png_buffer = io.BytesIO()
+        pil_img.save(png_buffer, format="PNG", optimize=self.optimize, compress_level=9)
+        pil_img.close()
+        reduced = png_buffer.getvalue()
+        return reduced if len(reduced) < len(image_bytes) else image_bytes
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "images": self.images,
+            "bytes_before": self.bytes_before,
+            "bytes_after": self.bytes_after,
+            "saved_ratio": round(1 - self.bytes_after / self.bytes_before, 3) if self.bytes_before else 0.0,
+        }
+
+class PixelGridNormalizer:
+    """Turns upscaled "pixel art" output back into one pixel per logical pixel.
+
+    The grid is either fixed (`grid_size`) or detected: for each candidate cell size k,
+    the mean colour change across every k-th column/row boundary (at the best phase) is
+    compared with the mean change across all boundaries. Real cell edges stand out by
+    `min_score` times or more; the smallest k close to the best score wins, so multiples
+    of the true grid aren't picked. The image is then sampled once per cell (nearest
+    neighbour) and quantized to `palette_colors`. Images with no clear grid pass through.
+    Clients scale the result back up with `image-rendering: pixelated`.
+    """
+
+    def __init__(self, enabled: bool, grid_size: int, palette_colors: int, max_grid: int = 32, min_score: float = 3.0):
+        self.enabled = enabled
+        self.grid_size = grid_size # 0 = detect
+        self.palette_colors = palette_colors
+        self.max_grid = max_grid
+        self.min_score = min_score
+        self.images = 0
+        self.normalized = 0
+        self.bytes_before = 0
+        self.bytes_after = 0
+
+    @staticmethod
+    def _boundary_profile(gray: Image.Image, horizontal: bool) -> bytes:
+        """Mean absolute change across each column (or row) boundary, one byte per boundary."""
+        w, h = gray.size
+        if horizontal:
+            diff = ImageChops.difference(gray.crop((1, 0, w, h)), gray.crop((0, 0, w - 1, h)))
+            return diff.resize((w - 1, 1), Image.BOX).tobytes()
+        diff = ImageChops.difference(gray.crop((0, 1, w, h)), gray.crop((0, 0, w, h - 1)))
+        return diff.resize((1, h - 1), Image.BOX).tobytes()
+
+    @staticmethod
+    def _phase_score(profile: bytes, k: int) -> tuple[float, int]:
+        mean_all = (sum(profile) / len(profile)) or 1e-9
+        return max((sum(profile[o::k]) / len(profile[o::k]) / mean_all, o) for o in range(k))
+
+    def detect_grid(self, pil_img: Image.Image) -> tuple[int, int, int] | None:
+        """Returns (cell size, x offset, y offset) of the pixel grid, or None if there isn't a clear one."""
+        gray = pil_img.convert("L")
+        if min(gray.size) < 2 * self.max_grid:
+            return None
+        col_profile = self._boundary_profile(gray, True)
+        row_profile = self._boundary_profile(gray, False)
+        scores = {}
+        for k in range(2, self.max_grid + 1):
+            col_score, col_phase = self._phase_score(col_profile, k)
+            row_score, row_phase = self._phase_score(row_profile, k)
+            # A boundary after pixel i means the next cell starts at i + 1.
+            scores[k] = ((col_score + row_score) / 2, (col_phase + 1) % k, (row_phase + 1) % k)
+        best_score = max(score for score, _, _ in scores.values())
+        if best_score < self.min_score:
+            return None
+        for k, (score, x_offset, y_offset) in scores.items():
+            if score >= 0.9 * best_score:
+                return k, x_offset, y_offset
+        return None
+
+    def normalize(self, image_bytes: bytes) -> bytes:
+        """Returns the compact PNG, or image_bytes unchanged if there is no grid to collapse."""
+        result = None
+        if self.enabled:
+            try:
+                result = self._normalize(image_bytes)
+            except Exception as e:
+                logger.warning("Pixel-grid normalization failed, keeping original: %s", e)
+        return self._count(image_bytes, result)
+
+    async def normalize_async(self, image_bytes: bytes) -> bytes:
+        """normalize() with the pixel work on image_workers; stats stay in this process."""
+        result = None
+        if self.enabled:
+            try:
+                result = await image_workers.run("pixel_grid", normalize_pixel_grid, image_bytes)
+            except Exception as e:
+                logger.warning("Pixel-grid normalization failed, keeping original: %s", e)
+        return self._count(image_bytes, result)
+
+    def _count(self, image_bytes: bytes, result: bytes | None) -> bytes:
+        self.images += 1
+        self.bytes_before += len(image_bytes)
+        if result:
+            self.normalized += 1
+        else:
+            result = image_bytes
+        self.bytes_after += len(result)
+        return result
+
+    def _normalize(self, image_bytes: bytes) -> bytes | None:
+        pil_img = Image.open(io.BytesIO(image_bytes))
+        pil_img.load()
+        if self.grid_size > 1:
+            grid = (self.grid_size, 0, 0)
+        else:
+            grid = self.detect_grid(pil_img)
+        if grid is None:
+            return None
+        cell, x_offset, y_offset = grid
+        cols = (pil_img.width - x_offset) // cell
+        rows = (pil_img.height - y_offset) // cell
+        if cols < 1 or rows < 1:
+            return None
+        box = (x_offset, y_offset, x_offset + cols * cell, y_offset + rows * cell)
+        compact = pil_img.convert("RGBA").resize((cols, rows), Image.NEAREST, box=box)
+        if compact.getchannel("A").getextrema()[0] == 255:
+            compact = compact.convert("RGB")
+        if self.palette_colors:
+            compact = compact.quantize(colors=self.palette_colors, method=Image.Quantize.FASTOCTREE)
+        png_buffer = io.BytesIO()
+        compact.save(png_buffer, format="PNG", optimize=True)
+        logger.info("Pixel grid %spx -> %sx%s, %s KiB -> %s KiB.", cell, cols, rows, len(image_bytes) // 1024, png_buffer.tell() // 1024)
+        return png_buffer.getvalue()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "grid_size": self.grid_size or "auto",
+            "images": self.images,
+            "normalized": self.normalized,
+            "bytes_before": self.bytes_before,
+            "bytes_after": self.bytes_after,
+        }
+
+# Shared by every RPGSession in the process.
+sprite_registry = SpriteRegistry()
+
+# Shared by every RPGSession in the process.
+upload_reducer = UploadReducer(UPLOAD_REDUCTION_ENABLED, UPLOAD_MAX_SIDE, UPLOAD_PALETTE_COLORS, UPLOAD_OPTIMIZE_PNG, UPLOAD_STRIP_ALPHA)
+
+# Shared by every RPGSession in the process.
+pixel_grid_normalizer = PixelGridNormalizer(PIXEL_GRID_ENABLED, PIXEL_GRID_SIZE, PIXEL_GRID_PALETTE_COLORS)
@@ -0,0 +1,219 @@
+import asyncio
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from config import IMAGE_WORKER_PROCESSES, IMAGE_WORKER_SHM_THRESHOLD
+from app_logging import get_logger, log_pipeline
+from metrics import IMAGE_WORK_QUEUE_SECONDS, IMAGE_WORK_SECONDS
+from tracing import span
+
+logger = get_logger("image_workers")
+
+T = TypeVar("T")
+
+class _SharedBytes:
+    """A bytes payload parked in a named shared-memory block; only the name crosses the pipe."""
+
+    __slots__ = ("name", "size")
+
+    def __init__(self, name: str, size: int):
+        self.name = name
+        self.size = size
+
+def _share(data: bytes) -> tuple[_SharedBytes, shared_memory.SharedMemory]:
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return _SharedBytes(block.name, len(data)), block
+
+def _take(handle: _SharedBytes, unlink: bool) -> bytes:
+    block = shared_memory.SharedMemory(name=handle.name)
+    try:
+        return bytes(block.buf[:handle.size])
+    finally:
+        block.close()
+        if unlink:
+            block.unlink()
+
+def _pack(value: Any, threshold: int) -> Any:
+    """Moves large bytes (alone or in a result tuple) into shared memory. The receiver unlinks them."""
+    if isinstance(value, bytes) and len(value) >= threshold:
+        handle, block = _share(value)
+        block.close()
+        return handle
+    if isinstance(value, tuple):
+        return tuple(_pack(item, threshold) for item in value)
+    return value
+
+def _unpack(value: Any) -> Any:
+    if isinstance(value, _SharedBytes):
+        return _take(value, unlink=True)
+    if isinstance(value, tuple):
+        return tuple(_unpack(item) for item in value)
+    return value
+
+def _init_worker():
+    signal.signal(signal.SIGINT, signal.SIG_IGN) # Ctrl-C is for the parent, which shuts the pool down
+    log_pipeline.configure()
+
+def _ready():
+    pass
+
+def _run_in_worker(func: Callable, args: tuple, submitted_at: float, threshold: Optional[int]):
+    """Worker side: returns (result, seconds queued, seconds running).
+
+    time.monotonic() is system-wide on the platforms we run on, so the parent's
+    submit time is comparable with the worker's start time.
+    """
+    started = time.monotonic()
+    args = tuple(_take(arg, unlink=False) if isinstance(arg, _SharedBytes) else arg for arg in args)
+    result = func(*args)
+    run_seconds = time.monotonic() - started
+    if threshold is not None:
+        result = _pack(result, threshold)
+    return result, started - submitted_at, run_seconds
+
+def _resolve(outcome: asyncio.Future, value: Any, error: Optional[BaseException]):
+    if outcome.done(): # The caller was cancelled; shared memory is already released
+        return
+    if error is not None:
+        outcome.set_exception(error)
+    else:
+        outcome.set_result(value)
+
+class ImageWorkerPool:
+    """Runs CPU-bound image work (PIL, base64) off the event loop, in worker processes.
+
+    Each call reports how long it waited for a free worker and how long it ran, as
+    metrics, as attributes of a `cpu.<task>` span and in stats(). With processes=0
+    the work runs in the default thread pool instead (no extra processes, but it
+    still contends for the GIL).
+    """
+
+    def __init__(self, processes: int, shm_threshold: int):
+        self.processes = processes
+        self.shm_threshold = shm_threshold
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.queue_wait_total = 0.0
+        self.queue_wait_max = 0.0
+        self.run_total = 0.0
+        self.shared_buffers = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # "spawn": forking a process that already runs an event loop and logging/trace threads isn't safe.
+            self._executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker)
+        return self._executor
+
+    def _reset_broken_pool(self):
+        if self._executor is not None:
+            logger.error("An image worker process died; starting a fresh pool on the next call.")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def start(self) -> int:
+        """Starts the workers now, so the first image doesn't wait for processes to spawn. Returns the worker count."""
+        if self.processes <= 0:
+            return 0
+        await asyncio.gather(*(self._run_in_process(_ready, (), time.monotonic()) for _ in range(self.processes)))
+        return self.processes
+
+    async def _run_in_process(self, func: Callable, args: tuple, submitted_at: float):
+        blocks = []
+        wire_args = []
+        for arg in args:
+            if isinstance(arg, bytes) and len(arg) >= self.shm_threshold:
+                handle, block = _share(arg)
+                blocks.append(block)
+                wire_args.append(handle)
+            else:
+                wire_args.append(arg)
+        self.shared_buffers += len(blocks)
+        loop = asyncio.get_running_loop()
+        outcome = loop.create_future()
+
+        def on_done(future):
+            # Runs on the executor's thread, also when the caller was cancelled: release every block.
+            for block in blocks:
+                block.close()
+                block.unlink()
+            try:
+                value, error = _unpack(future.result()), None
+            except BaseException as e:
+                value, error = None, e
+            try:
+                loop.call_soon_threadsafe(_resolve, outcome, value, error)
+            except RuntimeError:
+                pass # Loop already closed (shutdown)
+
+        try:
+            future = self._get_executor().submit(_run_in_worker, func, tuple(wire_args), submitted_at, self.shm_threshold)
+        except BaseException as e:
+            for block in blocks:
+                block.close()
+                block.unlink()
+            if isinstance(e, BrokenProcessPool):
+                self._reset_broken_pool()
+            raise
+        future.add_done_callback(on_done)
+        try:
+            return await outcome
+        except BrokenProcessPool:
+            self._reset_broken_pool()
+            raise
+
+    async def run(self, task: str, func: Callable[..., T], *args) -> T:
+        """Awaits func(*args) run in a worker. `func` must be a module-level function (workers import it by name)."""
+        submitted_at = time.monotonic()
+        self.submitted += 1
+        self.in_flight += 1
+        with span(f"cpu.{task}") as work_span:
+            try:
+                if self.processes > 0:
+                    result, queue_wait, run_seconds = await self._run_in_process(func, args, submitted_at)
+                else:
+                    result, queue_wait, run_seconds = await asyncio.to_thread(_run_in_worker, func, args, submitted_at, None)
+            except BaseException:
+                self.failed += 1
+                raise
+            finally:
+                self.in_flight -= 1
+            if work_span is not None:
+                work_span.attrs.update(queue_ms=round(queue_wait * 1000, 2), run_ms=round(run_seconds * 1000, 2))
+        self.completed += 1
+        self.queue_wait_total += queue_wait
+        self.queue_wait_max = max(self.queue_wait_max, queue_wait)
+        self.run_total += run_seconds
+        IMAGE_WORK_QUEUE_SECONDS.labels(task).observe(queue_wait)
+        IMAGE_WORK_SECONDS.labels(task).observe(run_seconds)
+        return result
+
+    def shutdown(self):
+        """Stops the workers once their current calls finish; queued calls are cancelled."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "processes": self.processes,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "in_flight": self.in_flight,
+            "avg_queue_wait_ms": round(1000 * self.queue_wait_total / self.completed, 2) if self.completed else 0.0,
+            "max_queue_wait_ms": round(1000 * self.queue_wait_max, 2),
+            "avg_run_ms": round(1000 * self.run_total / self.completed, 2) if self.completed else 0.0,
+            "shared_buffers": self.shared_buffers,
+        }
+
+# Shared by every session in the process; started by the app's warm-up.
+image_workers = ImageWorkerPool(IMAGE_WORKER_PROCESSES, IMAGE_WORKER_SHM_THRESHOLD)
@@ -0,0 +1,59 @@
+import math
+import random
+from typing import Optional
+
+# Latency distributions for the fake backends and the load-test harness, written as
+# "<kind>:<params>" so they fit in one environment variable or CLI flag:
+#   "3" or "fixed:3"            always 3s
+#   "uniform:1:5"               between 1s and 5s
+#   "normal:3:0.5"              mean 3s, stddev 0.5s (clamped at 0)
+#   "lognormal:3:0.4"           median 3s, sigma 0.4: the long right tail real providers have
+#   "exp:3"                     exponential with mean 3s
+#   "empirical:1.2,2.5,2.7,9"   one of the listed samples, e.g. from a production trace
+
+class LatencyDistribution:
+    def __init__(self, kind: str, params: tuple[float, ...], spec: str):
+        self.kind = kind
+        self.params = params
+        self.spec = spec
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDistribution":
+        kind, _, rest = spec.strip().partition(":")
+        if not rest:
+            kind, rest = "fixed", kind
+        try:
+            if kind == "empirical":
+                params = tuple(float(p) for p in rest.split(","))
+            else:
+                params = tuple(float(p) for p in rest.split(":"))
+        except ValueError:
+            raise ValueError(f"Bad latency distribution: {spec!r}") from None
+        arity = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exp": 1}
+        if kind == "empirical":
+            if not params:
+                raise ValueError(f"Bad latency distribution: {spec!r}")
+        elif arity.get(kind) != len(params):
+            raise ValueError(f"Bad latency distribution: {spec!r} (expected one of {', '.join(arity)}, empirical)")
+        return cls(kind, params, spec)
+
+    def sample(self, rng: Optional[random.Random] = None) -> float:
+        """One latency in seconds, never negative."""
+        rng = rng or random
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = rng.gauss(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(p[0]), p[1]) if p[0] > 0 else 0.0
+        elif self.kind == "exp":
+            value = rng.expovariate(1 / p[0]) if p[0] > 0 else 0.0
+        else:
+            value = rng.choice(p)
+        return max(0.0, value)
+
+    def __repr__(self) -> str:
+        return f"LatencyDistribution({self.spec!r})"
@@ -0,0 +1,409 @@
+"""Concurrent-player load test for the /ws/{session_id} game endpoint.
+
+Opens N WebSocket sessions, picks the theme, then plays random choices with think
+times between turns, and reports per-turn latencies, bytes and server memory:
+
+    python loadtest.py --spawn --sessions 50 --turns 6
+    python loadtest.py --url ws://localhost:8020 --server-pid 1234 --sessions 20
+
+--spawn starts app.py under uvicorn with the fake storyteller and image backends
+(AGENT_BACKEND=fake, IMAGE_BACKEND=fake), so a run needs no network or API key and
+the provider latencies are whatever FAKE_*_SECONDS distributions you set. The --max
+flags turn a run into a regression gate: the exit code is 1 if any limit is exceeded.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from typing import Any, Dict, List, Optional
+
+import websockets
+
+from latency_model import LatencyDistribution
+from ws_protocol import FRAME_IMAGE, decode_binary_frame
+
+DEFAULT_CAPS = "image_urls,binary_images,image_previews" # What the browser client advertises
+
+# Server environment for --spawn; anything already set in the caller's environment wins.
+SPAWN_ENV = {
+    "AGENT_BACKEND": "fake",
+    "IMAGE_BACKEND": "fake",
+    "OPENAI_API_KEY": "loadtest",
+    "SESSION_STORE_BACKEND": "memory",
+    "STREAM_NARRATION": "true",
+    "LOG_LEVEL": "WARNING",
+    "TRACE_FILE": "",
+}
+
+class TurnStats:
+    __slots__ = ("turn_id", "sent_at", "narration_at", "done_at", "image_at", "bytes", "error")
+
+    def __init__(self, turn_id: int, sent_at: float):
+        self.turn_id = turn_id
+        self.sent_at = sent_at
+        self.narration_at: Optional[float] = None # First "text" delta or the narration_block
+        self.done_at: Optional[float] = None # "choices" (or the final narration when the game ends)
+        self.image_at: Optional[float] = None # Final image received (and fetched, for URL images)
+        self.bytes = 0
+        self.error: Optional[str] = None
+
+class Player:
+    """One simulated browser: a WebSocket session playing random choices."""
+
+    def __init__(self, base_url: str, caps: str, turns: int, think: LatencyDistribution, image_timeout: float, rng: random.Random):
+        self.session_id = uuid.uuid4().hex
+        self.base_url = base_url.rstrip("/")
+        self.caps = caps
+        self.turns = turns
+        self.think = think
+        self.image_timeout = image_timeout
+        self.rng = rng
+        self.stats: Dict[int, TurnStats] = {}
+        self.errors: List[str] = []
+        self._choices: Optional[List[str]] = None
+        self._turn_done = asyncio.Event()
+        self._game_over = False
+        self._pending_fetches: set[asyncio.Task] = set()
+
+    def _http_url(self, path: str) -> str:
+        return self.base_url.replace("ws://", "http://", 1).replace("wss://", "https://", 1) + path
+
+    async def _fetch_image(self, turn: TurnStats, url: str):
+        def fetch() -> int:
+            with urllib.request.urlopen(self._http_url(url), timeout=30) as response:
+                return len(response.read())
+        try:
+            turn.bytes += await asyncio.to_thread(fetch)
+            turn.image_at = time.monotonic()
+        except Exception as e:
+            self.errors.append(f"image fetch: {e}")
+
+    def _on_message(self, message):
+        now = time.monotonic()
+        if isinstance(message, bytes):
+            frame_type, turn_id, _, _ = decode_binary_frame(message)
+            turn = self.stats.get(turn_id)
+            if turn is not None:
+                turn.bytes += len(message)
+                if frame_type == FRAME_IMAGE:
+                    turn.image_at = now
+            return
+        data = json.loads(message)
+        kind = data.get("type")
+        turn = self.stats.get(data.get("turn_id"))
+        if turn is not None:
+            turn.bytes += len(message)
+        if kind == "error":
+            self.errors.append(str(data.get("content")))
+            if turn is not None:
+                turn.error = str(data.get("content"))
+                self._turn_done.set()
+        elif kind == "game_end":
+            self._game_over = True
+            self._turn_done.set()
+        if turn is None:
+            if kind == "choices" and data.get("turn_id") == 0:
+                self._choices = data["content"] # Theme choices, before any turn we timed
+                self._turn_done.set()
+            return
+        if kind in ("text", "narration_block") and turn.narration_at is None:
+            turn.narration_at = now
+        if kind == "choices":
+            self._choices = data["content"]
+            turn.done_at = now
+            self._turn_done.set()
+        elif kind == "image":
+            if data.get("url"):
+                task = asyncio.create_task(self._fetch_image(turn, data["url"]))
+                self._pending_fetches.add(task)
+                task.add_done_callback(self._pending_fetches.discard)
+            else:
+                turn.image_at = now
+
+    async def _receive(self, ws):
+        async for message in ws:
+            self._on_message(message)
+        self._game_over = True
+        self._turn_done.set()
+
+    async def _wait_turn(self, turn: Optional[TurnStats], timeout: float):
+        try:
+            await asyncio.wait_for(self._turn_done.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.errors.append(f"turn {turn.turn_id if turn else 0} timed out")
+        if turn is not None and turn.done_at is None and turn.narration_at is not None and self._game_over:
+            turn.done_at = turn.narration_at # Final turn: no choices follow the narration
+
+    async def _wait_images(self):
+        deadline = time.monotonic() + self.image_timeout
+        while time.monotonic() < deadline:
+            if all(t.image_at is not None or t.error for t in self.stats.values()) and not self._pending_fetches:
+                return
+            await asyncio.sleep(0.05)
+
+    async def play(self, turn_timeout: float):
+        url = f"{self.base_url}/ws/{self.session_id}?caps={self.caps}"
+        async with websockets.connect(url, max_size=None) as ws:
+            receiver = asyncio.create_task(self._receive(ws))
+            try:
+                await self._wait_turn(None, turn_timeout)
+                turn_id = 0
+                for _ in range(self.turns):
+                    if self._game_over or not self._choices:
+                        break
+                    if turn_id > 0:
+                        await asyncio.sleep(self.think.sample(self.rng))
+                    turn_id += 1
+                    choice = self.rng.choice(self._choices)
+                    self._choices = None
+                    self._turn_done.clear()
+                    turn = self.stats[turn_id] = TurnStats(turn_id, time.monotonic())
+                    await ws.send(json.dumps({"choice": choice, "turn_id": turn_id}))
+                    await self._wait_turn(turn, turn_timeout)
+                    if turn.error:
+                        break
+                await self._wait_images()
+            finally:
+                receiver.cancel()
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None,
+    }
+
+class RssSampler:
+    """Samples a local server's resident memory from /proc, keeping the peak.
+
+    Counts the server process and all its descendants (image worker processes, uvicorn
+    workers), and keeps the descendants' share separately.
+    """
+
+    def __init__(self, pid: Optional[int]):
+        self.pid = pid
+        self.peak_kb = 0
+        self.peak_children_kb = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _process_kb(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    def _descendants(self) -> List[int]:
+        children: Dict[int, List[int]] = {}
+        for entry in os.listdir("/proc"):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1]) # The command name may contain spaces
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+        found, pending = [], list(children.get(self.pid, []))
+        while pending:
+            pid = pending.pop()
+            found.append(pid)
+            pending.extend(children.get(pid, []))
+        return found
+
+    def read(self) -> Optional[tuple[int, int]]:
+        """(server + descendants KB, descendants KB), or None without a readable server process."""
+        if self.pid is None:
+            return None
+        server_kb = self._process_kb(self.pid)
+        if not server_kb:
+            return None
+        children_kb = sum(self._process_kb(pid) for pid in self._descendants())
+        return server_kb + children_kb, children_kb
+
+    def read_kb(self) -> Optional[int]:
+        sample = self.read()
+        return sample[0] if sample else None
+
+    async def _run(self):
+        while True:
+            total_kb, children_kb = self.read() or (0, 0)
+            self.peak_kb = max(self.peak_kb, total_kb)
+            self.peak_children_kb = max(self.peak_children_kb, children_kb)
+            await asyncio.sleep(0.25)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+
+def build_report(players: List[Player], wall_seconds: float, rss_baseline_kb: Optional[int], rss_peak_kb: int, rss_peak_children_kb: int = 0) -> Dict[str, Any]:
+    turns = [t for p in players for t in p.stats.values()]
+    report = {
+        "sessions": len(players),
+        "turns": len(turns),
+        "errors": sum(len(p.errors) for p in players),
+        "wall_seconds": round(wall_seconds, 2),
+        "turn_latency": summarize([t.done_at - t.sent_at for t in turns if t.done_at]),
+        "time_to_narration": summarize([t.narration_at - t.sent_at for t in turns if t.narration_at]),
+        "time_to_image": summarize([t.image_at - t.sent_at for t in turns if t.image_at]),
+        "bytes_per_turn": summarize([float(t.bytes) for t in turns]),
+        "missing_images": sum(1 for t in turns if t.image_at is None and not t.error),
+        "sample_errors": [e for p in players for e in p.errors][:5],
+    }
+    if rss_baseline_kb is not None:
+        report["server_rss"] = {
+            "baseline_mb": round(rss_baseline_kb / 1024, 1),
+            "peak_mb": round(rss_peak_kb / 1024, 1),
+            "children_peak_mb": round(rss_peak_children_kb / 1024, 1),
+            "per_session_kb": round((rss_peak_kb - rss_baseline_kb) / max(1, len(players)), 1),
+        }
+    return report
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['sessions']} sessions, {report['turns']} turns, {report['errors']} errors in {report['wall_seconds']}s")
+    print(f"{'':<20}{'count':>7}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in ("turn_latency", "time_to_narration", "time_to_image", "bytes_per_turn"):
+        row = report[name]
+        fmt = (lambda v: "-" if v is None else f"{v:.0f}") if name == "bytes_per_turn" else (lambda v: "-" if v is None else f"{v:.3f}s")
+        print(f"{name:<20}{row['count']:>7}" + "".join(f"{fmt(row[k]):>10}" for k in ("p50", "p95", "p99", "max")))
+    if report["missing_images"]:
+        print(f"missing images: {report['missing_images']}")
+    if "server_rss" in report:
+        rss = report["server_rss"]
+        print(f"server RSS: {rss['baseline_mb']} MB -> peak {rss['peak_mb']} MB ({rss['per_session_kb']} KB/session; "
+              f"child processes peak {rss['children_peak_mb']} MB)")
+    for error in report["sample_errors"]:
+        print(f"error: {error}")
+
+def check_limits(report: Dict[str, Any], limits: List[str], max_errors: int) -> List[str]:
+    """Limits look like 'turn_latency.p95=6' or 'server_rss.per_session_kb=2048'."""
+    failures = []
+    if report["errors"] > max_errors:
+        failures.append(f"errors {report['errors']} > {max_errors}")
+    for limit in limits:
+        key, _, bound = limit.partition("=")
+        section, _, field = key.partition(".")
+        value = report.get(section, {}).get(field)
+        if value is None:
+            failures.append(f"{key}: no data")
+        elif value > float(bound):
+            failures.append(f"{key} {value:.3f} > {bound}")
+    return failures
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def spawn_server(port: int, workdir: str) -> subprocess.Popen:
+    env = {**SPAWN_ENV, **os.environ}
+    for name, sub in (("IMAGE_STORE_DIR", "images"), ("THEME_IMAGE_CACHE_DIR", "theme_cache"), ("IMAGE_RESPONSE_CACHE_DIR", "response_cache")):
+        env.setdefault(name, os.path.join(workdir, sub))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+
+def wait_ready(http_base: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{http_base}/readyz", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {http_base} not ready after {timeout}s")
+
+async def run(args, base_url: str, server_pid: Optional[int]) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    think = LatencyDistribution.parse(args.think)
+    players = [Player(base_url, args.caps, args.turns, think, args.image_timeout, random.Random(rng.random())) for _ in range(args.sessions)]
+    sampler = RssSampler(server_pid)
+    rss_baseline_kb = sampler.read_kb()
+    sampler.start()
+    started = time.monotonic()
+
+    async def start(index: int, player: Player):
+        await asyncio.sleep(args.ramp * index / max(1, args.sessions))
+        try:
+            await player.play(args.turn_timeout)
+        except Exception as e:
+            player.errors.append(f"{type(e).__name__}: {e}")
+
+    await asyncio.gather(*(start(i, p) for i, p in enumerate(players)))
+    sampler.stop()
+    return build_report(players, time.monotonic() - started, rss_baseline_kb, max(sampler.peak_kb, rss_baseline_kb or 0), sampler.peak_children_kb)
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-player load test for /ws/{session_id}.")
+    parser.add_argument("--url", default="ws://127.0.0.1:8020", help="Server WebSocket base URL (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start a local server with the fake agent and image backends")
+    parser.add_argument("--server-pid", type=int, help="PID of a local server to sample RSS from (automatic with --spawn)")
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5, help="Story turns per session after the theme choice (the theme counts as turn 1)")
+    parser.add_argument("--think", default="lognormal:4:0.5", help="Think time between turns, as a latency distribution")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which sessions connect")
+    parser.add_argument("--caps", default=DEFAULT_CAPS, help="Client capabilities to advertise")
+    parser.add_argument("--turn-timeout", type=float, default=120.0)
+    parser.add_argument("--image-timeout", type=float, default=60.0, help="How long to wait for the last turn's image before disconnecting")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--max", action="append", default=[], metavar="METRIC=LIMIT", help="Fail if exceeded, e.g. turn_latency.p95=6 (repeatable)")
+    parser.add_argument("--max-errors", type=int, default=0)
+    args = parser.parse_args()
+
+    server = None
+    server_pid = args.server_pid
+    base_url = args.url
+    with tempfile.TemporaryDirectory(prefix="aurora-loadtest-") as workdir:
+        try:
+            if args.spawn:
+                port = _free_port()
+                server = spawn_server(port, workdir)
+                server_pid = server.pid
+                base_url = f"ws://127.0.0.1:{port}"
+                wait_ready(f"http://127.0.0.1:{port}", 60)
+            report = asyncio.run(run(args, base_url, server_pid))
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(10)
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    failures = check_limits(report, args.max, args.max_errors)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
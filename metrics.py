@@ -0,0 +1,230 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Sequence, Tuple, Union
+
+from ws_protocol import FRAME_IMAGE, FRAME_IMAGE_PREVIEW
+
+# In-process metrics in the Prometheus text format, served at /metrics.
+#
+# Recording is a dict lookup plus an integer/float add, with no locks: nearly all of it
+# happens on the event loop thread, and a rare lost increment from a worker thread is
+# an acceptable price for keeping it off the hot path's critical section.
+
+LabelValues = Tuple[str, ...]
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+WORK_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _label_text(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+class _Metric(ABC):
+    """A metric whose values live in per-label-set children, created on first use."""
+
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, object] = {}
+
+    def labels(self, *values: str):
+        """The child for these label values (created on first use, cached after)."""
+        child = self._children.get(values)
+        if child is None:
+            child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _new_child(self): ...
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, child in list(self._children.items()):
+            yield from self._render_child(values, child)
+
+    @abstractmethod
+    def _render_child(self, values: LabelValues, child) -> Iterable[str]: ...
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def set(self, value: float):
+        self.value = value
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def _render_child(self, values: LabelValues, child: _Value) -> Iterable[str]:
+        yield f"{self.name}{_label_text(self.labelnames, values)} {_format_value(child.value)}"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+class _HistogramValue:
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: Tuple[float, ...]):
+        self.upper_bounds = upper_bounds
+        self.counts = [0] * (len(upper_bounds) + 1) # Last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.upper_bounds = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.upper_bounds)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _render_child(self, values: LabelValues, child: _HistogramValue) -> Iterable[str]:
+        cumulative = 0
+        counts = list(child.counts)
+        for upper, count in zip((*self.upper_bounds, math.inf), counts):
+            cumulative += count
+            le = f'le="{_format_value(upper)}"'
+            yield f"{self.name}_bucket{_label_text(self.labelnames, values, le)} {cumulative}"
+        yield f"{self.name}_sum{_label_text(self.labelnames, values)} {_format_value(child.sum)}"
+        yield f"{self.name}_count{_label_text(self.labelnames, values)} {cumulative}"
+
+class CallbackMetric:
+    """A counter or gauge whose values are read at scrape time from state a subsystem already keeps."""
+
+    def __init__(self, name: str, help_text: str, kind: str, read: Callable[[], Dict[LabelValues, float]], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self._read = read
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for values, value in self._read().items():
+            yield f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}"
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, Union[_Metric, CallbackMetric]] = {}
+
+    def _register(self, metric: Union[_Metric, CallbackMetric]):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(self, name: str, help_text: str, kind: str, read: Callable[[], Dict[LabelValues, float]], labelnames: Sequence[str] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help_text, kind, read, labelnames))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as e: # One broken collector must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {type(e).__name__}")
+        return "\n".join(lines) + "\n"
+
+# Shared by every module in the process; /metrics renders it.
+metrics_registry = MetricsRegistry()
+
+AGENT_RUN_SECONDS = metrics_registry.histogram("aurora_agent_run_seconds", "Storyteller agent run latency.", ("mode",))
+IMAGE_SECONDS = metrics_registry.histogram("aurora_image_seconds", "Image provider call latency (cache hits excluded).", ("call",))
+TURN_SECONDS = metrics_registry.histogram("aurora_turn_seconds", "Choice received to story turn sent, images excluded.", ("kind",))
+WS_SENT_BYTES = metrics_registry.histogram("aurora_ws_sent_bytes", "WebSocket message size sent to clients.", ("type",), BYTES_BUCKETS)
+IMAGE_WORK_QUEUE_SECONDS = metrics_registry.histogram("aurora_image_work_queue_seconds", "Time CPU-bound image work waited for a free worker.", ("task",), WORK_BUCKETS)
+IMAGE_WORK_SECONDS = metrics_registry.histogram("aurora_image_work_seconds", "Time CPU-bound image work ran in a worker.", ("task",), WORK_BUCKETS)
+FAILURES = metrics_registry.counter("aurora_failures_total", "Failed operations that reached the user as an error or a missing result.", ("component",))
+
+_BINARY_FRAME_NAMES = {FRAME_IMAGE: "image", FRAME_IMAGE_PREVIEW: "image_preview"}
+_TYPE_PREFIX = '{"type": "'
+
+def message_type(message: dict) -> str:
+    """Message type of an outgoing ASGI websocket.send, without parsing the JSON."""
+    text = message.get("text")
+    if text is not None:
+        if text.startswith(_TYPE_PREFIX):
+            end = text.find('"', len(_TYPE_PREFIX))
+            if end != -1:
+                return text[len(_TYPE_PREFIX):end]
+        return "other"
+    data = message.get("bytes") or b""
+    return _BINARY_FRAME_NAMES.get(data[1], "binary") if len(data) > 1 else "binary"
+
+class WebSocketMetricsMiddleware:
+    """ASGI middleware recording the size of every WebSocket message sent, by message type."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "websocket":
+            return await self.app(scope, receive, send)
+
+        async def measured_send(message):
+            if message["type"] == "websocket.send":
+                payload = message.get("text")
+                # json.dumps output is ASCII, so characters == bytes without re-encoding multi-MB image messages.
+                size = len(payload) if payload is not None else len(message.get("bytes") or b"")
+                WS_SENT_BYTES.labels(message_type(message)).observe(size)
+            await send(message)
+
+        await self.app(scope, receive, measured_send)
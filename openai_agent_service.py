@@ -1,12 +1,25 @@
 import asyncio
+import contextvars
 import json
-from typing import Optional, List, Dict
+import re
+import time
+from typing import Any, Optional, List, Dict, Callable, Awaitable, Sequence
 from enum import Enum
 
-from agents import Agent, Runner, RunContextWrapper, function_tool
-from config import SYSTEM_PROMPT # For agent initialization
+from agents import Agent, AgentOutputSchema, ModelSettings, Runner, RunContextWrapper, function_tool, set_default_openai_client
+from config import AGENT_PROMPT_CACHE_RETENTION, AGENT_BACKEND, PROVIDER_MODE, client # For agent initialization
+from prompt_layout import STORYTELLER_INSTRUCTIONS, prompt_cache_stats
+from app_logging import get_logger
+from metrics import AGENT_RUN_SECONDS, FAILURES
+from tracing import span, traced
+from provider_cassette import cassette, request_key
 from pydantic import BaseModel, Field
 
+# Agent runs share the image calls' connection pool instead of opening their own.
+set_default_openai_client(client)
+
+logger = get_logger("agent")
+
 class QuestState(Enum):
     NOT_STARTED = "not_started"
     IN_PROGRESS = "in_progress"
@@ -55,10 +68,12 @@ class GameContext(BaseModel):
             self.objectives[objective_index].finished = finished
 
 # Pydantic Model for the expected story response structure
+# Field order is the order the model generates them in. `narration` comes first so that
+# streamed runs can forward it to the player before the rest of the object is written.
 class StoryResponse(BaseModel):
+    narration: str = Field(description="Vivid scene description with names and characteristics.")
     image_prompt: str = Field(description="Detailed description of the scene with names and objects with detailed characteristics.")
     characters_in_scene: List[str] = Field(description="List of character names present in the scene (lowercase).")
-    narration: str = Field(description="Vivid scene description with names and characteristics.")
     choices: List[str] = Field(description="2-4 short unique actionable choice options.")
     # objectives: List[Objective] = Field(description="List of objectives for the current quest, with their completion status.") # Removed: Agent will use a tool
 
@@ -77,11 +92,66 @@ class StoryResponse(BaseModel):
     #         }
     #     }
 
+class NarrationDeltaExtractor:
+    """Incrementally extracts the `narration` string value from a StoryResponse JSON stream.
+
+    Feed it raw output-text deltas as they arrive; each call returns the newly decoded
+    narration characters (possibly empty). JSON escapes split across chunks are held
+    back until complete.
+    """
+    _KEY_RE = re.compile(r'"narration"\s*:\s*"')
+    _SIMPLE_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos: int | None = None # Index of the next undecoded narration character
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += chunk
+        if self._pos is None:
+            match = self._KEY_RE.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+
+        buf, i, n = self._buffer, self._pos, len(self._buffer)
+        decoded = []
+        while i < n:
+            c = buf[i]
+            if c == '"':
+                self.done = True
+                i += 1
+                break
+            if c != "\\":
+                decoded.append(c)
+                i += 1
+                continue
+            if i + 1 >= n:
+                break # Escape split across chunks
+            esc = buf[i + 1]
+            if esc != "u":
+                decoded.append(self._SIMPLE_ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            length = 6
+            if i + 6 <= n and 0xD800 <= int(buf[i + 2:i + 6], 16) <= 0xDBFF:
+                length = 12 # High surrogate: wait for its low-surrogate pair
+            if i + length > n:
+                break
+            decoded.append(json.loads(f'"{buf[i:i + length]}"'))
+            i += length
+        self._pos = i
+        return "".join(decoded)
+
 class ObjectiveInputForCreation(BaseModel):
     objective: str = Field(description="Description of the objective to be completed.")
     finished: bool = Field(description="Whether this objective has been completed or not. Should typically be False for new objectives.")
 
 @function_tool
+@traced("tool.update_game_objectives")
 async def update_game_objectives_tool(
     ctx: RunContextWrapper[GameContext], 
     objectives: List[Objective]
@@ -95,29 +165,30 @@ async def update_game_objectives_tool(
     game_context = ctx.context # Access GameContext via RunContextWrapper
 
     if game_context is None:
-        print(f"{log_prefix} Error: Game context not available via RunContextWrapper.")
+        logger.error("%s Error: Game context not available via RunContextWrapper.", log_prefix)
         return "Error: Game context not available. Cannot update objectives."
 
-    print(f"{log_prefix} Received objectives: {objectives}")
+    logger.debug("%s Received objectives: %s", log_prefix, objectives)
     game_context.objectives = objectives
 
     if not objectives:
         game_context.quest_state = QuestState.NOT_STARTED
-        print(f"{log_prefix} No objectives. Quest state: {game_context.quest_state}.")
+        logger.info("%s No objectives. Quest state: %s.", log_prefix, game_context.quest_state)
     elif game_context.check_all_objectives_completed():
         game_context.quest_state = QuestState.COMPLETED
-        print(f"{log_prefix} All objectives completed. Quest state: {game_context.quest_state}.")
+        logger.info("%s All objectives completed. Quest state: %s.", log_prefix, game_context.quest_state)
     elif game_context.quest_state == QuestState.NOT_STARTED and any(objectives):
         game_context.quest_state = QuestState.IN_PROGRESS
-        print(f"{log_prefix} Objectives present, quest was NOT_STARTED. Quest state: {game_context.quest_state}.")
+        logger.info("%s Objectives present, quest was NOT_STARTED. Quest state: %s.", log_prefix, game_context.quest_state)
     elif game_context.quest_state == QuestState.COMPLETED and not game_context.check_all_objectives_completed():
         game_context.quest_state = QuestState.IN_PROGRESS # Re-opened
-        print(f"{log_prefix} Quest was COMPLETED, new/unfinished objectives. Quest state: {game_context.quest_state}.")
+        logger.info("%s Quest was COMPLETED, new/unfinished objectives. Quest state: %s.", log_prefix, game_context.quest_state)
 
-    print(f"{log_prefix} Game context objectives updated. Current quest state: {game_context.quest_state}")
+    logger.info("%s Game context objectives updated. Current quest state: %s", log_prefix, game_context.quest_state)
     return "Objectives updated successfully in the game state."
 
 @function_tool
+@traced("tool.create_game_objectives")
 async def create_game_objectives_tool(
     ctx: RunContextWrapper[GameContext], 
     objectives_to_create: List[ObjectiveInputForCreation]
@@ -132,15 +203,15 @@ async def create_game_objectives_tool(
     game_context = ctx.context
 
     if game_context is None:
-        print(f"{log_prefix} Error: Game context not available.")
+        logger.error("%s Error: Game context not available.", log_prefix)
         return "Error: Game context not available. Cannot create objectives."
 
     if game_context.objectives_initialized:
-        print(f"{log_prefix} Objectives already initialized. No action taken.")
+        logger.info("%s Objectives already initialized. No action taken.", log_prefix)
         return "Objectives have already been initialized for this game. No changes made."
 
     if not objectives_to_create:
-        print(f"{log_prefix} No objectives provided to create.")
+        logger.info("%s No objectives provided to create.", log_prefix)
         return "No objectives provided. Objectives remain uninitialized."
 
     created_objectives: List[Objective] = []
@@ -153,17 +224,17 @@ async def create_game_objectives_tool(
         )
         created_objectives.append(created_obj)
         game_context.next_objective_id += 1
-        print(f"{log_prefix} Assigned ID {new_id} to objective: '{obj_input.objective}'")
+        logger.info("%s Assigned ID %s to objective: '%s'", log_prefix, new_id, obj_input.objective)
 
     game_context.objectives = created_objectives
     game_context.objectives_initialized = True
 
     if game_context.check_all_objectives_completed():
         game_context.quest_state = QuestState.COMPLETED
-        print(f"{log_prefix} All initial objectives are already completed. Quest state: {game_context.quest_state}.")
+        logger.info("%s All initial objectives are already completed. Quest state: %s.", log_prefix, game_context.quest_state)
     else:
         game_context.quest_state = QuestState.IN_PROGRESS
-        print(f"{log_prefix} Initial objectives set with IDs. Quest state: {game_context.quest_state}.")
+        logger.info("%s Initial objectives set with IDs. Quest state: %s.", log_prefix, game_context.quest_state)
     
     objectives_summary_parts = []
     for obj in created_objectives:
@@ -174,6 +245,7 @@ async def create_game_objectives_tool(
     return f"Initial game objectives created: [{objectives_summary_str}]. Next available ID is {game_context.next_objective_id}."
 
 @function_tool
+@traced("tool.update_objective_status")
 async def update_objective_status_tool(
     ctx: RunContextWrapper[GameContext],
     finished_objective_ids: List[int]
@@ -186,21 +258,21 @@ async def update_objective_status_tool(
     game_context = ctx.context
 
     if game_context is None:
-        print(f"{log_prefix} Error: Game context not available.")
+        logger.error("%s Error: Game context not available.", log_prefix)
         return "Error: Game context not available. Cannot update objective status."
 
     if not game_context.objectives_initialized:
-        print(f"{log_prefix} Objectives have not been initialized yet. Cannot update status.")
+        logger.warning("%s Objectives have not been initialized yet. Cannot update status.", log_prefix)
         return "Error: Objectives must be created with create_game_objectives_tool before their status can be updated."
     
     if not game_context.objectives:
-        print(f"{log_prefix} No objectives exist to update.")
+        logger.info("%s No objectives exist to update.", log_prefix)
         return "No objectives currently exist in the game to update."
 
     updated_count = 0
     not_found_ids = []
 
-    print(f"{log_prefix} Attempting to mark objectives as finished by ID: {finished_objective_ids}")
+    logger.info("%s Attempting to mark objectives as finished by ID: %s", log_prefix, finished_objective_ids)
     for objective_id_to_finish in finished_objective_ids:
         found_objective = False
         for objective in game_context.objectives:
@@ -208,33 +280,34 @@ async def update_objective_status_tool(
                 if not objective.finished:
                     objective.finished = True
                     updated_count += 1
-                    print(f"{log_prefix} Marked objective ID {objective_id_to_finish} ('{objective.objective}') as finished.")
+                    logger.info("%s Marked objective ID %s ('%s') as finished.", log_prefix, objective_id_to_finish, objective.objective)
                 else:
-                    print(f"{log_prefix} Objective ID {objective_id_to_finish} ('{objective.objective}') was already finished.")
+                    logger.info("%s Objective ID %s ('%s') was already finished.", log_prefix, objective_id_to_finish, objective.objective)
                 found_objective = True
                 break
         if not found_objective:
             not_found_ids.append(objective_id_to_finish)
-            print(f"{log_prefix} Objective ID {objective_id_to_finish} not found.")
+            logger.warning("%s Objective ID %s not found.", log_prefix, objective_id_to_finish)
 
     # Update overall quest state
     if game_context.check_all_objectives_completed():
         game_context.quest_state = QuestState.COMPLETED
-        print(f"{log_prefix} All objectives are now completed. Quest state: {game_context.quest_state}.")
+        logger.info("%s All objectives are now completed. Quest state: %s.", log_prefix, game_context.quest_state)
     elif game_context.quest_state == QuestState.NOT_STARTED and any(game_context.objectives):
         game_context.quest_state = QuestState.IN_PROGRESS
-        print(f"{log_prefix} Quest is now IN_PROGRESS.")
+        logger.info("%s Quest is now IN_PROGRESS.", log_prefix)
     elif game_context.quest_state == QuestState.COMPLETED and not game_context.check_all_objectives_completed():
         game_context.quest_state = QuestState.IN_PROGRESS
-        print(f"{log_prefix} Quest was COMPLETED, but not all objectives are. Reset to IN_PROGRESS (unexpected)." )
+        logger.warning("%s Quest was COMPLETED, but not all objectives are. Reset to IN_PROGRESS (unexpected).", log_prefix)
 
     response_message = f"Updated {updated_count} simple objective(s) to finished."
     if not_found_ids:
         response_message += f" Could not find objectives with the following IDs: {', '.join(map(str, not_found_ids))}."
-    print(f"{log_prefix} {response_message} Current quest state: {game_context.quest_state}")
+    logger.info("%s %s Current quest state: %s", log_prefix, response_message, game_context.quest_state)
     return response_message
 
 @function_tool
+@traced("tool.get_objectives")
 async def get_objectives_tool(
     ctx: RunContextWrapper[GameContext]
 ) -> List[Objective]: # Return type is List[Objective]
@@ -247,7 +320,7 @@ async def get_objectives_tool(
     game_context = ctx.context
 
     if game_context is None:
-        print(f"{log_prefix} Error: Game context not available.")
+        logger.error("%s Error: Game context not available.", log_prefix)
         # The agent SDK might handle this by returning an error string to the LLM,
         # or we can try to return an empty list or an error-like Objective.
         # For now, let Pydantic/SDK handle if context is None, or raise an error.
@@ -256,77 +329,236 @@ async def get_objectives_tool(
         return [] 
 
     if not game_context.objectives_initialized:
-        print(f"{log_prefix} Objectives have not been initialized yet.")
+        logger.info("%s Objectives have not been initialized yet.", log_prefix)
         return [] # Return empty list if no objectives are set
     
     if not game_context.objectives:
-        print(f"{log_prefix} No objectives currently exist in the game.")
+        logger.info("%s No objectives currently exist in the game.", log_prefix)
         return [] # Return empty list if objectives list is empty
 
-    print(f"{log_prefix} Returning current objectives: {game_context.objectives}")
+    logger.debug("%s Returning current objectives: %s", log_prefix, game_context.objectives)
     # The agent SDK will handle serializing this List[Objective] for the LLM.
     return game_context.objectives
 
+# Built and checked once: the SDK would otherwise derive the output schema from StoryResponse on every run.
+STORY_RESPONSE_SCHEMA = AgentOutputSchema(StoryResponse, strict_json_schema=True)
+
+def validate_story_response_schema() -> Dict[str, Any]:
+    """Fails fast if the StoryResponse schema isn't strict-mode compatible or can't round-trip a response."""
+    json_schema = STORY_RESPONSE_SCHEMA.json_schema()
+    sample = StoryResponse(narration="Aurora olha em volta.", image_prompt="Aurora in a park.", characters_in_scene=["aurora"], choices=["Olhar em volta"])
+    if STORY_RESPONSE_SCHEMA.validate_json(sample.model_dump_json()) != sample:
+        raise ValueError("StoryResponse schema did not round-trip a sample response")
+    return json_schema
+
 def initialize_storyteller_agent() -> Agent:
     """Initializes and returns the storyteller agent with structured output."""
     storyteller_agent = Agent(
         name="Storyteller Agent Aurora 3",
-        instructions=SYSTEM_PROMPT,
+        instructions=STORYTELLER_INSTRUCTIONS, # Byte-identical for every run: the cacheable prefix
         model="gpt-4.1",
-        output_type=StoryResponse,
+        model_settings=ModelSettings(prompt_cache_retention=AGENT_PROMPT_CACHE_RETENTION),
+        output_type=STORY_RESPONSE_SCHEMA, # The prebuilt schema; a plain type would be rebuilt on every run
         tools=[create_game_objectives_tool, update_objective_status_tool, get_objectives_tool] # Removed increment_objective_progress_tool
     )
-    print("[Agent Service] Storyteller Agent initialized with simplified objective tools.")
+    logger.info("Storyteller Agent initialized with simplified objective tools.")
     return storyteller_agent
 
-async def get_agent_story_response(runner: Runner, game_context: GameContext, current_turn_user_input: str, conversation_history: List[Dict[str, str]], session_id: str) -> Optional[StoryResponse]:
+_shared_storyteller_agent: Optional[Agent] = None
+
+def get_storyteller_agent() -> Agent:
+    """The process-wide storyteller agent, built on first use (normally by the app's startup warm-up).
+
+    The agent holds no per-game state, which travels in context=GameContext, so every
+    session and speculative branch shares this one definition. Treat it as read-only.
+    """
+    global _shared_storyteller_agent
+    if _shared_storyteller_agent is None:
+        _shared_storyteller_agent = initialize_storyteller_agent()
+    return _shared_storyteller_agent
+
+async def _run_streamed(agent: Agent, current_turn_user_input: str, game_context: GameContext, on_narration_delta: Callable[[str], Awaitable[None]], log_prefix: str):
+    """Runs the agent in streaming mode, forwarding narration text as it is generated.
+
+    Returns (result, seconds until the first output token).
+    """
+    started = time.monotonic()
+    ttft_seconds = None
+    result = Runner.run_streamed(agent, input=current_turn_user_input, context=game_context)
+    extractor = NarrationDeltaExtractor()
+    async for event in result.stream_events():
+        if event.type != "raw_response_event":
+            continue
+        event_type = getattr(event.data, "type", None)
+        if ttft_seconds is None and event_type and event_type.endswith(".delta"):
+            ttft_seconds = time.monotonic() - started # First generated token, text or tool arguments
+        if event_type == "response.created":
+            extractor = NarrationDeltaExtractor() # Each model call (e.g. after tool calls) starts a fresh output
+        elif event_type == "response.output_text.delta":
+            narration_delta = extractor.feed(event.data.delta)
+            if narration_delta:
+                try:
+                    await on_narration_delta(narration_delta)
+                except Exception as send_e:
+                    logger.warning("%s Failed to forward narration delta: %s", log_prefix, send_e)
+    return result, ttft_seconds
+
+# Tool calls of the run being recorded (PROVIDER_MODE=record), filled from the run result.
+_recorded_tool_calls: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("recorded_tool_calls", default=None)
+
+# GameContext fields the agent's tools change; recorded after each run and restored on replay.
+_TOOL_STATE_FIELDS = {"quest_state", "objectives", "objectives_initialized", "next_objective_id"}
+
+def _note_tool_calls(result):
+    tool_calls = _recorded_tool_calls.get()
+    if tool_calls is None:
+        return
+    for item in getattr(result, "new_items", None) or []:
+        if getattr(item, "type", None) == "tool_call_item":
+            raw = item.raw_item
+            tool_calls.append({"name": getattr(raw, "name", None), "arguments": getattr(raw, "arguments", None)})
+
+def _record_usage(result, ttft_seconds: Optional[float], log_prefix: str):
+    """Logs the run's cached vs. uncached input tokens and feeds prompt_cache_stats."""
+    usage = getattr(getattr(result, "context_wrapper", None), "usage", None)
+    if usage is None:
+        return
+    run = prompt_cache_stats.record(usage, ttft_seconds)
+    cached_pct = 100 * run["cached_tokens"] // run["input_tokens"] if run["input_tokens"] else 0
+    ttft_text = f", TTFT {ttft_seconds:.2f}s" if ttft_seconds is not None else ""
+    logger.info("%s Usage: input %s tokens (cached %s, %s%%), output %s%s.", log_prefix, run['input_tokens'], run['cached_tokens'], cached_pct, run['output_tokens'], ttft_text)
+
+async def _get_live_story_response(runner: Runner, game_context: GameContext, current_turn_user_input: str, conversation_history: Sequence[Any], session_id: str, on_narration_delta: Callable[[str], Awaitable[None]] | None = None) -> Optional[StoryResponse]:
     """
     Gets a structured story response from the agent.
     The Agent SDK is expected to manage history internally based on the agent instance.
     The conversation_history parameter is kept for now for logging/debugging but NOT directly passed to Runner.run if it only accepts 'input'.
+    If on_narration_delta is given, the run is streamed and it is awaited with each new chunk of narration text.
     """
-    log_prefix = f"[Agent Service][Session {session_id}]"
-    safe_user_input_snippet = str(current_turn_user_input[:50]).replace('"', '\"').replace("'", "\'")
-    print(f"{log_prefix} Getting structured response. Input: '{safe_user_input_snippet}...'. History len: {len(conversation_history)}.")
+    log_prefix = "[Agent Service]"
+    logger.info("%s Getting structured response. Input: %.50r... History len: %s.", log_prefix, current_turn_user_input, len(conversation_history))
 
     # Ensure the runner has the most up-to-date game_context set on its instance.
     # This is often used by the SDK to make context available to tools via RunContextWrapper.
     runner.context = game_context 
 
+    if AGENT_BACKEND == "fake":
+        from fake_agent import fake_storyteller # Imported here: fake_agent builds on this module's models
+        with span("agent.run", mode="fake"), AGENT_RUN_SECONDS.labels("fake").time():
+            response = await fake_storyteller.respond(game_context, on_narration_delta)
+        game_context.update_character_scene_status(response.characters_in_scene)
+        return response
+
     try:
         # Attempt to pass context directly to the run method as well, if supported by the SDK.
         # This can be more robust for tool context in some SDK versions.
-        result = await Runner.run(
-            runner.agent, 
-            input=current_turn_user_input, 
-            context=game_context # Explicitly pass context here
-        )
+        ttft_seconds = None # Only observable when streaming
+        if on_narration_delta is not None:
+            with span("agent.run", mode="streamed") as run_span, AGENT_RUN_SECONDS.labels("streamed").time():
+                result, ttft_seconds = await _run_streamed(runner.agent, current_turn_user_input, game_context, on_narration_delta, log_prefix)
+                if run_span is not None:
+                    run_span.attrs["ttft_ms"] = round(ttft_seconds * 1000, 1) if ttft_seconds is not None else None
+        else:
+            with span("agent.run", mode="blocking"), AGENT_RUN_SECONDS.labels("blocking").time():
+                result = await Runner.run(
+                    runner.agent, 
+                    input=current_turn_user_input, 
+                    context=game_context # Explicitly pass context here
+                )
+        _record_usage(result, ttft_seconds, log_prefix)
+        _note_tool_calls(result)
         
         if result and result.final_output:
             if isinstance(result.final_output, StoryResponse):
                 game_context.update_character_scene_status(result.final_output.characters_in_scene)
-                print(f"{log_prefix} Agent SDK Response (StoryResponse model). Narration snippet: ...")
-                print(f"{log_prefix} Post-tool call context: Objectives count = {len(game_context.objectives)}, Quest State = {game_context.quest_state}")
+                logger.debug("%s Agent SDK Response (StoryResponse model): %.200r", log_prefix, result.final_output.narration)
+                logger.info("%s Post-tool call context: Objectives count = %s, Quest State = %s", log_prefix, len(game_context.objectives), game_context.quest_state)
                 return result.final_output
             else:
-                safe_output_str = str(result.final_output)[:200].replace("\n", " ").replace("\r", " ").replace('"', '\"').replace("'", "\'")
-                error_log_message = f"Agent SDK returned final_output but not StoryResponse. Type: {type(result.final_output)}. Output: {safe_output_str}"
-                print(f"{log_prefix} {error_log_message}")
+                logger.warning("%s Agent SDK returned final_output but not StoryResponse. Type: %s. Output: %.200r", log_prefix, type(result.final_output), result.final_output)
                 if isinstance(result.final_output, str):
                     try:
                         data = json.loads(result.final_output)
                         if "objectives" in data:
-                            print(f"{log_prefix} WARNING: Agent included 'objectives' in JSON. Removing.")
+                            logger.warning("%s Agent included 'objectives' in JSON. Removing.", log_prefix)
                             del data["objectives"]
                         return StoryResponse(**data)
                     except Exception as parse_e:
-                        print(f"{log_prefix} Fallback JSON parsing failed for string output: {parse_e}")
+                        logger.warning("%s Fallback JSON parsing failed for string output: %s", log_prefix, parse_e)
+                FAILURES.labels("agent").inc()
                 return None
         else:
-            safe_result_str = str(result).replace("\n", " ").replace("\r", " ").replace('"', '\"').replace("'", "\'")
-            no_output_log_message = f"Agent SDK returned None result or no final_output. Result: {safe_result_str}"
-            print(f"{log_prefix} {no_output_log_message}")
+            logger.warning("%s Agent SDK returned None result or no final_output. Result: %.500r", log_prefix, result)
+            FAILURES.labels("agent").inc()
             return None
     except Exception as e:
-        print(f"{log_prefix} !!! Agent SDK Call Error: {e}")
-        return None 
\ No newline at end of file
+        logger.error("%s !!! Agent SDK Call Error: %s", log_prefix, e)
+        FAILURES.labels("agent").inc()
+        return None 
+
+async def _record_story_response(runner: Runner, game_context: GameContext, current_turn_user_input: str, conversation_history: Sequence[Any], session_id: str, on_narration_delta: Callable[[str], Awaitable[None]] | None) -> Optional[StoryResponse]:
+    """Runs the live agent and saves the response, tool calls, resulting quest state and timing to the cassette."""
+    started = time.monotonic()
+    deltas = []
+
+    async def capture_delta(delta: str):
+        deltas.append([round(time.monotonic() - started, 4), delta])
+        await on_narration_delta(delta)
+
+    token = _recorded_tool_calls.set([])
+    try:
+        response = await _get_live_story_response(runner, game_context, current_turn_user_input, conversation_history, session_id, capture_delta if on_narration_delta else None)
+        tool_calls = _recorded_tool_calls.get()
+    finally:
+        _recorded_tool_calls.reset(token)
+    if response is None:
+        return None # Failures aren't recorded; replaying one would only replay the outage
+    entry = {
+        "kind": "agent",
+        "key": request_key(current_turn_user_input),
+        "input": current_turn_user_input,
+        "response": response.model_dump(mode="json"),
+        "tool_calls": tool_calls,
+        "game_state": game_context.model_dump(mode="json", include=_TOOL_STATE_FIELDS),
+        "ttft": deltas[0][0] if deltas else None,
+        "deltas": deltas,
+        "seconds": round(time.monotonic() - started, 4),
+    }
+    await asyncio.to_thread(cassette.record, entry)
+    return response
+
+async def _replay_story_response(game_context: GameContext, current_turn_user_input: str, session_id: str, on_narration_delta: Callable[[str], Awaitable[None]] | None) -> Optional[StoryResponse]:
+    """Answers from the cassette: restores the recorded quest state and replays the narration deltas on the recorded schedule."""
+    started = time.monotonic()
+    entry = cassette.find("agent", request_key(current_turn_user_input))
+    if entry is None:
+        logger.error("[Agent Service] No recorded agent run for this input.")
+        FAILURES.labels("agent").inc()
+        return None
+    response = StoryResponse.model_validate(entry["response"])
+    replayed_state = GameContext.model_validate(entry["game_state"])
+    for field in _TOOL_STATE_FIELDS:
+        setattr(game_context, field, getattr(replayed_state, field))
+    if on_narration_delta is not None:
+        deltas = entry["deltas"] or [[entry["seconds"], response.narration]]
+        for offset, delta in deltas:
+            await cassette.wait_until(started, offset)
+            try:
+                await on_narration_delta(delta)
+            except Exception as send_e:
+                logger.warning("[Agent Service] Failed to forward narration delta: %s", send_e)
+    await cassette.wait_until(started, entry["seconds"])
+    game_context.update_character_scene_status(response.characters_in_scene)
+    return response
+
+async def get_agent_story_response(runner: Runner, game_context: GameContext, current_turn_user_input: str, conversation_history: Sequence[Any], session_id: str, on_narration_delta: Callable[[str], Awaitable[None]] | None = None) -> Optional[StoryResponse]:
+    """Gets the storyteller's response for this turn, from the agent or, per PROVIDER_MODE, the cassette.
+
+    If on_narration_delta is given, it is awaited with each new chunk of narration text.
+    """
+    if PROVIDER_MODE == "replay":
+        with span("agent.run", mode="replay"), AGENT_RUN_SECONDS.labels("replay").time():
+            return await _replay_story_response(game_context, current_turn_user_input, session_id, on_narration_delta)
+    if PROVIDER_MODE == "record":
+        return await _record_story_response(runner, game_context, current_turn_user_input, conversation_history, session_id, on_narration_delta)
+    return await _get_live_story_response(runner, game_context, current_turn_user_input, conversation_history, session_id, on_narration_delta)
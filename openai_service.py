@@ -1,22 +1,93 @@
-import asyncio
-from typing import List, Dict, Any, AsyncGenerator, Tuple, Union
+from typing import List, Dict, Any, AsyncGenerator, Awaitable, Callable, Optional, Tuple, Union
 
-from config import client # OpenAI client
+from config import (
+    IMAGE_RETRY_MAX_ATTEMPTS,
+    IMAGE_ATTEMPT_TIMEOUT,
+    IMAGE_RETRY_BASE_DELAY,
+    IMAGE_RETRY_MAX_DELAY,
+    IMAGE_HEDGE_ENABLED,
+    IMAGE_HEDGE_PERCENTILE,
+    IMAGE_BREAKER_FAILURE_THRESHOLD,
+    IMAGE_BREAKER_RESET_SECONDS,
+    IMAGE_CACHE_BYPASS,
+)
 import io # For image file handling
 
+from retry_policy import RetryPolicy, CircuitBreaker
+from image_cache import ImageResponseCache, image_response_cache
+from image_backends import PartialImageCallback, image_backend # Real API (shared pooled client) or local fake
+from app_logging import get_logger
+from metrics import IMAGE_SECONDS
+from tracing import span
+
+logger = get_logger("openai_service")
+
+# One policy (and breaker) for every image call in the process: if the provider is down, it is down for everyone.
+image_retry_policy = RetryPolicy(
+    "openai-image-edit",
+    max_attempts=IMAGE_RETRY_MAX_ATTEMPTS,
+    attempt_timeout=IMAGE_ATTEMPT_TIMEOUT,
+    base_delay=IMAGE_RETRY_BASE_DELAY,
+    max_delay=IMAGE_RETRY_MAX_DELAY,
+    hedge=IMAGE_HEDGE_ENABLED,
+    hedge_percentile=IMAGE_HEDGE_PERCENTILE,
+    breaker=CircuitBreaker(IMAGE_BREAKER_FAILURE_THRESHOLD, IMAGE_BREAKER_RESET_SECONDS),
+)
+
+async def _edit_cached(
+    build_api_args: Callable[[], Dict[str, Any]],
+    input_images: List[Tuple[bytes, str]],
+    use_cache: bool,
+    on_partial: Optional[PartialImageCallback],
+    call_type: str,
+    gate: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]],
+    log_prefix: str,
+) -> str:
+    """Calls images.edit through image_retry_policy (and `gate`, e.g. image_scheduler), answering
+    from image_response_cache when an identical request was already paid for.
+
+    The cache is checked first, so a hit spends no scheduler slot or rate-limit token and adds
+    no latency sample to the hedging percentile. build_api_args() is called once per attempt:
+    retries and hedged duplicates must not share file read positions. Raises once attempts are exhausted.
+    """
+    cache_key = None
+    if use_cache and not IMAGE_CACHE_BYPASS:
+        api_args = build_api_args()
+        params = {k: v for k, v in api_args.items() if k not in ("image", "prompt")}
+        cache_key = ImageResponseCache.key_for(api_args["prompt"], params, input_images)
+        with span("image.cache_lookup", call=call_type) as lookup_span:
+            cached_b64 = await image_response_cache.get_b64(cache_key)
+            if lookup_span is not None:
+                lookup_span.attrs["hit"] = cached_b64 is not None
+        if cached_b64 is not None:
+            logger.info("Image cache hit (%s).", cache_key[:12])
+            return cached_b64
+
+    async def attempt() -> Optional[str]:
+        with span("image.api", call=call_type, inputs=len(input_images)), IMAGE_SECONDS.labels(call_type).time():
+            return await image_backend.edit(build_api_args(), on_partial)
+
+    image_b64 = await image_retry_policy.call(attempt, log_prefix=log_prefix, gate=gate)
+    if cache_key is not None:
+        await image_response_cache.put_b64(cache_key, image_b64)
+    return image_b64
+
 async def edit_image_with_openai(
     image_bytes: bytes,
     image_mime: str,
     image_filename: str, # e.g., "reference.png"
     prompt: str,
-    session_id: str # For logging context
-) -> str | None: # Returns base64 JSON string of the image or None
+    session_id: str, # For logging context
+    use_cache: bool = True, # False when a fresh variation matters more than speed
+    on_partial: Optional[PartialImageCallback] = None, # Receives streamed previews, if any
+    gate: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]] = None, # Runs each provider request, e.g. image_scheduler
+    log_prefix: str = "[GenerateImage]"
+) -> str: # Returns base64 JSON string of the image; raises once retries are exhausted
     """Generates an image by editing a base image using OpenAI API."""
-    try:
+    def build_api_args() -> Dict[str, Any]:
         png_buffer = io.BytesIO(image_bytes)
         png_buffer.name = image_filename
-
-        api_args = {
+        return {
             "model": "gpt-image-1",
             "image": (png_buffer.name, png_buffer, image_mime),
             "prompt": prompt,
@@ -24,31 +95,30 @@ async def edit_image_with_openai(
             "size": "1024x1024",
             "quality": "high"
         }
-        response = await asyncio.to_thread(client.images.edit, **api_args)
-        return response.data[0].b64_json
-    except Exception as e:
-        print(f"[OpenAI Service][Session {session_id}] !!! OpenAI API Call Error (Image Edit): {e}")
-        return None
+    return await _edit_cached(build_api_args, [(image_bytes, image_mime)], use_cache, on_partial, "edit", gate, log_prefix)
 
 async def edit_image_with_multiple_inputs_openai(
-    image_files_for_api: List[Tuple[str, io.BytesIO, str]],
+    image_inputs: List[Tuple[str, bytes, str]], # (filename, bytes, mime)
     prompt: str,
-    session_id: str
-) -> str | None:
+    session_id: str,
+    use_cache: bool = True,
+    on_partial: Optional[PartialImageCallback] = None,
+    gate: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]] = None,
+    log_prefix: str = "[GenerateScene]"
+) -> str:
     """Generates an image by editing, potentially using multiple input images if the API/library supports it."""
-    try:
-        if not image_files_for_api:
-            print(f"[OpenAI Service][Session {session_id}] No image files provided for editing.")
-            return None
+    if not image_inputs:
+        raise ValueError("No image files provided for editing.")
 
+    def build_api_args() -> Dict[str, Any]:
+        # Fresh file objects per attempt
+        image_files_for_api = [(filename, io.BytesIO(data), mime) for filename, data, mime in image_inputs]
         image_input_param: Union[Tuple[str, io.BytesIO, str], List[Tuple[str, io.BytesIO, str]]]
-
         if len(image_files_for_api) == 1:
             image_input_param = image_files_for_api[0]
         else: # More than one image
             image_input_param = image_files_for_api # Pass the list of tuples directly
-
-        api_args = {
+        return {
             "model": "gpt-image-1",
             "image": image_input_param, # This will now be the list if multiple images are present
             "prompt": prompt,
@@ -56,8 +126,5 @@ async def edit_image_with_multiple_inputs_openai(
             "size": "1024x1024",
             "quality": "high"
         }
-        response = await asyncio.to_thread(client.images.edit, **api_args)
-        return response.data[0].b64_json
-    except Exception as e:
-        print(f"[OpenAI Service][Session {session_id}] !!! OpenAI API Call Error (Multi-Input Image Edit Attempt): {e}")
-        return None 
\ No newline at end of file
+    input_images = [(data, mime) for _, data, mime in image_inputs]
+    return await _edit_cached(build_api_args, input_images, use_cache, on_partial, "multi_edit", gate, log_prefix)
@@ -0,0 +1,110 @@
+import threading
+from typing import Any, Dict, Iterable, Optional
+
+from config import SYSTEM_PROMPT, DETAILED_CHARACTER_DESCRIPTIONS
+
+# Providers cache the longest prefix they have already seen, so each request is laid out
+# from most stable to least stable: tools + instructions (identical for every run in the
+# process), then the fixed turn directive, then per-game state, then the player's choice.
+# Anything that changes per turn must stay after everything that doesn't.
+
+def character_reference_block(descriptions: Dict[str, str] = DETAILED_CHARACTER_DESCRIPTIONS) -> str:
+    """Fixed block with each character's visual description once, in a stable (sorted) order."""
+    names_by_description: Dict[str, list[str]] = {}
+    for name in sorted(descriptions):
+        text = " ".join(descriptions[name].split())
+        names_by_description.setdefault(text, []).append(name)
+    lines = [f"- {', '.join(names)}: {text}" for text, names in names_by_description.items()]
+    return (
+        "# REFERÊNCIA VISUAL DOS PERSONAGENS\n\n"
+        "Ao incluir um personagem no `image_prompt`, use a descrição de aparência abaixo:\n"
+        + "\n".join(lines)
+    )
+
+# Agent instructions: the cacheable prefix shared by every run.
+STORYTELLER_INSTRUCTIONS = f"{SYSTEM_PROMPT.rstrip()}\n\n{character_reference_block()}\n"
+
+THEME_TURN_DIRECTIVE = (
+    "Com base no tema escolhido, configure o jogo (ambiente, entidades, quest) conforme suas instruções. "
+    "IMPORTANTE: Em sua narração para ESTA PRIMEIRA RODADA DE JOGO APÓS A ESCOLHA DO TEMA, você DEVE começar "
+    "explicando os objetivos gerais do jogo. Após explicar os objetivos, descreva o cenário inicial e forneça as "
+    "primeiras opções de jogo."
+)
+
+TURN_DIRECTIVE = (
+    "Continue a história a partir da escolha do jogador (no final desta mensagem), descrevendo o resultado desta "
+    "escolha e o novo estado da cena. Forneça novas opções. Não explique os objetivos do jogo novamente."
+)
+
+def build_theme_turn_input(theme: str) -> str:
+    return f"{THEME_TURN_DIRECTIVE}\n\nO tema do jogo foi escolhido: '{theme}'."
+
+def build_turn_input(objective_reminder: str, story_so_far: str, choice: str) -> str:
+    """Turn input, ordered stable -> volatile: directive, objectives, story memory, choice."""
+    return (
+        f"{TURN_DIRECTIVE}\n\n"
+        f"{objective_reminder}\n\n"
+        f"{story_so_far}\n\n"
+        f"A escolha do jogador para esta rodada foi: '{choice}'."
+    )
+
+def character_descriptions_for(names: Iterable[str], descriptions: Dict[str, str] = DETAILED_CHARACTER_DESCRIPTIONS) -> list[str]:
+    """Image-prompt descriptions for the characters in a scene, each once, in first-seen order."""
+    return [descriptions.get(name, name) for name in dict.fromkeys(names)]
+
+class PromptCacheStats:
+    """Cached vs. uncached input tokens and time to first token across agent runs.
+
+    Fed from each run's usage (`input_tokens_details.cached_tokens`), so the effect of
+    the prompt layout on cost and latency is visible in /debug/stats.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.runs_with_cache_hit = 0
+        self._ttft_total = 0.0
+        self._ttft_samples = 0
+
+    def record(self, usage: Any, ttft_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """Adds one run's usage; returns that run's numbers for logging."""
+        input_tokens = getattr(usage, "input_tokens", 0) or 0
+        details = getattr(usage, "input_tokens_details", None)
+        cached_tokens = getattr(details, "cached_tokens", 0) or 0
+        output_tokens = getattr(usage, "output_tokens", 0) or 0
+        with self._lock:
+            self.runs += 1
+            self.input_tokens += input_tokens
+            self.cached_tokens += cached_tokens
+            self.output_tokens += output_tokens
+            if cached_tokens:
+                self.runs_with_cache_hit += 1
+            if ttft_seconds is not None:
+                self._ttft_total += ttft_seconds
+                self._ttft_samples += 1
+        return {
+            "input_tokens": input_tokens,
+            "cached_tokens": cached_tokens,
+            "uncached_tokens": input_tokens - cached_tokens,
+            "output_tokens": output_tokens,
+            "ttft_seconds": ttft_seconds,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "runs_with_cache_hit": self.runs_with_cache_hit,
+                "input_tokens": self.input_tokens,
+                "cached_tokens": self.cached_tokens,
+                "uncached_tokens": self.input_tokens - self.cached_tokens,
+                "output_tokens": self.output_tokens,
+                "cached_ratio": round(self.cached_tokens / self.input_tokens, 3) if self.input_tokens else 0.0,
+                "avg_ttft_seconds": round(self._ttft_total / self._ttft_samples, 3) if self._ttft_samples else None,
+            }
+
+# Shared by every agent run in the process.
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from config import PROVIDER_MODE, PROVIDER_CASSETTE_DIR, PROVIDER_REPLAY_DELAY_SCALE, PROVIDER_REPLAY_STRICT
+from app_logging import get_logger
+
+logger = get_logger("cassette")
+
+class Cassette:
+    """Recorded provider calls on disk, for deterministic offline runs.
+
+    Layout: `calls.jsonl` holds one entry per call (kind, request key, outputs, timing);
+    large payloads such as images live in `blobs/<sha256>` and are referenced by digest.
+
+    Replay looks an entry up by request key, cycling through repeats of the same key.
+    Unless strict, a request that was never recorded gets the next recorded entry of the
+    same kind, so a replayed load run with different choices still exercises every code
+    path with recorded payloads and timing.
+    """
+
+    def __init__(self, directory: str, delay_scale: float = 1.0, strict: bool = False):
+        self.directory = directory
+        self.delay_scale = delay_scale
+        self.strict = strict
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._by_kind: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursors: Dict[Any, int] = {}
+        self._loaded = False
+        self.recorded = 0
+        self.replayed = 0
+        self.fallbacks = 0
+        self.misses = 0
+
+    @property
+    def _calls_path(self) -> str:
+        return os.path.join(self.directory, "calls.jsonl")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, "blobs", digest)
+
+    def _index(self, entry: Dict[str, Any]):
+        self._by_key.setdefault(entry["kind"], {}).setdefault(entry["key"], []).append(entry)
+        self._by_kind.setdefault(entry["kind"], []).append(entry)
+
+    def _load(self):
+        with self._lock:
+            if self._loaded:
+                return
+            try:
+                with open(self._calls_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            self._index(json.loads(line))
+            except FileNotFoundError:
+                logger.warning("No cassette at %s; every replayed call will miss.", self._calls_path)
+            self._loaded = True
+            logger.info("Loaded %s recorded calls from %s.", sum(len(v) for v in self._by_kind.values()), self.directory)
+
+    def write_blob(self, data: bytes) -> str:
+        """Stores a payload once by content; returns its digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp" # Unique per writer: blobs are written from several threads
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def read_blob(self, digest: str) -> bytes:
+        with open(self._blob_path(digest), "rb") as f:
+            return f.read()
+
+    def record(self, entry: Dict[str, Any]):
+        """Appends one call. Blocking: call it through asyncio.to_thread."""
+        line = json.dumps({**entry, "recorded_at": round(time.time(), 3)}, ensure_ascii=False)
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._calls_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.recorded += 1
+
+    def find(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """The recorded entry to replay for this request, or None if there is none."""
+        self._load()
+        with self._lock:
+            matches = self._by_key.get(kind, {}).get(key)
+            if not matches:
+                matches = None if self.strict else self._by_kind.get(kind)
+                if not matches:
+                    self.misses += 1
+                    return None
+                self.fallbacks += 1
+                cursor_key = kind
+            else:
+                cursor_key = (kind, key)
+            cursor = self._cursors.get(cursor_key, 0)
+            self._cursors[cursor_key] = cursor + 1
+            self.replayed += 1
+            return matches[cursor % len(matches)]
+
+    async def wait_until(self, started: float, recorded_offset: float):
+        """Sleeps until `recorded_offset` seconds (scaled) after `started`, a time.monotonic() value."""
+        if self.delay_scale <= 0:
+            return
+        delay = started + recorded_offset * self.delay_scale - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": PROVIDER_MODE,
+            "directory": self.directory,
+            "recorded": self.recorded,
+            "replayed": self.replayed,
+            "fallbacks": self.fallbacks,
+            "misses": self.misses,
+        }
+
+def request_key(*parts: Any) -> str:
+    """Canonical digest of a provider request's inputs."""
+    material = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+# Shared by the agent service and the image backend; only touched outside PROVIDER_MODE=live.
+cassette = Cassette(PROVIDER_CASSETTE_DIR, PROVIDER_REPLAY_DELAY_SCALE, PROVIDER_REPLAY_STRICT)
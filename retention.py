@@ -0,0 +1,70 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from config import SESSION_RETENTION_SECONDS, IMAGE_STORE_RETENTION_SECONDS, RETENTION_SWEEP_INTERVAL_SECONDS
+from session_store import SessionStore, session_store
+from image_store import ImageStore, image_store
+from app_logging import get_logger
+
+logger = get_logger("retention")
+
+class RetentionSweeper:
+    """Deletes expired session snapshots and stored images, at startup and then every `interval_seconds`.
+
+    Every worker sweeps; the deletes are idempotent, so overlapping sweeps are harmless.
+    A retention of 0 keeps that kind of data forever.
+    """
+
+    def __init__(self, sessions: SessionStore, images: ImageStore, session_retention: float, image_retention: float, interval_seconds: float):
+        self.sessions = sessions
+        self.images = images
+        self.session_retention = session_retention
+        self.image_retention = image_retention
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+        self.sweeps = 0
+        self.sessions_removed = 0
+        self.images_removed = 0
+
+    async def sweep(self):
+        now = time.time()
+        sessions_removed = images_removed = 0
+        try:
+            if self.session_retention > 0:
+                sessions_removed = await self.sessions.purge(now - self.session_retention)
+            if self.image_retention > 0:
+                images_removed = await asyncio.to_thread(self.images.purge, now - self.image_retention)
+        except Exception as e:
+            logger.warning("Retention sweep failed: %s", e)
+        self.sweeps += 1
+        self.sessions_removed += sessions_removed
+        self.images_removed += images_removed
+        if sessions_removed or images_removed:
+            logger.info("Removed %s expired session(s) and %s image(s).", sessions_removed, images_removed)
+
+    async def _run(self):
+        while True:
+            await self.sweep()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        if self._task is None and self.interval_seconds > 0 and (self.session_retention > 0 or self.image_retention > 0):
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "session_retention_seconds": self.session_retention,
+            "image_retention_seconds": self.image_retention,
+            "sweeps": self.sweeps,
+            "sessions_removed": self.sessions_removed,
+            "images_removed": self.images_removed,
+        }
+
+# Shared by the worker process; started and stopped by the app's lifespan.
+retention_sweeper = RetentionSweeper(session_store, image_store, SESSION_RETENTION_SECONDS, IMAGE_STORE_RETENTION_SECONDS, RETENTION_SWEEP_INTERVAL_SECONDS)
@@ -0,0 +1,215 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Optional, TypeVar
+
+from app_logging import get_logger
+
+logger = get_logger("retry")
+
+T = TypeVar("T")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a provider that has been failing consistently."""
+
+class AttemptFailedError(Exception):
+    """An attempt returned no result (the service functions return None on error)."""
+
+class LatencyTracker:
+    """Rolling window of successful attempt latencies, for picking a hedging threshold."""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = 1) -> Optional[float]:
+        if len(self._samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one probe through after `reset_seconds`."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+
+    def record_cancelled(self):
+        """The call was cancelled before it had an outcome: let the next call probe instead."""
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic() # (Re)open; a failed probe restarts the cool-down
+
+class RetryPolicy:
+    """Retries an async call with a per-attempt deadline, jittered exponential backoff,
+    optional hedging and a circuit breaker.
+
+    With hedging on, once an attempt has run longer than the `hedge_percentile` of recent
+    successful latencies, a duplicate request is started; whichever succeeds first wins
+    and the other is cancelled.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_attempts: int = 3,
+        attempt_timeout: float = 180.0,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        hedge: bool = False,
+        hedge_percentile: float = 0.95,
+        hedge_min_samples: int = 20,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.latency = LatencyTracker()
+        self.retries = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Full-jitter exponential backoff for the given 0-based attempt number."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def call(
+        self,
+        attempt_factory: Callable[[], Awaitable[Optional[T]]],
+        log_prefix: str = "",
+        gate: Optional[Callable[[Callable[[], Awaitable[Any]]], Awaitable[Any]]] = None,
+    ) -> T:
+        """Runs attempt_factory() until it returns a non-None result or attempts run out.
+
+        attempt_factory must build a fresh request each time (it may be called
+        concurrently when hedging). `gate`, if given, runs each request (e.g. through
+        image_scheduler); time spent waiting there counts towards neither the per-attempt
+        deadline nor the latency samples, so queueing doesn't trigger hedges.
+        Raises the last error once attempts are exhausted.
+        """
+        last_exception: Exception | None = None
+        for attempt in range(self.max_attempts):
+            if self.breaker and not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} circuit is open after {self.breaker.consecutive_failures} consecutive failures")
+            logger.debug("%s Attempt %s/%s (%s).", log_prefix, attempt + 1, self.max_attempts, self.name)
+            try:
+                result, seconds = await self._attempt(attempt_factory, gate)
+                self.latency.record(seconds)
+                if self.breaker:
+                    self.breaker.record_success()
+                return result
+            except asyncio.CancelledError:
+                if self.breaker:
+                    self.breaker.record_cancelled()
+                raise
+            except Exception as e:
+                last_exception = e
+                if self.breaker:
+                    self.breaker.record_failure()
+                logger.warning("%s Attempt %s failed: %s: %s", log_prefix, attempt + 1, type(e).__name__, e)
+            if attempt < self.max_attempts - 1:
+                self.retries += 1
+                await asyncio.sleep(self.backoff_delay(attempt))
+        raise last_exception or AttemptFailedError(f"{self.name} failed after {self.max_attempts} attempts")
+
+    async def _attempt(self, attempt_factory: Callable[[], Awaitable[Optional[T]]], gate) -> tuple[T, float]:
+        first_started = asyncio.Event()
+        first_task = asyncio.ensure_future(self._timed(attempt_factory, gate, first_started))
+        tasks = {first_task}
+        hedge_after = self.latency.percentile(self.hedge_percentile, self.hedge_min_samples) if self.hedge else None
+        hedged = False
+        last_exception: Exception | None = None
+        try:
+            hedge_at = None
+            if hedge_after is not None:
+                # The hedge clock starts when the first request passes the gate, not while it queues
+                started_waiter = asyncio.ensure_future(first_started.wait())
+                try:
+                    await asyncio.wait({first_task, started_waiter}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    started_waiter.cancel()
+                hedge_at = time.monotonic() + hedge_after
+            while tasks:
+                wait_for = max(0.0, hedge_at - time.monotonic()) if hedge_at is not None and not hedged else None
+                done, tasks = await asyncio.wait(tasks, timeout=wait_for, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not first_task:
+                            self.hedges_won += 1
+                        return task.result()
+                    last_exception = task.exception()
+                if not done and hedge_at is not None and not hedged:
+                    hedged = True
+                    self.hedges_fired += 1
+                    tasks.add(asyncio.ensure_future(self._timed(attempt_factory, gate)))
+                elif not tasks and last_exception is not None:
+                    raise last_exception
+            raise last_exception or AttemptFailedError(f"{self.name} attempt produced no result")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _timed(self, attempt_factory: Callable[[], Awaitable[Optional[T]]], gate, started: Optional[asyncio.Event] = None) -> tuple[T, float]:
+        """One request through the gate, under the per-attempt deadline. Returns (result, seconds at the provider)."""
+        async def provider_call() -> tuple[T, float]:
+            if started is not None:
+                started.set()
+            call_started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(attempt_factory(), self.attempt_timeout)
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError(f"{self.name} attempt exceeded {self.attempt_timeout:g}s") from None
+            if result is None:
+                raise AttemptFailedError("Attempt returned no result")
+            return result, time.monotonic() - call_started
+
+        return await (gate(provider_call) if gate else provider_call())
+
+    def stats(self) -> dict:
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            "retries": self.retries,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "latency_p50_seconds": round(p50, 3) if p50 is not None else None,
+            "latency_p95_seconds": round(p95, 3) if p95 is not None else None,
+            "circuit": self.breaker.state if self.breaker else None,
+        }
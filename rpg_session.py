@@ -2,7 +2,6 @@ import asyncio
 import json
 import os
 import base64
-import io
 
 from fastapi import WebSocket # Only WebSocket is strictly needed by RPGSession methods
 from starlette.websockets import WebSocketState # For checking client_state
@@ -18,14 +17,34 @@ from config import (
     USE_PLACEHOLDER_INITIAL_IMAGE,
     DETAILED_CHARACTER_DESCRIPTIONS,
     IMAGE_STYLE_GUIDE, # Import the new style guide
+    STREAM_NARRATION,
+    SPECULATION_ENABLED,
 )
 
 # Image utilities import
 from image_utils import (
     load_image_from_path,
     process_base64_image,
-    get_placeholder_image_data
+    get_placeholder_image_data,
+    sprite_registry,
+    upload_reducer,
+    pixel_grid_normalizer,
+    decode_image_b64,
+    make_preview_from_b64
 )
+from image_workers import image_workers
+
+from ws_protocol import CAP_BINARY_IMAGES, CAP_IMAGE_URLS, CAP_IMAGE_PREVIEWS, FRAME_IMAGE, FRAME_IMAGE_PREVIEW, encode_binary_frame
+from image_store import image_store
+from speculation import SpeculationEngine
+from session_store import session_store, SessionSnapshot
+from image_scheduler import image_scheduler, ImagePriority
+from image_cache import ThemeImageCache, theme_image_cache
+from story_memory import StoryMemory
+from prompt_layout import build_theme_turn_input, build_turn_input, character_descriptions_for
+from app_logging import get_logger, bind_turn
+from tracing import span, start_span, end_span, traced
+from metrics import FAILURES
 
 # Import for OpenAI Agents SDK
 from agents import Agent, Runner
@@ -38,7 +57,7 @@ from openai_service import (
 
 # Import from the new agent_service
 from openai_agent_service import (
-    initialize_storyteller_agent,
+    get_storyteller_agent,
     get_agent_story_response,
     StoryResponse,
     GameContext,
@@ -46,11 +65,63 @@ from openai_agent_service import (
     QuestState
 )
 
+logger = get_logger("session")
+
+@traced("image.reduce_uploads")
+async def reduce_upload_inputs(image_inputs: list[tuple[str, bytes, str]], log_prefix: str) -> list[tuple[str, bytes, str]]:
+    """Runs every (filename, bytes, mime) reference image through upload_reducer, in parallel, and logs the saving."""
+    if not upload_reducer.enabled:
+        return image_inputs
+    reduced_images = await asyncio.gather(*(upload_reducer.reduce_async(data) for _, data, _ in image_inputs))
+    # The reducer returns either a smaller PNG or the input unchanged, in whatever format it was
+    reduced = [
+        (filename, data, "image/png" if len(data) < len(original) else mime)
+        for (filename, original, mime), data in zip(image_inputs, reduced_images)
+    ]
+    before = sum(len(data) for _, data, _ in image_inputs)
+    after = sum(len(data) for _, data, _ in reduced)
+    logger.info("%s Upload size %.0f KiB -> %.0f KiB (%s image(s)).", log_prefix, before / 1024, after / 1024, len(image_inputs))
+    return reduced
+
+async def render_theme_image(prompt: str, image_bytes: bytes, image_mime: str, session_id: str, refresh: bool = False, on_partial=None) -> str:
+    """Edits a fixed input image with the style guide + prompt, through theme_image_cache.
+
+    The inputs are identical for every session, so concurrent sessions share one
+    generation and later ones reuse the stored result. Returns the image_store filename.
+    Only the session that triggers the generation receives partial previews.
+    """
+    cache_key = ThemeImageCache.key_for(prompt, IMAGE_STYLE_GUIDE, image_bytes)
+    final_prompt = f"{IMAGE_STYLE_GUIDE}\n\nScene details: {prompt}"
+
+    @traced("image.request")
+    async def produce() -> str:
+        logger.info("[ThemeImage] Cache miss for %s. Generating.", cache_key[:12])
+        [(_, upload_bytes, upload_mime)] = await reduce_upload_inputs([("reference.png", image_bytes, image_mime)], "[ThemeImage]")
+        image_b64 = await edit_image_with_openai(
+            image_bytes=upload_bytes,
+            image_mime=upload_mime,
+            image_filename="reference.png",
+            prompt=final_prompt,
+            session_id=session_id,
+            use_cache=not refresh, # A refresh must produce a new image, not the cached response
+            on_partial=on_partial,
+            gate=lambda request: image_scheduler.run(session_id, ImagePriority.THEME, request)
+        )
+        output_bytes = await image_workers.run("b64decode", decode_image_b64, image_b64.encode("ascii"))
+        return await asyncio.to_thread(image_store.put, output_bytes, "image/png")
+
+    return await theme_image_cache.get_or_create(cache_key, produce, refresh=refresh)
+
+async def refresh_initial_theme_image() -> str:
+    """Regenerates the theme-selection image, replacing the cached one (python image_cache.py refresh)."""
+    image_bytes, image_mime = await image_workers.run("load_image", load_image_from_path, "images/aurora.png")
+    return await render_theme_image(INITIAL_IMAGE_PROMPT, image_bytes, image_mime, "cache-refresh", refresh=True)
+
 class RPGSession:
     def __init__(self, session_id: str):
         self.session_id = session_id
 
-        self.messages = []
+        self.memory = StoryMemory() # Bounded story so far, for the agent input
         
         self.current_narration = ""
         self.current_choices = []
@@ -61,11 +132,17 @@ class RPGSession:
         self.reference_image_mime: str | None = None    # Should typically remain 'image/png'
         self.turn_number = 0
         self.game_concluded = False
-        self.storyteller_agent = initialize_storyteller_agent()
+        self.storyteller_agent = get_storyteller_agent() # Shared, stateless definition; game state lives in game_context
         self.theme_selected = False
         self.objectives_explained = False
         self.game_objectives_narration: str | None = None
-        self.last_assistant_response_json: str | None = None
+        self.client_capabilities: set[str] = set() # Negotiated per WebSocket connection in app.py
+        self.speculation = SpeculationEngine(session_id)
+        self.last_turn_id = 0 # turn_id of the last turn shown to the client, for resuming
+        self.last_image_filename: str | None = None # image_store name of the last image for last_turn_id
+        self.session_store = session_store # Replaced by SessionManager with the store it claimed ownership in
+        self.ownership_epoch: int | None = None # Fencing token from the last claim; None saves unconditionally
+        self.ownership_lost = False # Set when another worker has claimed this session since
         
         # Initialize game context
         self.game_context = GameContext()
@@ -87,10 +164,211 @@ class RPGSession:
         task.add_done_callback(self.background_tasks.discard)
         return task
 
+    async def _store_image(self, image_bytes: bytes, mime: str = "image/png") -> str:
+        """Writes the image to the content-addressed store and remembers it for resuming."""
+        self.last_image_filename = await asyncio.to_thread(image_store.put, image_bytes, mime)
+        return self.last_image_filename
+
+    @traced("image.display")
+    async def _store_display_image(self, full_image_bytes: bytes) -> tuple[bytes, str]:
+        """Stores the client-facing copy of a generated image, collapsed to its pixel grid.
+
+        The full-resolution image stays in reference_image_bytes for the next turn's edit.
+        """
+        display_bytes = await pixel_grid_normalizer.normalize_async(full_image_bytes)
+        return display_bytes, await self._store_image(display_bytes)
+
+    def _preview_callback(self, websocket: WebSocket, turn_id: int):
+        """Returns an on_partial callback that forwards image previews to this client, or None if it can't show them."""
+        if CAP_IMAGE_PREVIEWS not in self.client_capabilities:
+            return None
+
+        async def send_preview(partial_b64: str, index: int):
+            if websocket.client_state != WebSocketState.CONNECTED:
+                return
+            try: # A failed preview must never fail the image request itself
+                preview_bytes, preview_mime = await image_workers.run("preview", make_preview_from_b64, partial_b64.encode("ascii"))
+                if CAP_BINARY_IMAGES in self.client_capabilities:
+                    await websocket.send_bytes(encode_binary_frame(FRAME_IMAGE_PREVIEW, turn_id, preview_mime, preview_bytes))
+                else:
+                    await websocket.send_text(json.dumps({
+                        "type": "image_preview",
+                        "content": base64.b64encode(preview_bytes).decode("utf-8"),
+                        "mime": preview_mime,
+                        "index": index,
+                        "turn_id": turn_id,
+                    }))
+            except Exception as e:
+                logger.warning("Failed to send image preview %s for T%s: %s", index, turn_id, e)
+        return send_preview
+
+    @traced("ws.send_image")
+    async def _send_image(self, websocket: WebSocket, image_bytes: bytes, image_b64: str | None, turn_id: int, mime: str = "image/png", stored_filename: str | None = None):
+        """Sends an image by URL, binary frame or base64 JSON, per client capabilities."""
+        if stored_filename is None:
+            stored_filename = await self._store_image(image_bytes, mime)
+        if CAP_IMAGE_URLS in self.client_capabilities:
+            await websocket.send_text(json.dumps({"type": "image", "url": image_store.url_for(stored_filename), "turn_id": turn_id}))
+        elif CAP_BINARY_IMAGES in self.client_capabilities:
+            await websocket.send_bytes(encode_binary_frame(FRAME_IMAGE, turn_id, mime, image_bytes))
+        else:
+            if image_b64 is None:
+                image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+            await websocket.send_text(json.dumps({"type": "image", "content": image_b64, "turn_id": turn_id}))
+
+    def _build_agent_input(self, choice: str, is_theme_turn: bool, game_context: GameContext) -> str:
+        """Builds the agent input for a turn. Pure with respect to session state, so speculation can reuse it."""
+        if is_theme_turn:
+            return build_theme_turn_input(choice)
+
+        # Construct a more focused objective reminder
+        pending_objectives_texts = []
+        if game_context.objectives_initialized and game_context.objectives:
+            for obj in game_context.objectives:
+                if not obj.finished:
+                    pending_objectives_texts.append(f"ID {obj.id}: {obj.objective}")
+        
+        if pending_objectives_texts:
+            objective_reminder = "Lembrete dos objetivos PENDENTES: " + "; ".join(pending_objectives_texts) + "."
+        elif game_context.objectives_initialized:
+            objective_reminder = "Todos os objetivos iniciais parecem estar concluídos! Verifique se a quest deve terminar ou se há algo mais a fazer."
+        else:
+            objective_reminder = "Objetivos ainda não foram definidos."
+
+        story_so_far = self.memory.build_context() # Summary + recent scenes, within STORY_MEMORY_TOKEN_BUDGET
+        
+        return build_turn_input(objective_reminder, story_so_far, choice)
+
+    def _start_speculation(self, choices: list[str]):
+        """Pre-runs the next agent turn for each offered choice on a forked GameContext."""
+        if not SPECULATION_ENABLED or self.game_concluded or not choices:
+            return
+        is_theme_turn = not self.theme_selected
+        next_turn = 1 if is_theme_turn else self.turn_number + 1
+        if next_turn >= MAX_GAME_TURNS:
+            return # The concluding turn ignores the choice, nothing to gain
+
+        def build_branch(choice: str):
+            forked_context = self.game_context.model_copy(deep=True)
+            forked_context.current_turn = next_turn
+            if is_theme_turn:
+                forked_context.theme = choice
+            return forked_context, self._build_agent_input(choice, is_theme_turn, forked_context)
+
+        self.speculation.start(next_turn, choices, build_branch, self._run_speculative_turn)
+
+    @traced("speculation.branch")
+    async def _run_speculative_turn(self, forked_context: GameContext, agent_input: str) -> StoryResponse | None:
+        branch_runner = Runner() # Separate runner so the session's runner.context is left untouched
+        branch_runner.agent = self.storyteller_agent
+        branch_runner.context = forked_context
+        return await get_agent_story_response(branch_runner, forked_context, agent_input, self.memory.turns, self.session_id)
+
+    def to_snapshot(self) -> SessionSnapshot:
+        """Captures the session state needed to resume the game on another connection."""
+        return SessionSnapshot(
+            state={
+                "turn_number": self.turn_number,
+                "last_turn_id": self.last_turn_id,
+                "game_concluded": self.game_concluded,
+                "theme_selected": self.theme_selected,
+                "objectives_explained": self.objectives_explained,
+                "game_objectives_narration": self.game_objectives_narration,
+                "memory": self.memory.to_state(),
+                "current_narration": self.current_narration,
+                "current_choices": self.current_choices,
+                "current_image_prompt": self.current_image_prompt,
+                "current_characters_in_scene": self.current_characters_in_scene,
+                "reference_image_mime": self.reference_image_mime,
+                "last_image_filename": self.last_image_filename,
+                "game_context": self.game_context.model_dump(mode="json"),
+            },
+            reference_image=self.reference_image_bytes,
+        )
+
+    @classmethod
+    def from_snapshot(cls, session_id: str, snapshot: SessionSnapshot) -> "RPGSession":
+        session = cls(session_id)
+        state = snapshot.state
+        session.turn_number = state["turn_number"]
+        session.last_turn_id = state["last_turn_id"]
+        session.game_concluded = state["game_concluded"]
+        session.theme_selected = state["theme_selected"]
+        session.objectives_explained = state["objectives_explained"]
+        session.game_objectives_narration = state["game_objectives_narration"]
+        if "memory" in state:
+            session.memory = StoryMemory.from_state(state["memory"])
+        elif state.get("last_assistant_response_json"): # Snapshots from before StoryMemory
+            session.memory.record(state["turn_number"], "", StoryResponse.model_validate_json(state["last_assistant_response_json"]))
+        session.current_narration = state["current_narration"]
+        session.current_choices = state["current_choices"]
+        session.current_image_prompt = state["current_image_prompt"]
+        session.current_characters_in_scene = state["current_characters_in_scene"]
+        session.reference_image_mime = state["reference_image_mime"]
+        session.last_image_filename = state["last_image_filename"]
+        session.game_context = GameContext.model_validate(state["game_context"])
+        session.runner.context = session.game_context
+        session.reference_image_bytes = snapshot.reference_image
+        return session
+
+    async def save_snapshot(self):
+        if self.ownership_lost:
+            return
+        try:
+            if self.game_concluded:
+                # A finished story is never resumed: drop its snapshot (and reference image) instead of keeping it
+                await self.session_store.delete(self.session_id)
+                return
+            saved = await self.session_store.save(self.session_id, self.to_snapshot(), epoch=self.ownership_epoch)
+            if not saved:
+                self.ownership_lost = True
+                self.speculation.cancel_all()
+                logger.info("Snapshot rejected: session is now owned by another connection (epoch %s is stale).", self.ownership_epoch)
+        except Exception as e:
+            logger.warning("Failed to save session snapshot: %s", e)
+
+    def can_resume(self) -> bool:
+        """True once there is something on screen worth restoring instead of restarting."""
+        return self.theme_selected or self.last_image_filename is not None
+
+    def objectives_message(self, turn_id: int) -> str:
+        """The "objectives" message for the client, serialized."""
+        objectives_data = [{"id": obj.id, "objective": obj.objective, "finished": obj.finished} for obj in self.game_context.objectives]
+        return json.dumps({"type": "objectives", "content": objectives_data, "turn_id": turn_id})
+
+    async def resume_game(self, websocket: WebSocket):
+        """Re-sends the current turn to a reconnecting client instead of starting over."""
+        turn_id = self.last_turn_id
+        logger.info("Resuming game at turn_id %s (turn number %s).", turn_id, self.turn_number)
+        if websocket.client_state != WebSocketState.CONNECTED:
+            return
+        await websocket.send_text(json.dumps({"type": "session_restored", "turn_id": turn_id}))
+        await websocket.send_text(self.objectives_message(turn_id))
+        if self.current_narration:
+            await websocket.send_text(json.dumps({"type": "narration_block", "content": self.current_narration, "turn_id": turn_id}))
+        stored_path = image_store.path_for(self.last_image_filename) if self.last_image_filename else None
+        if stored_path:
+            image_bytes = b""
+            if CAP_IMAGE_URLS not in self.client_capabilities:
+                image_bytes = await asyncio.to_thread(self._read_file, stored_path)
+            await self._send_image(websocket, image_bytes, None, turn_id, image_store.mime_for(self.last_image_filename), self.last_image_filename)
+        if self.current_choices and not self.game_concluded:
+            await websocket.send_text(json.dumps({"type": "choices", "content": self.current_choices, "turn_id": turn_id}))
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
     async def process_user_choice(self, choice: str, turn_id: int, websocket: WebSocket):
         """Process a user's choice and generate the next story segment or conclude the game."""
+        bind_turn(turn_id) # Tags this turn's logs and trace spans, including the image tasks it spawns
+        with span("turn", choice=choice):
+            await self._process_user_choice(choice, turn_id, websocket)
+
+    async def _process_user_choice(self, choice: str, turn_id: int, websocket: WebSocket):
         if self.game_concluded:
-            print(f"[Session {self.session_id}] Game already concluded. Ignoring choice: {choice}")
+            logger.info("Game already concluded. Ignoring choice: %s", choice)
             return
 
         raw_user_choice = choice # Keep the original choice for logging if needed
@@ -101,69 +379,54 @@ class RPGSession:
             self.turn_number = 1 # This is the first gameplay turn number
             self.game_context.current_turn = 1
             self.game_context.theme = raw_user_choice
-            print(f"[Session {self.session_id}] Theme selected: {raw_user_choice}. Processing as Turn Number: {self.turn_number}. Requesting objective explanation.")
-            current_input_for_agent = f"O tema do jogo foi escolhido: '{raw_user_choice}'. Com base neste tema, configure o jogo (ambiente, entidades, quest) conforme suas instruções. IMPORTANTE: Em sua narração para ESTA PRIMEIRA RODADA DE JOGO APÓS A ESCOLHA DO TEMA, você DEVE começar explicando os objetivos gerais do jogo. Após explicar os objetivos, descreva o cenário inicial e forneça as primeiras opções de jogo."
+            logger.info("Theme selected: %s. Processing as Turn Number: %s. Requesting objective explanation.", raw_user_choice, self.turn_number)
+            current_input_for_agent = self._build_agent_input(raw_user_choice, True, self.game_context)
         else:
             self.turn_number += 1
             self.game_context.current_turn = self.turn_number
-            print(f"[Session {self.session_id}] Processing Turn Number: {self.turn_number}")
+            logger.info("Processing Turn Number: %s", self.turn_number)
             if self.turn_number >= MAX_GAME_TURNS:
                 self.game_concluded = True
-                print(f"[Session {self.session_id}] Max turns reached ({MAX_GAME_TURNS}). Concluding game.")
+                logger.info("Max turns reached (%s). Concluding game.", MAX_GAME_TURNS)
                 current_input_for_agent = "A história está chegando ao fim. Forneça uma narração final conclusiva. Não ofereça escolhas. Diga que apesar dos objetivos iniciais não terem sido alcançados, o objetivo de se divertir é o principal e esse foi atingido!"
             else:
-                # Construct a more focused objective reminder
-                pending_objectives_texts = []
-                if self.game_context.objectives_initialized and self.game_context.objectives:
-                    for obj in self.game_context.objectives:
-                        if not obj.finished:
-                            pending_objectives_texts.append(f"ID {obj.id}: {obj.objective}")
-                
-                if pending_objectives_texts:
-                    objective_reminder = "Lembrete dos objetivos PENDENTES: " + "; ".join(pending_objectives_texts) + "."
-                elif self.game_context.objectives_initialized:
-                    objective_reminder = "Todos os objetivos iniciais parecem estar concluídos! Verifique se a quest deve terminar ou se há algo mais a fazer."
-                else:
-                    objective_reminder = "Objetivos ainda não foram definidos."
-
-                previous_narration_summary = "Resumo da cena anterior: Nenhum ainda." # Default if no last response
-                if self.last_assistant_response_json:
-                    try:
-                        last_response_data = json.loads(self.last_assistant_response_json)
-                        previous_narration_summary = "Resumo da cena anterior: " + last_response_data.get("narration", "Não foi possível obter a narração anterior.")[:150] # Summary
-                    except json.JSONDecodeError:
-                        previous_narration_summary = "Resumo da cena anterior: (erro ao processar narração anterior)"
-                
-                current_input_for_agent = (
-                    f"{objective_reminder}\n\n"
-                    f"{previous_narration_summary}\n\n"
-                    f"A escolha do jogador para esta rodada foi: '{raw_user_choice}'.\n"
-                    f"Continue a história a partir daqui, descrevendo o resultado desta escolha e o novo estado da cena. Forneça novas opções. Não explique os objetivos do jogo novamente."
-                )
+                current_input_for_agent = self._build_agent_input(raw_user_choice, False, self.game_context)
         
         self.current_narration = ""
         self.current_choices = []
         self.current_image_prompt = ""
+        self.last_turn_id = turn_id
+        self.last_image_filename = None # The previous turn's image no longer matches this turn
         
+        async def send_narration_delta(delta: str):
+            if websocket.client_state == WebSocketState.CONNECTED:
+                await websocket.send_text(json.dumps({"type": "text", "content": delta, "turn_id": turn_id}))
+
         agent_response_object: StoryResponse | None = None
         try:
             # openai_agent_service currently uses input=current_input_for_agent, 
             # and conversation_history is just for logging in openai_agent_service.
             # The Agent SDK is expected to make the self.storyteller_agent stateful.
-            agent_response_object = await get_agent_story_response(
-                self.runner,
-                self.game_context,
-                current_input_for_agent, 
-                list(self.messages), # Pass current history for context (openai_agent_service currently only logs its length)
-                self.session_id
-            )
+            branch = self.speculation.take(raw_user_choice, self.turn_number, current_input_for_agent)
+            if branch is not None: # Only finished branches are handed back; never wait on one
+                agent_response_object = branch.result()
+                logger.info("Committing speculative branch for choice '%s' (Turn %s).", raw_user_choice, self.turn_number)
+                self.game_context = branch.game_context
+                self.runner.context = self.game_context
+
+            if agent_response_object is None:
+                agent_response_object = await get_agent_story_response(
+                    self.runner,
+                    self.game_context,
+                    current_input_for_agent, 
+                    self.memory.turns, # Recent turns, for logging only; the story so far is already in the input
+                    self.session_id,
+                    on_narration_delta=send_narration_delta if STREAM_NARRATION else None
+                )
             if agent_response_object is None:
                 raise Exception("Agent service returned no response or an error occurred in service.")
 
-            # Log the actual input sent to the agent for this turn, then the agent's response.
-            self.messages.append({"role": "user", "content": current_input_for_agent}) 
-            self.last_assistant_response_json = agent_response_object.model_dump_json()
-            self.messages.append({"role": "assistant", "content": self.last_assistant_response_json})
+            self.memory.record(self.turn_number, raw_user_choice, agent_response_object)
 
             if self.turn_number == 1 and not self.objectives_explained:
                 self.objectives_explained = True
@@ -177,62 +440,55 @@ class RPGSession:
             
             # Send objectives to client FIRST, so it's up-to-date before narration of potential final turn
             if websocket.client_state == WebSocketState.CONNECTED:
-                objectives_data = []
-                for obj in self.game_context.objectives: 
-                    obj_data = {"id": obj.id, "objective": obj.objective, "finished": obj.finished}
-                    objectives_data.append(obj_data)
-                
-                print(f"[Session {self.session_id}] DEBUG: Sending objectives_data to client (Turn {turn_id}): {objectives_data}")
-                await websocket.send_text(json.dumps({
-                    "type": "objectives",
-                    "content": objectives_data,
-                    "turn_id": turn_id 
-                }))
+                logger.debug("Sending objectives to client (Turn %s): %s", turn_id, self.game_context.objectives)
+                await websocket.send_text(self.objectives_message(turn_id))
 
             # Now check for game conclusion based on objectives *after* agent might have updated them
             if self.game_context.quest_state == QuestState.COMPLETED and not self.game_concluded:
                 self.game_concluded = True # Set game_concluded here
-                print(f"[Session {self.session_id}] All objectives completed! Game concluding this turn (Turn {turn_id}).")
+                logger.info("All objectives completed! Game concluding this turn (Turn %s).", turn_id)
                 # Agent should have provided a final narration. Choices should be empty.
                 # If not, the agent didn't follow instructions for final turn properly.
                 if self.current_choices and len(self.current_choices) > 0:
-                    print(f"[Session {self.session_id}] WARNING: Game is concluding, but agent provided choices: {self.current_choices}. Clearing them.")
+                    logger.warning("Game is concluding, but agent provided choices: %s. Clearing them.", self.current_choices)
                     self.current_choices = [] # Ensure no choices on game end
             
-            print(f"[Session {self.session_id}] Parsed characters in scene: {self.current_characters_in_scene}")
+            logger.debug("Parsed characters in scene: %s", self.current_characters_in_scene)
 
             if websocket.client_state == WebSocketState.CONNECTED and self.current_narration:
                 await websocket.send_text(json.dumps({"type": "narration_block", "content": self.current_narration, "turn_id": turn_id }))
 
             if self.current_image_prompt and websocket.client_state == WebSocketState.CONNECTED:
-                print(f"[Session {self.session_id}] Triggering image generation for prompt: '{self.current_image_prompt}' with characters: {self.current_characters_in_scene}")
+                logger.info("Triggering image generation for prompt: '%.80s...' with characters: %s", self.current_image_prompt, self.current_characters_in_scene)
                 self._create_background_task(self.generate_scene(self.current_image_prompt, turn_id, websocket))
             elif not self.current_image_prompt:
-                 print(f"[Session {self.session_id}] No image prompt. Skipping image generation.")
+                 logger.info("No image prompt. Skipping image generation.")
 
             if websocket.client_state == WebSocketState.CONNECTED:
                 # Only send choices if the game is NOT concluded in this very turn
                 if not self.game_concluded and self.current_choices:
                     await websocket.send_text(json.dumps({"type": "choices", "content": self.current_choices, "turn_id": turn_id}))
+                    self._start_speculation(self.current_choices)
                 elif self.game_concluded:
-                    print(f"[Session {self.session_id}] Game concluded this turn. No choices will be sent.")
+                    logger.info("Game concluded this turn. No choices will be sent.")
             else:
-                print(f"[Session {self.session_id}] Skipping sending choices/narration: WebSocket disconnected.")
+                logger.info("Skipping sending choices/narration: WebSocket disconnected.")
+            await self.save_snapshot() # The turn is committed; a reconnect resumes from here
         except Exception as e: 
             error_msg = f"Error processing agent Pydantic response: {str(e)}"
-            print(f"[Session {self.session_id}] !!! {error_msg} (Response object was: {str(agent_response_object)[:500]})")
+            logger.error("!!! %s (Response object was: %.500s)", error_msg, agent_response_object)
             if websocket.client_state == WebSocketState.CONNECTED:
                 try: await websocket.send_text(json.dumps({"type": "error", "content": "Server error processing agent response.", "turn_id": turn_id}))
-                except Exception as send_e: print(f"[Session {self.session_id}] Error sending generic processing error: {send_e}")
+                except Exception as send_e: logger.error("Error sending generic processing error: %s", send_e)
 
     async def start_game(self, websocket: WebSocket):
+        self.speculation.cancel_all()
         self.turn_number = 0 # Initial state before any theme choice is processed by agent
         self.game_concluded = False
         self.theme_selected = False # Reset flag
         self.objectives_explained = False # Reset this flag too
-        self.messages = [] # Clear message history for a new game
+        self.memory.clear() # New game, new story
         self.game_objectives_narration = None
-        self.last_assistant_response_json = None
         self.game_context = GameContext()  # Reset game context
         self.game_context.characters.append(Character(
             name="aurora",
@@ -240,17 +496,22 @@ class RPGSession:
             in_scene=True
         ))
         initial_turn_id_for_theme_selection = 0 # This is for the theme selection UI turn
+        bind_turn(initial_turn_id_for_theme_selection)
+        self.last_turn_id = initial_turn_id_for_theme_selection
+        self.last_image_filename = None
         
         initial_narration = INTRO_PROMPT # e.g., "Escolha seu Tema"
         initial_choices_list = []
         try: 
             initial_choices_list = json.loads(INITIAL_CHOICES) # Theme options
         except json.JSONDecodeError:
-            print(f"[Session {self.session_id}] Error decoding INITIAL_CHOICES. Using default. Value: {INITIAL_CHOICES}")
+            logger.error("Error decoding INITIAL_CHOICES. Using default. Value: %s", INITIAL_CHOICES)
             initial_choices_list = ["Fallback Theme 1", "Fallback Theme 2"]
         
         # This is for the image accompanying the theme selection, not from agent yet.
         initial_image_prompt_text = INITIAL_IMAGE_PROMPT 
+        self.current_narration = initial_narration
+        self.current_choices = initial_choices_list
 
         # Send initial narration (theme prompt)
         if websocket.client_state == WebSocketState.CONNECTED:
@@ -259,56 +520,46 @@ class RPGSession:
         # Image for theme selection screen
         if websocket.client_state == WebSocketState.CONNECTED:
             if USE_PLACEHOLDER_INITIAL_IMAGE or not initial_image_prompt_text: 
-                print(f"[Session {self.session_id}] Using placeholder for initial theme selection image.")
-                img_bytes, img_mime, b64_placeholder = get_placeholder_image_data("images/aurora_first_image.png")
+                logger.info("Using placeholder for initial theme selection image.")
+                img_bytes, img_mime, b64_placeholder = get_placeholder_image_data()
                 if img_bytes and img_mime and b64_placeholder:
                     self.reference_image_bytes = img_bytes
                     self.reference_image_mime = img_mime
-                    try: await websocket.send_text(json.dumps({"type": "image", "content": b64_placeholder, "turn_id": initial_turn_id_for_theme_selection}))
+                    try: await self._send_image(websocket, img_bytes, b64_placeholder, initial_turn_id_for_theme_selection, img_mime)
                     except Exception as e: 
                         error_msg = f"Error sending placeholder: {e}"
-                        print(f"[Session {self.session_id}] {error_msg}")
+                        logger.error("%s", error_msg)
                         await websocket.send_text(json.dumps({"type": "error", "content": error_msg, "turn_id": initial_turn_id_for_theme_selection}))
                         return
                 else: 
                     error_msg = "Error loading placeholder image for theme selection."
-                    print(f"[Session {self.session_id}] {error_msg}")
+                    logger.error("%s", error_msg)
                     await websocket.send_text(json.dumps({"type": "error", "content": error_msg, "turn_id": initial_turn_id_for_theme_selection}))
                     return
             else:
-                print(f"[Session {self.session_id}] Generating initial image for theme selection from prompt: '{initial_image_prompt_text[:50]}...'")
+                logger.info("Generating initial image for theme selection from prompt: '%.50s...'", initial_image_prompt_text)
                 # This generate_image call sets self.reference_image_bytes to Aurora's initial edited image
                 self._create_background_task(self.generate_image(initial_image_prompt_text, "auto", initial_turn_id_for_theme_selection, websocket, base64_image="images/aurora.png"))
         else:
-            print(f"Skipping initial image/placeholder for theme selection: WebSocket disconnected.")
+            logger.info("Skipping initial image/placeholder for theme selection: WebSocket disconnected.")
             return 
         
         # Send initial choices (theme options)
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.send_text(json.dumps({"type": "choices", "content": initial_choices_list, "turn_id": initial_turn_id_for_theme_selection}))
-        
-        # Log the setup for theme selection (not an agent response)
-        initial_setup_log = json.dumps({
-            "narration": initial_narration,
-            "choices": initial_choices_list,
-            "image_prompt": "Theme selection screen - initial image prompt used: " + initial_image_prompt_text
-        })
-        self.messages.append({"role": "assistant", "content": initial_setup_log})
+            self._start_speculation(initial_choices_list)
+        await self.save_snapshot()
 
+    @traced("image.theme")
     async def generate_image(self, prompt: str, background: str, turn_id: int, websocket: WebSocket, base64_image: str = ""):
-        MAX_RETRIES = 2 # Total 3 attempts (1 initial + 2 retries)
-        image_b64 = None
-        last_exception = None
-
         try:
-            final_prompt = f"{IMAGE_STYLE_GUIDE}\n\nScene details: {prompt}"
             if not base64_image: raise ValueError("No base64_image provided to generate_image()")
 
             processed_image_bytes, processed_image_mime = None, None
             if os.path.exists(base64_image):
-                 processed_image_bytes, processed_image_mime = load_image_from_path(base64_image)
+                 processed_image_bytes, processed_image_mime = sprite_registry.get(base64_image) # Preloaded at startup
             else:
-                 processed_image_bytes, processed_image_mime = process_base64_image(base64_image)
+                 processed_image_bytes, processed_image_mime = await image_workers.run("process_base64", process_base64_image, base64_image)
 
             if not processed_image_bytes or not processed_image_mime: 
                 raise ValueError("Failed to load/process base image for generate_image.")
@@ -316,193 +567,155 @@ class RPGSession:
             self.reference_image_bytes = processed_image_bytes 
             self.reference_image_mime = processed_image_mime
 
-            for attempt in range(MAX_RETRIES + 1):
-                print(f"[S {self.session_id}][GenerateImage] Attempt {attempt + 1}/{MAX_RETRIES + 1} for prompt: '{final_prompt[:50]}...'")
-                try:
-                    image_b64 = await edit_image_with_openai(
-                        image_bytes=self.reference_image_bytes,
-                        image_mime=self.reference_image_mime,
-                        image_filename="reference.png",
-                        prompt=final_prompt,
-                        session_id=self.session_id
-                    )
-                    if image_b64:
-                        print(f"[S {self.session_id}][GenerateImage] Attempt {attempt + 1} successful.")
-                        break # Success
-                    else:
-                        # This case might happen if edit_image_with_openai returns None without an exception (e.g. API empty response)
-                        print(f"[S {self.session_id}][GenerateImage] Attempt {attempt + 1} returned None, will retry if attempts remain.")
-                        last_exception = Exception("OpenAI image editing returned None without explicit exception.") # Store a generic exception
-
-                except Exception as e:
-                    last_exception = e
-                    print(f"[S {self.session_id}][GenerateImage] Attempt {attempt + 1} failed: {e}")
-                
-                if attempt < MAX_RETRIES:
-                    await asyncio.sleep(1) # Wait 1 second before retrying
-            
-            if image_b64 is None: 
-                # All retries failed, use the last recorded exception
-                effective_exception = last_exception if last_exception else Exception("OpenAI image editing failed after all retries.")
-                raise effective_exception
-
-            new_image_bytes = base64.b64decode(image_b64)
+            stored_filename = await render_theme_image(prompt, processed_image_bytes, processed_image_mime, self.session_id, on_partial=self._preview_callback(websocket, turn_id))
+            new_image_bytes = await asyncio.to_thread(self._read_file, image_store.path_for(stored_filename))
             self.reference_image_bytes = new_image_bytes 
+            display_bytes, display_filename = await self._store_display_image(new_image_bytes)
+            await self.save_snapshot()
 
             if websocket.client_state == WebSocketState.CONNECTED:
-                try: await websocket.send_text(json.dumps({"type": "image", "content": image_b64, "turn_id": turn_id}))
+                try: await self._send_image(websocket, display_bytes, None, turn_id, stored_filename=display_filename)
                 except RuntimeError as e: 
-                    if "after sending 'websocket.close'." in str(e): print(f"[S {self.session_id}] Failed to send image for T{turn_id}: WS closed.")
+                    if "after sending 'websocket.close'." in str(e): logger.warning("Failed to send image for T%s: WS closed.", turn_id)
                     else: raise
-            else: print(f"[S {self.session_id}] WS no longer connected. Skipping send generated initial image for T{turn_id}.")
-        except asyncio.CancelledError: print(f"[S {self.session_id}] generate_image task cancelled for T{turn_id}.")
+            else: logger.info("WS no longer connected. Skipping send generated initial image for T%s.", turn_id)
+        except asyncio.CancelledError: logger.info("generate_image task cancelled for T%s.", turn_id)
         except Exception as e:
             error_msg = f"Error generating image: {e}"
-            print(f"[S {self.session_id}] {error_msg}")
+            logger.error("%s", error_msg)
+            FAILURES.labels("image").inc() # Once per image the player doesn't get, after the retry policy gave up
             if websocket.client_state == WebSocketState.CONNECTED:
                 try: await websocket.send_text(json.dumps({"type": "error", "content": error_msg, "turn_id": turn_id}))
                 except RuntimeError as e_send:
-                    if "after sending 'websocket.close'." in str(e_send): print(f"[S {self.session_id}] Failed to send error for T{turn_id} (initial image): WS closed.")
+                    if "after sending 'websocket.close'." in str(e_send): logger.error("Failed to send error for T%s (initial image): WS closed.", turn_id)
                     else: raise
-            else: print(f"[S {self.session_id}] WS no longer connected. Skipping send error for initial image for T{turn_id}.")
+            else: logger.warning("WS no longer connected. Skipping send error for initial image for T%s.", turn_id)
+
+    def assemble_scene_request(self, prompt: str) -> tuple[list[tuple[str, bytes, str]], str, str | None]:
+        """Image inputs (filename, bytes, mime) and prompt text for this turn's scene.
+
+        Returns an error message instead when there is no usable reference image.
+        """
+        api_image_inputs = []
+        temp_filenames_for_logging = []
+        base_image_added_for_api = False # Tracks if any image suitable as a base has been added
+
+        if self.turn_number == 1:
+            logger.info("Turn 1: Not using theme image as base. Will rely on character sprites (if any) and prompt.")
+            # For Turn 1, we intentionally do not add 'previous_scene_output.png' (the theme image).
+            # Character sprites added later will be the only image inputs.
+        elif self.turn_number > 1:
+            if self.reference_image_bytes and self.reference_image_mime:
+                api_image_inputs.append(
+                    ("previous_scene_output.png", self.reference_image_bytes, self.reference_image_mime)
+                )
+                temp_filenames_for_logging.append("previous_scene_output.png")
+                base_image_added_for_api = True
+                logger.info("Turn > 1: Using previous scene output as the base image for editing for Turn %s.", self.turn_number)
+            else:
+                # This is a critical error for turns > 1, as a base image is expected.
+                return [], "", f"Cannot generate scene for Turn {self.turn_number}: Previous turn's image (self.reference_image_bytes) is not available."
+        
+        # Add original reference images for all characters currently in the scene.
+        # For Turn 1, these will be the *only* images if any characters are present.
+        # For Turn > 1, these supplement the previous scene's output.
+        characters_processed_for_sprites = set()
+        for char_name in self.current_characters_in_scene:
+            if char_name in characters_processed_for_sprites:
+                continue
+
+            char_image_path = CHARACTER_IMAGE_PATHS.get(char_name)
+            if char_image_path:
+                # Check if this character's sprite is already the base (e.g. if previous_scene_output was Aurora and char_name is Aurora)
+                # This specific check might be complex and depends on how images are named/identified.
+                # For simplicity, we add all distinct character sprites from current_characters_in_scene.
+                # The API/prompt should handle an existing character in the base image being re-specified by a sprite.
+                
+                char_bytes, char_mime = sprite_registry.get(char_image_path) # Preloaded at startup; no per-turn decode
+                if char_bytes and char_mime:
+                    sprite_filename = f"{char_name}_original_ref.png"
+                    # Avoid adding the exact same image data twice if, for example, Aurora is the base AND in current_characters_in_scene.
+                    # This check is a bit superficial as it only checks filename, not content.
+                    # However, openai_service.py passes a list, and the DALL-E API might handle redundancy.
+                    is_duplicate_of_base = False
+                    if self.turn_number > 1 and base_image_added_for_api and api_image_inputs[0][0] == "previous_scene_output.png":
+                        # A more robust check would involve comparing image hashes if this becomes an issue.
+                        # For now, assume adding specific character sprites is beneficial for prompting.
+                        pass # Allow adding, prompt will clarify
+
+                    if not is_duplicate_of_base: # Simplified: always add if char is in scene
+                        api_image_inputs.append((sprite_filename, char_bytes, char_mime))
+                        temp_filenames_for_logging.append(sprite_filename)
+                        characters_processed_for_sprites.add(char_name)
+                        if not base_image_added_for_api: # If this is the first image being added (e.g. Turn 1)
+                            base_image_added_for_api = True
+                        logger.debug("Added %s for image generation context.", sprite_filename)
+                    else:
+                        logger.debug("Skipped adding %s as it might duplicate the base image logic.", sprite_filename)
+                else: 
+                    logger.warning("Original image for %s not found/loaded at path: %s.", char_name, char_image_path)
+            else: 
+                logger.info("No image path defined in CHARACTER_IMAGE_PATHS for char: %s.", char_name)
+        
+        # If after all attempts, api_image_inputs is empty, we cannot proceed.
+        # This could happen on Turn 1 if no characters are in the scene.
+        if not api_image_inputs:
+            return [], "", "Cannot generate scene: No reference images (neither previous scene for T>1, nor character sprites for T1) are available."
+
+        # Construct the text prompt
+        prompt_character_descriptions = character_descriptions_for(self.current_characters_in_scene)
+        characters_for_prompt_string = ". ".join(prompt_character_descriptions)
+        
+        final_scene_prompt_text = f"{IMAGE_STYLE_GUIDE}\n\nCharacters to include: {characters_for_prompt_string}.\nScene details based on story: {prompt}"
 
-    async def generate_scene(self, prompt: str, turn_id: int, websocket: WebSocket):
-        MAX_RETRIES = 2 # Total 3 attempts
-        image_b64 = None
-        last_exception = None
+        logger.debug("Image prompt: %s", final_scene_prompt_text)
+        logger.debug("Images sent to service: %s", temp_filenames_for_logging)
+        return api_image_inputs, final_scene_prompt_text, None
 
+    @traced("image.scene")
+    async def generate_scene(self, prompt: str, turn_id: int, websocket: WebSocket):
         try:
-            api_image_inputs = []
-            temp_filenames_for_logging = []
-            base_image_added_for_api = False # Tracks if any image suitable as a base has been added
-
-            if self.turn_number == 1:
-                print(f"[S {self.session_id}] Turn 1: Not using theme image as base. Will rely on character sprites (if any) and prompt.")
-                # For Turn 1, we intentionally do not add 'previous_scene_output.png' (the theme image).
-                # Character sprites added later will be the only image inputs.
-            elif self.turn_number > 1:
-                if self.reference_image_bytes and self.reference_image_mime:
-                    api_image_inputs.append(
-                        ("previous_scene_output.png", io.BytesIO(self.reference_image_bytes), self.reference_image_mime)
-                    )
-                    temp_filenames_for_logging.append("previous_scene_output.png")
-                    base_image_added_for_api = True
-                    print(f"[S {self.session_id}] Turn > 1: Using previous scene output as the base image for editing for Turn {self.turn_number}.")
-                else:
-                    # This is a critical error for turns > 1, as a base image is expected.
-                    error_msg = f"Cannot generate scene for Turn {self.turn_number}: Previous turn's image (self.reference_image_bytes) is not available."
-                    print(f"[Session {self.session_id}] {error_msg}")
-                    if websocket.client_state == WebSocketState.CONNECTED:
-                        await websocket.send_text(json.dumps({"type": "error", "content": error_msg, "turn_id": turn_id}))
-                    return # Stop if no base image for T > 1
-            
-            # Add original reference images for all characters currently in the scene.
-            # For Turn 1, these will be the *only* images if any characters are present.
-            # For Turn > 1, these supplement the previous scene's output.
-            characters_processed_for_sprites = set()
-            for char_name in self.current_characters_in_scene:
-                if char_name in characters_processed_for_sprites:
-                    continue
-
-                char_image_path = CHARACTER_IMAGE_PATHS.get(char_name)
-                if char_image_path:
-                    # Check if this character's sprite is already the base (e.g. if previous_scene_output was Aurora and char_name is Aurora)
-                    # This specific check might be complex and depends on how images are named/identified.
-                    # For simplicity, we add all distinct character sprites from current_characters_in_scene.
-                    # The API/prompt should handle an existing character in the base image being re-specified by a sprite.
-                    
-                    char_bytes, char_mime = load_image_from_path(char_image_path)
-                    if char_bytes and char_mime:
-                        sprite_filename = f"{char_name}_original_ref.png"
-                        # Avoid adding the exact same image data twice if, for example, Aurora is the base AND in current_characters_in_scene.
-                        # This check is a bit superficial as it only checks filename, not content.
-                        # However, openai_service.py passes a list, and the DALL-E API might handle redundancy.
-                        is_duplicate_of_base = False
-                        if self.turn_number > 1 and base_image_added_for_api and api_image_inputs[0][0] == "previous_scene_output.png":
-                            # A more robust check would involve comparing image hashes if this becomes an issue.
-                            # For now, assume adding specific character sprites is beneficial for prompting.
-                            pass # Allow adding, prompt will clarify
-
-                        if not is_duplicate_of_base: # Simplified: always add if char is in scene
-                            api_image_inputs.append((sprite_filename, io.BytesIO(char_bytes), char_mime))
-                            temp_filenames_for_logging.append(sprite_filename)
-                            characters_processed_for_sprites.add(char_name)
-                            if not base_image_added_for_api: # If this is the first image being added (e.g. Turn 1)
-                                base_image_added_for_api = True
-                            print(f"[S {self.session_id}] Added {sprite_filename} for image generation context.")
-                        else:
-                            print(f"[S {self.session_id}] Skipped adding {sprite_filename} as it might duplicate the base image logic.")
-                    else: 
-                        print(f"[S {self.session_id}] Original image for {char_name} not found/loaded at path: {char_image_path}.")
-                else: 
-                    print(f"[S {self.session_id}] No image path defined in CHARACTER_IMAGE_PATHS for char: {char_name}.")
-            
-            # If after all attempts, api_image_inputs is empty, we cannot proceed.
-            # This could happen on Turn 1 if no characters are in the scene.
-            if not api_image_inputs:
-                error_msg = "Cannot generate scene: No reference images (neither previous scene for T>1, nor character sprites for T1) are available."
-                print(f"[Session {self.session_id}] {error_msg}")
+            assemble_span = start_span("scene.assemble_inputs")
+            api_image_inputs, final_scene_prompt_text, error_msg = self.assemble_scene_request(prompt)
+            end_span(assemble_span, inputs=len(api_image_inputs))
+            if error_msg:
+                logger.error("%s", error_msg)
+                FAILURES.labels("image").inc()
                 if websocket.client_state == WebSocketState.CONNECTED:
                     await websocket.send_text(json.dumps({"type": "error", "content": error_msg, "turn_id": turn_id}))
                 return
 
-            # Construct the text prompt
-            prompt_character_descriptions = []
-            for char_name in self.current_characters_in_scene:
-                if char_name in DETAILED_CHARACTER_DESCRIPTIONS:
-                    prompt_character_descriptions.append(DETAILED_CHARACTER_DESCRIPTIONS[char_name])
-                else:
-                    prompt_character_descriptions.append(char_name)
-            characters_for_prompt_string = ". ".join(prompt_character_descriptions)
-            
-            final_scene_prompt_text = f"{IMAGE_STYLE_GUIDE}\n\nCharacters to include: {characters_for_prompt_string}.\nScene details based on story: {prompt}"
-
-            print(f"[S {self.session_id}] Image prompt: {final_scene_prompt_text}")
-            print(f"[S {self.session_id}] Images sent to service: {temp_filenames_for_logging}")
-
-            for attempt in range(MAX_RETRIES + 1):
-                print(f"[S {self.session_id}][GenerateScene] Attempt {attempt + 1}/{MAX_RETRIES + 1} for turn {turn_id}")
-                try:
-                    image_b64 = await edit_image_with_multiple_inputs_openai(
-                        image_files_for_api=api_image_inputs, 
-                        prompt=final_scene_prompt_text,
-                        session_id=self.session_id
-                    )
-                    if image_b64:
-                        print(f"[S {self.session_id}][GenerateScene] Attempt {attempt + 1} successful for turn {turn_id}.")
-                        break # Success
-                    else:
-                        print(f"[S {self.session_id}][GenerateScene] Attempt {attempt + 1} for turn {turn_id} returned None, will retry if attempts remain.")
-                        last_exception = Exception("OpenAI multi-image editing returned None without explicit exception.")
+            api_image_inputs = await reduce_upload_inputs(api_image_inputs, "[GenerateScene]")
 
-                except Exception as e:
-                    last_exception = e
-                    print(f"[S {self.session_id}][GenerateScene] Attempt {attempt + 1} for turn {turn_id} failed: {e}")
-                
-                if attempt < MAX_RETRIES:
-                    await asyncio.sleep(1) # Wait 1 second before retrying
-
-            if image_b64 is None: 
-                effective_exception = last_exception if last_exception else Exception("OpenAI multi-image editing failed after all retries for generate_scene.")
-                raise effective_exception
+            with span("image.request"): # Cache lookup, then scheduler queueing, retries and hedges around image.api
+                image_b64 = await edit_image_with_multiple_inputs_openai(
+                    image_inputs=api_image_inputs,
+                    prompt=final_scene_prompt_text,
+                    session_id=self.session_id,
+                    on_partial=self._preview_callback(websocket, turn_id),
+                    gate=lambda request: image_scheduler.run(self.session_id, ImagePriority.SCENE, request)
+                )
 
-            self.reference_image_bytes = base64.b64decode(image_b64)
+            self.reference_image_bytes = await image_workers.run("b64decode", decode_image_b64, image_b64.encode("ascii"))
             self.reference_image_mime = "image/png" # Assuming service returns PNG
-            print(f"[Session {self.session_id}] self.reference_image_bytes updated by generate_scene output for turn {turn_id}.")
+            logger.debug("self.reference_image_bytes updated by generate_scene output for turn %s.", turn_id)
+            display_bytes, display_filename = await self._store_display_image(self.reference_image_bytes)
+            await self.save_snapshot()
 
             if websocket.client_state == WebSocketState.CONNECTED:
-                try: await websocket.send_text(json.dumps({"type": "image", "content": image_b64, "turn_id": turn_id}))
+                try: await self._send_image(websocket, display_bytes, None, turn_id, stored_filename=display_filename)
                 except RuntimeError as e:
-                    if "after sending 'websocket.close'." in str(e): print(f"[S {self.session_id}] Failed to send scene image for T{turn_id}: WS closed.")
+                    if "after sending 'websocket.close'." in str(e): logger.warning("Failed to send scene image for T%s: WS closed.", turn_id)
                     else: raise
-            else: print(f"[S {self.session_id}] WS no longer connected. Skipping send generated scene image for T{turn_id}.")
-        except asyncio.CancelledError: print(f"[S {self.session_id}] generate_scene task cancelled for T{turn_id}.")
+            else: logger.info("WS no longer connected. Skipping send generated scene image for T%s.", turn_id)
+        except asyncio.CancelledError: logger.info("generate_scene task cancelled for T%s.", turn_id)
         except Exception as e:
             error_msg = f"Error generating scene image: {e}"
-            print(f"[S {self.session_id}] {error_msg}")
+            logger.error("%s", error_msg)
+            FAILURES.labels("image").inc() # Once per image the player doesn't get, after the retry policy gave up
             if websocket.client_state == WebSocketState.CONNECTED:
                 try: await websocket.send_text(json.dumps({"type": "error", "content": error_msg, "turn_id": turn_id}))
                 except RuntimeError as e_send:
-                    if "after sending 'websocket.close'." in str(e_send): print(f"[S {self.session_id}] Failed to send error for T{turn_id} (scene image): WS closed.")
+                    if "after sending 'websocket.close'." in str(e_send): logger.error("Failed to send error for T%s (scene image): WS closed.", turn_id)
                     else: raise 
-            else: print(f"[S {self.session_id}] WS no longer connected. Skipping send error for scene image for T{turn_id}.") 
\ No newline at end of file
+            else: logger.warning("WS no longer connected. Skipping send error for scene image for T%s.", turn_id) 
\ No newline at end of file
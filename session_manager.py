@@ -0,0 +1,86 @@
+from rpg_session import RPGSession
+from session_store import SessionStore, session_store, WORKER_ID
+from app_logging import get_logger
+
+logger = get_logger("sessions")
+
+class SessionManager:
+    """Owns the RPGSession objects this worker is currently serving.
+
+    The authoritative copy of a session lives in the shared SessionStore, so any worker
+    can serve any session: acquire() claims ownership in the store (bumping its epoch)
+    and rebuilds the session from the latest snapshot when it isn't already live here.
+    A worker that loses a session to a reconnect elsewhere finds out on its next save
+    (see RPGSession.save_snapshot). A sticky load balancer keyed on the /ws path keeps
+    migrations rare, but nothing depends on it.
+    """
+
+    def __init__(self, store: SessionStore, worker_id: str):
+        self.store = store
+        self.worker_id = worker_id
+        self._sessions: dict[str, RPGSession] = {}
+        self._connections: dict[str, int] = {}
+        self.created = 0
+        self.restored = 0
+
+    async def acquire(self, session_id: str) -> RPGSession:
+        """Returns the session for a new connection, claiming it for this worker."""
+        epoch = await self.store.claim(session_id, self.worker_id)
+        session = self._sessions.get(session_id)
+        if session is not None and session.ownership_epoch and epoch != session.ownership_epoch + 1:
+            # Another worker owned it in between; our live copy is stale.
+            logger.info("Session %s was served elsewhere since epoch %s. Reloading.", session_id, session.ownership_epoch)
+            session.speculation.cancel_all()
+            session = None
+        if session is None:
+            snapshot = await self.store.load(session_id)
+            if snapshot is not None:
+                logger.info("Restoring session %s from snapshot (epoch %s).", session_id, epoch)
+                session = RPGSession.from_snapshot(session_id, snapshot)
+                self.restored += 1
+            else:
+                logger.info("New session: %s. Creating RPGSession.", session_id)
+                session = RPGSession(session_id)
+                self.created += 1
+            session.session_store = self.store
+            self._sessions[session_id] = session
+        else:
+            logger.info("Reusing live session %s (epoch %s).", session_id, epoch)
+        session.ownership_epoch = epoch
+        session.ownership_lost = False
+        self._connections[session_id] = self._connections.get(session_id, 0) + 1
+        return session
+
+    def release(self, session_id: str):
+        """Drops the live copy once its last connection on this worker has gone."""
+        remaining = self._connections.get(session_id, 0) - 1
+        if remaining > 0:
+            self._connections[session_id] = remaining
+            return
+        self._connections.pop(session_id, None)
+        if self._sessions.pop(session_id, None) is not None:
+            logger.info("Session %s released by worker %s.", session_id, self.worker_id)
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def sessions(self) -> list[RPGSession]:
+        return list(self._sessions.values())
+
+    def connection_count(self) -> int:
+        return sum(self._connections.values())
+
+    def background_task_count(self) -> int:
+        return sum(len(session.background_tasks) for session in self._sessions.values())
+
+    def stats(self) -> dict:
+        return {
+            "worker_id": self.worker_id,
+            "store": type(self.store).__name__,
+            "live_sessions": len(self._sessions),
+            "created": self.created,
+            "restored": self.restored,
+        }
+
+# Shared by the WebSocket endpoint in this worker process.
+session_manager = SessionManager(session_store, WORKER_ID)
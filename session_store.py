@@ -0,0 +1,257 @@
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import struct
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+from config import SESSION_STORE_BACKEND, SESSION_STORE_PATH
+
+@dataclass
+class SessionSnapshot:
+    """Everything needed to rebuild an RPGSession: JSON-able state plus the reference image."""
+    state: dict
+    reference_image: Optional[bytes] = None
+
+    _HEADER = struct.Struct("!I") # Length of the JSON state that precedes the image bytes
+
+    def to_blob(self) -> bytes:
+        state_bytes = json.dumps(self.state, ensure_ascii=False).encode("utf-8")
+        return self._HEADER.pack(len(state_bytes)) + state_bytes + (self.reference_image or b"")
+
+    @classmethod
+    def from_blob(cls, blob: bytes) -> "SessionSnapshot":
+        (state_len,) = cls._HEADER.unpack_from(blob, 0)
+        state_end = cls._HEADER.size + state_len
+        state = json.loads(blob[cls._HEADER.size:state_end].decode("utf-8"))
+        return cls(state=state, reference_image=blob[state_end:] or None)
+
+class SessionStore(ABC):
+    """Where session snapshots live between connections, shared by every worker that can serve a session.
+
+    Ownership is fenced with an epoch: each claim() bumps it, and save() with a stale
+    epoch is rejected, so a worker that lost a session to a reconnect elsewhere can't
+    overwrite the new owner's state.
+    """
+
+    @abstractmethod
+    async def claim(self, session_id: str, owner: str) -> int:
+        """Makes `owner` the session's owner and returns the new ownership epoch."""
+
+    @abstractmethod
+    async def save(self, session_id: str, snapshot: SessionSnapshot, epoch: Optional[int] = None) -> bool:
+        """Stores the snapshot. Returns False (and stores nothing) if `epoch` is no longer current."""
+
+    @abstractmethod
+    async def load(self, session_id: str) -> Optional[SessionSnapshot]: ...
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None: ...
+
+    @abstractmethod
+    async def purge(self, older_than: float) -> int:
+        """Deletes sessions last saved (or claimed) before the `older_than` timestamp. Returns how many."""
+
+class NullSessionStore(SessionStore):
+    """Keeps nothing: every reconnect starts a new game (the original behaviour). Single worker only."""
+
+    async def claim(self, session_id: str, owner: str) -> int:
+        return 0
+
+    async def save(self, session_id: str, snapshot: SessionSnapshot, epoch: Optional[int] = None) -> bool:
+        return True
+
+    async def load(self, session_id: str) -> Optional[SessionSnapshot]:
+        return None
+
+    async def delete(self, session_id: str) -> None:
+        return None
+
+    async def purge(self, older_than: float) -> int:
+        return 0
+
+class InMemorySessionStore(SessionStore):
+    """Process-local stand-in with the same semantics as the shared backends, for tests and single-worker runs."""
+
+    def __init__(self):
+        self._snapshots: dict[str, bytes] = {}
+        self._owners: dict[str, tuple[str, int]] = {}
+        self._touched: dict[str, float] = {}
+
+    async def claim(self, session_id: str, owner: str) -> int:
+        epoch = self._owners.get(session_id, ("", 0))[1] + 1
+        self._owners[session_id] = (owner, epoch)
+        self._touched[session_id] = time.time()
+        return epoch
+
+    async def save(self, session_id: str, snapshot: SessionSnapshot, epoch: Optional[int] = None) -> bool:
+        if epoch is not None and self._owners.get(session_id, ("", 0))[1] != epoch:
+            return False
+        self._snapshots[session_id] = snapshot.to_blob() # Serialized, like the real backends, so state is never shared by reference
+        self._touched[session_id] = time.time()
+        return True
+
+    async def load(self, session_id: str) -> Optional[SessionSnapshot]:
+        blob = self._snapshots.get(session_id)
+        return SessionSnapshot.from_blob(blob) if blob else None
+
+    async def delete(self, session_id: str) -> None:
+        self._snapshots.pop(session_id, None)
+        self._owners.pop(session_id, None)
+        self._touched.pop(session_id, None)
+
+    async def purge(self, older_than: float) -> int:
+        expired = [session_id for session_id, touched in self._touched.items() if touched < older_than]
+        for session_id in expired:
+            await self.delete(session_id)
+        return len(expired)
+
+class SQLiteSessionStore(SessionStore):
+    """Snapshots in a SQLite file (WAL mode), shared by every worker process on the host.
+
+    All database work runs off the event loop.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " snapshot BLOB NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_owners ("
+                " session_id TEXT PRIMARY KEY,"
+                " owner TEXT NOT NULL,"
+                " epoch INTEGER NOT NULL,"
+                " claimed_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None) # Explicit transactions below
+
+    def _claim_sync(self, session_id: str, owner: str) -> int:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO session_owners (session_id, owner, epoch, claimed_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET owner = excluded.owner, epoch = epoch + 1, claimed_at = excluded.claimed_at",
+                (session_id, owner, time.time()),
+            )
+            (epoch,) = conn.execute("SELECT epoch FROM session_owners WHERE session_id = ?", (session_id,)).fetchone()
+            conn.execute("COMMIT")
+            return epoch
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _save_sync(self, session_id: str, blob: bytes, epoch: Optional[int]) -> bool:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE") # Serializes the epoch check and the write across processes
+            if epoch is not None:
+                row = conn.execute("SELECT epoch FROM session_owners WHERE session_id = ?", (session_id,)).fetchone()
+                if not row or row[0] != epoch:
+                    conn.execute("ROLLBACK")
+                    return False
+            conn.execute(
+                "INSERT INTO sessions (session_id, snapshot, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET snapshot = excluded.snapshot, updated_at = excluded.updated_at",
+                (session_id, blob, time.time()),
+            )
+            conn.execute("COMMIT")
+            return True
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _load_sync(self, session_id: str) -> Optional[bytes]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT snapshot FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def _delete_sync(self, session_id: str):
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM session_owners WHERE session_id = ?", (session_id,))
+        finally:
+            conn.close()
+
+    def _purge_sync(self, older_than: float) -> int:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            removed = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (older_than,)).rowcount
+            # Owners of sessions that were claimed but never saved, or whose snapshot just went
+            conn.execute(
+                "DELETE FROM session_owners WHERE claimed_at < ? AND session_id NOT IN (SELECT session_id FROM sessions)",
+                (older_than,),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        if removed:
+            self._vacuum()
+        return removed
+
+    def _vacuum(self):
+        """Returns the freed snapshot pages to the filesystem; the file otherwise only grows."""
+        conn = self._connect()
+        try:
+            conn.execute("VACUUM")
+        except sqlite3.OperationalError:
+            pass # Another worker holds a transaction; the next sweep tries again
+        finally:
+            conn.close()
+
+    async def claim(self, session_id: str, owner: str) -> int:
+        return await asyncio.to_thread(self._claim_sync, session_id, owner)
+
+    async def save(self, session_id: str, snapshot: SessionSnapshot, epoch: Optional[int] = None) -> bool:
+        return await asyncio.to_thread(self._save_sync, session_id, snapshot.to_blob(), epoch)
+
+    async def load(self, session_id: str) -> Optional[SessionSnapshot]:
+        blob = await asyncio.to_thread(self._load_sync, session_id)
+        return SessionSnapshot.from_blob(blob) if blob else None
+
+    async def delete(self, session_id: str) -> None:
+        await asyncio.to_thread(self._delete_sync, session_id)
+
+    async def purge(self, older_than: float) -> int:
+        return await asyncio.to_thread(self._purge_sync, older_than)
+
+def create_session_store(backend: str = SESSION_STORE_BACKEND) -> SessionStore:
+    if backend == "sqlite":
+        return SQLiteSessionStore(SESSION_STORE_PATH)
+    if backend == "memory":
+        return InMemorySessionStore()
+    if backend == "none":
+        return NullSessionStore()
+    raise ValueError(f"Unknown SESSION_STORE_BACKEND: {backend}")
+
+# Identifies this worker process as a session owner.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Shared by the WebSocket endpoint and every RPGSession in the process.
+session_store = create_session_store()
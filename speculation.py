@@ -0,0 +1,109 @@
+import asyncio
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Optional
+
+from config import (
+    SPECULATION_MAX_BRANCHES,
+    SPECULATION_MAX_CONCURRENCY,
+    SPECULATION_MAX_RUNS_PER_SESSION,
+)
+from openai_agent_service import GameContext, StoryResponse
+from app_logging import get_logger
+
+logger = get_logger("speculation")
+
+# Caps speculative agent runs across every session in the process, so speculation
+# never competes with real turns for more than this many provider slots.
+_speculation_slots = asyncio.Semaphore(SPECULATION_MAX_CONCURRENCY)
+
+@dataclass
+class SpeculativeBranch:
+    """The next agent turn for one offered choice, run ahead of time on a forked GameContext."""
+    choice: str
+    turn_number: int
+    game_context: GameContext
+    agent_input: str
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    def result(self) -> Optional[StoryResponse]:
+        """The finished branch's response, or None if it failed or hasn't finished."""
+        if self.task is None or not self.task.done() or self.task.cancelled() or self.task.exception() is not None:
+            return None
+        return self.task.result()
+
+class SpeculationEngine:
+    """Runs the next turn for each offered choice while the player is still reading.
+
+    When the player picks, take() hands back the matching branch if it has already
+    finished and cancels the rest. A branch still running (or still waiting for a
+    speculation slot) is dropped: waiting for it could leave the real turn queued
+    behind other sessions' speculation, and it couldn't stream narration.
+    Spend is bounded per session (SPECULATION_MAX_RUNS_PER_SESSION) and concurrency
+    across the process (SPECULATION_MAX_CONCURRENCY).
+    """
+
+    def __init__(self, session_id: str, max_branches: int = SPECULATION_MAX_BRANCHES, max_runs: int = SPECULATION_MAX_RUNS_PER_SESSION):
+        self.session_id = session_id
+        self.max_branches = max_branches
+        self.max_runs = max_runs
+        self.runs_started = 0
+        self.hits = 0
+        self.misses = 0
+        self.unfinished = 0
+        self._branches: dict[str, SpeculativeBranch] = {}
+
+    def start(
+        self,
+        turn_number: int,
+        choices: list[str],
+        build_branch: Callable[[str], tuple[GameContext, str]],
+        run_branch: Callable[[GameContext, str], Awaitable[Optional[StoryResponse]]],
+    ):
+        """Starts one branch per choice, up to max_branches and the remaining run budget.
+
+        build_branch is called synchronously for each choice and must return a forked
+        GameContext plus the exact agent input the real turn would use.
+        """
+        self.cancel_all()
+        for choice in choices[:self.max_branches]:
+            if self.runs_started >= self.max_runs:
+                logger.info("Run budget (%s) exhausted. Not speculating further.", self.max_runs)
+                break
+            forked_context, agent_input = build_branch(choice)
+            branch = SpeculativeBranch(choice, turn_number, forked_context, agent_input)
+            branch.task = asyncio.create_task(self._run_limited(run_branch, forked_context, agent_input))
+            self._branches[choice] = branch
+            self.runs_started += 1
+        if self._branches:
+            logger.info("Started %s branch(es) for turn %s. Runs used: %s/%s.", len(self._branches), turn_number, self.runs_started, self.max_runs)
+
+    async def _run_limited(self, run_branch, forked_context: GameContext, agent_input: str) -> Optional[StoryResponse]:
+        async with _speculation_slots:
+            return await run_branch(forked_context, agent_input)
+
+    def take(self, choice: str, turn_number: int, agent_input: str) -> Optional[SpeculativeBranch]:
+        """Claims the finished branch matching the player's choice (if it is still valid) and cancels the others."""
+        if not self._branches:
+            return None
+        branch = self._branches.pop(choice, None)
+        self.cancel_all()
+        if branch and branch.turn_number == turn_number and branch.agent_input == agent_input:
+            if branch.result() is not None:
+                self.hits += 1
+                return branch
+            if not branch.task.done():
+                self.unfinished += 1
+                logger.info("Branch for '%s' hasn't finished. Running the turn live instead.", choice)
+        if branch:
+            branch.task.cancel()
+        self.misses += 1
+        return None
+
+    def cancel_all(self):
+        for branch in self._branches.values():
+            if branch.task and not branch.task.done():
+                branch.task.cancel()
+        self._branches.clear()
+
+    def stats(self) -> dict:
+        return {"runs_started": self.runs_started, "hits": self.hits, "misses": self.misses, "unfinished": self.unfinished, "in_flight": len(self._branches)}
@@ -12,8 +12,9 @@ document.addEventListener('DOMContentLoaded', () => {
     // Global turn counter for unique IDs
     let turnIdCounter = 0;
 
-    // Generate a random session ID
-    const sessionId = Math.random().toString(36).substring(2, 15);
+    // Session ID survives reloads within the tab so the server can resume the game from its snapshot
+    const sessionId = sessionStorage.getItem('aurora-session-id') || Math.random().toString(36).substring(2, 15);
+    sessionStorage.setItem('aurora-session-id', sessionId);
 
     // WebSocket connection
     let socket;
@@ -24,6 +25,13 @@ document.addEventListener('DOMContentLoaded', () => {
     let isGameFinished = false;
     const PLACEHOLDER_IMG_SRC = 'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNk+A8AAQUBAScY42YAAAAASUVORK5CYII=';
 
+    // Binary image frames (see ws_protocol.py): u8 version, u8 type, u32 turn_id, u8 mime length, mime, payload
+    // image_urls: images arrive as cacheable /media URLs; binary_images is the fallback if the server lacks it
+    const CLIENT_CAPABILITIES = ['image_urls', 'binary_images', 'image_previews'];
+    const BINARY_PROTOCOL_VERSION = 1;
+    const BINARY_FRAME_TYPES = { 1: 'image', 2: 'image_preview' };
+    let objectUrls = []; // Object URLs created for binary images, revoked on reconnect
+
     // Typing effect settings
     const TYPING_DELAY_MS = 20; // milliseconds between characters
     let activeTypingAbortController = null; // To cancel ongoing typing if needed
@@ -31,6 +39,7 @@ document.addEventListener('DOMContentLoaded', () => {
     // State for coordinating narration and choices display
     let turnNarrationStatus = {}; // E.g., { 0: "typing" | "complete" }
     let pendingChoices = {};    // E.g., { 0: [...] }
+    let streamedNarration = {}; // Narration text received so far via 'text' deltas, by turn_id
 
     // Check initial screen width to set menu state - REMOVED as menu now starts closed by default
     /*
@@ -121,8 +130,9 @@ document.addEventListener('DOMContentLoaded', () => {
     // Connect to WebSocket
     function connectWebSocket() {
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-        const wsUrl = `${protocol}//${window.location.host}/ws/${sessionId}`;
+        const wsUrl = `${protocol}//${window.location.host}/ws/${sessionId}?caps=${CLIENT_CAPABILITIES.join(',')}`;
         socket = new WebSocket(wsUrl);
+        socket.binaryType = 'arraybuffer';
         socket.onopen = () => {
             isConnected = true;
             connectionStatus.textContent = 'Connected';
@@ -131,9 +141,12 @@ document.addEventListener('DOMContentLoaded', () => {
             console.log("[WebSocket Open] Initial turnIdCounter set to 0.");
             isGameFinished = false;
             historyLog.innerHTML = '';
+            objectUrls.forEach(url => URL.revokeObjectURL(url));
+            objectUrls = [];
             if (objectivesList) objectivesList.innerHTML = '';
             turnNarrationStatus = {}; // Reset on new connection
             pendingChoices = {};    // Reset on new connection
+            streamedNarration = {}; // Reset on new connection
             createNewTurnElement(turnIdCounter);
         };
         socket.onclose = () => {
@@ -151,6 +164,10 @@ document.addEventListener('DOMContentLoaded', () => {
             if (activeTypingAbortController) activeTypingAbortController.abort(); // Cancel typing on error
         };
         socket.onmessage = (event) => {
+            if (event.data instanceof ArrayBuffer) {
+                handleBinaryFrame(event.data);
+                return;
+            }
             try {
                  const data = JSON.parse(event.data);
                  handleServerMessage(data);
@@ -160,11 +177,33 @@ document.addEventListener('DOMContentLoaded', () => {
         };
     }
 
+    // Decode a binary frame into the same shape as the JSON messages, with an object URL instead of base64
+    function handleBinaryFrame(buffer) {
+        try {
+            const view = new DataView(buffer);
+            const version = view.getUint8(0);
+            if (version !== BINARY_PROTOCOL_VERSION) {
+                console.warn('[WebSocket Warning] Unsupported binary frame version:', version);
+                return;
+            }
+            const type = BINARY_FRAME_TYPES[view.getUint8(1)];
+            const turnId = view.getUint32(2);
+            const mimeLength = view.getUint8(6);
+            const mime = new TextDecoder('ascii').decode(new Uint8Array(buffer, 7, mimeLength));
+            const payload = new Uint8Array(buffer, 7 + mimeLength);
+            const url = URL.createObjectURL(new Blob([payload], { type: mime }));
+            objectUrls.push(url);
+            handleServerMessage({ type: type, url: url, turn_id: turnId });
+        } catch (e) {
+            console.error("[WebSocket Error] Failed to decode binary frame:", e);
+        }
+    }
+
     // Main message handler
     function handleServerMessage(data) {
          switch (data.type) {
             case 'text':
-                console.log("[handleServerMessage] Received 'text' type (potentially legacy):", data.content);
+                handleTextDeltaMessage(data);
                 break;
             case 'narration_block':
                 handleNarrationBlockMessage(data);
@@ -172,6 +211,9 @@ document.addEventListener('DOMContentLoaded', () => {
             case 'image':
                 handleImageMessage(data);
                 break;
+            case 'image_preview':
+                handleImagePreviewMessage(data);
+                break;
             case 'choices':
                 handleChoicesMessage(data.content, data.turn_id);
                 break;
@@ -184,6 +226,9 @@ document.addEventListener('DOMContentLoaded', () => {
             case 'game_end':
                 handleGameEndMessage(data);
                 break;
+            case 'session_restored':
+                handleSessionRestoredMessage(data);
+                break;
             default:
                 console.warn('[WebSocket Warning] Unknown message type:', data.type);
         }
@@ -243,9 +288,46 @@ document.addEventListener('DOMContentLoaded', () => {
         return turnElement;
     }
 
+    // Streamed narration: append each delta as it arrives; narration_block later finalizes the turn
+    function handleTextDeltaMessage(data) {
+        const targetTurnElement = historyLog.querySelector(`.turn-container[data-turn-id="${data.turn_id}"]`);
+        const narrationElement = targetTurnElement?.querySelector('.turn-narration');
+        if (!narrationElement) {
+            console.warn(`[handleTextDeltaMessage] No narration element for turn_id: ${data.turn_id}. Waiting for narration_block.`);
+            return;
+        }
+        if (turnNarrationStatus[data.turn_id] !== "streaming") {
+            if (activeTypingAbortController) activeTypingAbortController.abort();
+            turnNarrationStatus[data.turn_id] = "streaming";
+            streamedNarration[data.turn_id] = '';
+        }
+        streamedNarration[data.turn_id] += data.content;
+        narrationElement.innerHTML = formatNarration(streamedNarration[data.turn_id]);
+        ensureCursor(narrationElement);
+        scrollToBottom();
+    }
+
     // Modified function to simulate typing for narration blocks
     async function handleNarrationBlockMessage(data) {
         console.log(`[handleNarrationBlockMessage] Received narration for turn_id: ${data.turn_id}`);
+
+        // Already shown via streamed deltas: just settle on the final text, no re-typing
+        if (turnNarrationStatus[data.turn_id] === "streaming") {
+            const streamedTurnElement = historyLog.querySelector(`.turn-container[data-turn-id="${data.turn_id}"]`);
+            const streamedNarrationElement = streamedTurnElement?.querySelector('.turn-narration');
+            if (streamedNarrationElement) {
+                streamedNarrationElement.innerHTML = formatNarration(data.content);
+                removeCursor(streamedNarrationElement);
+            }
+            delete streamedNarration[data.turn_id];
+            turnNarrationStatus[data.turn_id] = "complete";
+            if (pendingChoices[data.turn_id]) {
+                renderChoices(data.turn_id, pendingChoices[data.turn_id]);
+                delete pendingChoices[data.turn_id];
+            }
+            scrollToBottom();
+            return;
+        }
         
         // Cancel any previous typing animation for this turn or globally
         if (activeTypingAbortController) {
@@ -357,13 +439,22 @@ document.addEventListener('DOMContentLoaded', () => {
                 }
             };
             // Assign actual scene image URL
-            imageElement.src = `data:image/png;base64,${data.content}`; // Use data.content which is the URL
+            imageElement.dataset.final = 'true'; // Late previews must not replace it
+            imageElement.src = data.url || `data:image/png;base64,${data.content}`; // /media URL, object URL (binary frame) or legacy base64
             console.log(`[handleImageMessage] Set image src for turn_id: ${data.turn_id}.`);
         } else {
             console.error(`[handleImageMessage] Error: imageElement or imageContainer not found for turn_id: ${data.turn_id}.`);
         }
     }
 
+    // Partial image while the scene renders; the loader stays until the final image arrives
+    function handleImagePreviewMessage(data) {
+        const targetTurnElement = historyLog.querySelector(`.turn-container[data-turn-id="${data.turn_id}"]`);
+        const imageElement = targetTurnElement?.querySelector('.turn-image');
+        if (!imageElement || imageElement.dataset.final === 'true') return;
+        imageElement.src = data.url || `data:${data.mime || 'image/jpeg'};base64,${data.content}`;
+    }
+
     // Handle choices messages - signaling end of turn
     function handleChoicesMessage(choices, originating_turn_id) {
         console.log(`[handleChoicesMessage] Received choices for turn_id (originating): ${originating_turn_id}`);
@@ -483,10 +574,23 @@ document.addEventListener('DOMContentLoaded', () => {
         scrollToBottom(); // Scroll regardless of error type
     }
 
+    // The server resumed an existing game: start the log at its current turn instead of turn 0
+    function handleSessionRestoredMessage(data) {
+        console.log(`[handleSessionRestoredMessage] Resuming at turn_id: ${data.turn_id}`);
+        historyLog.innerHTML = '';
+        turnNarrationStatus = {};
+        pendingChoices = {};
+        streamedNarration = {};
+        turnIdCounter = data.turn_id;
+        createNewTurnElement(turnIdCounter);
+    }
+
     // Handle game end messages
     function handleGameEndMessage(data) {
         console.log("[handleGameEndMessage] Received game_end message:", data.message);
         isGameFinished = true;
+        // A finished story can't be resumed: the next reload starts a new game with a fresh session ID
+        sessionStorage.removeItem('aurora-session-id');
 
         // Determine the ID of the last turn that received choices or narration.
         // This might be (turnIdCounter - 1) if createNewTurnElement was called for the *next* turn after last choice.
@@ -529,6 +633,22 @@ document.addEventListener('DOMContentLoaded', () => {
         historyLog.scrollLeft = historyLog.scrollWidth;
     }
 
+    // Small pixel-art images would be smoothed by PDF viewers when scaled up, so pre-scale
+    // them by a whole factor on a canvas with smoothing off. Large images are used as-is.
+    function pixelArtForPdf(imgElement, targetWidth) {
+        const width = imgElement.naturalWidth;
+        const height = imgElement.naturalHeight;
+        if (!width || !height || width >= targetWidth) return imgElement;
+        const scale = Math.ceil(targetWidth / width);
+        const canvas = document.createElement('canvas');
+        canvas.width = width * scale;
+        canvas.height = height * scale;
+        const ctx = canvas.getContext('2d');
+        ctx.imageSmoothingEnabled = false;
+        ctx.drawImage(imgElement, 0, 0, canvas.width, canvas.height);
+        return canvas;
+    }
+
     // PDF Generation Function
     async function generatePdf() {
         if (isGameFinished || turnIdCounter > 0) { 
@@ -635,7 +755,7 @@ document.addEventListener('DOMContentLoaded', () => {
                                 if (imgElement.complete && imgElement.naturalWidth !== 0) resolve();
                             });
                         }
-                        const imgData = imgElement.src;
+                        const imgData = pixelArtForPdf(imgElement, commonContentTargetWidth);
                         const originalWidth = imgElement.naturalWidth || 512;
                         const originalHeight = imgElement.naturalHeight || 512;
                         
@@ -643,7 +763,8 @@ document.addEventListener('DOMContentLoaded', () => {
                         let imgPdfHeight = originalHeight;
 
                         // Scale image to fit commonContentTargetWidth while maintaining aspect ratio
-                        if (imgPdfWidth > commonContentTargetWidth) {
+                        // (up as well as down: images may arrive at their true pixel-art resolution)
+                        if (imgPdfWidth !== commonContentTargetWidth) {
                             imgPdfHeight = (commonContentTargetWidth / imgPdfWidth) * imgPdfHeight;
                             imgPdfWidth = commonContentTargetWidth;
                         }
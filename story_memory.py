@@ -0,0 +1,144 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+from config import (
+    STORY_MEMORY_RECENT_TURNS,
+    STORY_MEMORY_COMPACT_EVERY,
+    STORY_MEMORY_SUMMARY_MAX_CHARS,
+    STORY_MEMORY_TOKEN_BUDGET,
+)
+from openai_agent_service import StoryResponse
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token); good enough for budgeting without a tokenizer."""
+    return (len(text) + 3) // 4
+
+def first_sentences(text: str, max_chars: int) -> str:
+    """Leading whole sentences of text that fit in max_chars (hard-cut if the first one doesn't)."""
+    text = " ".join(text.split())
+    out = ""
+    for sentence in _SENTENCE_END.split(text):
+        candidate = f"{out} {sentence}".strip()
+        if len(candidate) > max_chars:
+            break
+        out = candidate
+    return out or text[:max_chars].rstrip() + "…"
+
+@dataclass
+class MemoryTurn:
+    turn_number: int
+    choice: str
+    response: StoryResponse
+
+class StoryMemory:
+    """Bounded memory of the story so far, for building the agent's per-turn input.
+
+    - `turns`: the latest turns as structured StoryResponse objects (at most
+      recent_turns + compact_every of them);
+    - `summary`: a rolling extractive summary of everything older, refreshed every
+      `compact_every` turns by folding the oldest turns into it (first sentence of each
+      narration plus the choice that led there), capped at `summary_max_chars`;
+    - build_context(): the prompt section, fitted to a token budget.
+    Size stays flat no matter how long the game runs.
+    """
+
+    def __init__(
+        self,
+        recent_turns: int = STORY_MEMORY_RECENT_TURNS,
+        compact_every: int = STORY_MEMORY_COMPACT_EVERY,
+        summary_max_chars: int = STORY_MEMORY_SUMMARY_MAX_CHARS,
+    ):
+        self.recent_turns = max(1, recent_turns)
+        self.compact_every = max(1, compact_every)
+        self.summary_max_chars = summary_max_chars
+        self.turns: list[MemoryTurn] = []
+        self.summary_lines: list[str] = []
+        self._recorded_since_compaction = 0
+
+    @property
+    def last_response(self) -> Optional[StoryResponse]:
+        return self.turns[-1].response if self.turns else None
+
+    @property
+    def summary(self) -> str:
+        return " ".join(self.summary_lines)
+
+    def clear(self):
+        self.turns.clear()
+        self.summary_lines.clear()
+        self._recorded_since_compaction = 0
+
+    def record(self, turn_number: int, choice: str, response: StoryResponse):
+        self.turns.append(MemoryTurn(turn_number, choice, response))
+        self._recorded_since_compaction += 1
+        if self._recorded_since_compaction >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Folds all but the most recent turns into the summary."""
+        self._recorded_since_compaction = 0
+        overflow = len(self.turns) - self.recent_turns
+        if overflow <= 0:
+            return
+        for turn in self.turns[:overflow]:
+            self.summary_lines.append(f"(Rodada {turn.turn_number}, escolha '{turn.choice}') {first_sentences(turn.response.narration, 160)}")
+        del self.turns[:overflow]
+        while self.summary_lines and len(self.summary) > self.summary_max_chars:
+            self.summary_lines.pop(0) # The oldest events go first
+
+    def build_context(self, token_budget: int = STORY_MEMORY_TOKEN_BUDGET) -> str:
+        """The memory section of the agent input, within token_budget.
+
+        Priority: the previous scene, then recent turns (newest first), then the oldest
+        summary lines last. Output reads oldest to newest.
+        """
+        if not self.turns:
+            return "Resumo da cena anterior: Nenhum ainda."
+        remaining = token_budget - estimate_tokens("Resumo da história até agora: \n\nCenas recentes:\n\n\n") # Section headers
+        previous = self.turns[-1]
+        previous_text = first_sentences(previous.response.narration, max(80, remaining * 4 // 2))
+        previous_section = f"Cena anterior (rodada {previous.turn_number}): {previous_text}"
+        remaining -= estimate_tokens(previous_section)
+
+        recent_lines: list[str] = []
+        for turn in reversed(self.turns[:-1]):
+            line = f"- Rodada {turn.turn_number} (escolha '{turn.choice}'): {first_sentences(turn.response.narration, 200)}"
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            recent_lines.insert(0, line)
+            remaining -= cost
+
+        summary_lines: list[str] = []
+        for line in reversed(self.summary_lines):
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            summary_lines.insert(0, line)
+            remaining -= cost
+
+        sections = []
+        if summary_lines:
+            sections.append("Resumo da história até agora: " + " ".join(summary_lines))
+        if recent_lines:
+            sections.append("Cenas recentes:\n" + "\n".join(recent_lines))
+        sections.append(previous_section)
+        return "\n\n".join(sections)
+
+    def to_state(self) -> dict:
+        return {
+            "turns": [{"turn_number": t.turn_number, "choice": t.choice, "response": t.response.model_dump(mode="json")} for t in self.turns],
+            "summary_lines": list(self.summary_lines),
+            "recorded_since_compaction": self._recorded_since_compaction,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "StoryMemory":
+        memory = cls()
+        memory.turns = [MemoryTurn(t["turn_number"], t["choice"], StoryResponse.model_validate(t["response"])) for t in state.get("turns", [])]
+        memory.summary_lines = list(state.get("summary_lines", []))
+        memory._recorded_since_compaction = state.get("recorded_since_compaction", 0)
+        return memory
@@ -0,0 +1,213 @@
+import contextvars
+import functools
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from config import TRACE_ENABLED, TRACE_FILE, TRACE_FILE_MAX_BYTES, TRACE_TURNS_PER_SESSION, TRACE_MAX_SESSIONS
+from app_logging import session_id_var, turn_id_var
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+class Span:
+    """One timed stage of a turn. Session and turn come from the logging context at start."""
+
+    __slots__ = ("name", "span_id", "parent_id", "session_id", "turn_id", "start_ns", "end_ns", "attrs")
+    _ids = iter(range(1, 1 << 62))
+
+    def __init__(self, name: str, parent: Optional["Span"], attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = next(Span._ids)
+        self.parent_id = parent.span_id if parent else None
+        self.session_id = session_id_var.get()
+        self.turn_id = turn_id_var.get()
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attrs = attrs
+
+    def end(self, **attrs):
+        if self.end_ns is None:
+            self.attrs.update(attrs)
+            self.end_ns = time.time_ns()
+            tracer.record(self)
+
+class Tracer:
+    """Keeps the last `turns_per_session` turns of spans per session for /debug/traces, and
+    exports every span to a JSONL file on a background thread.
+
+    The file is in the Chrome trace-event JSON array format (one complete "X" event per
+    line, closing bracket omitted, which the format allows), so chrome://tracing,
+    Perfetto and speedscope open it directly. Each session/turn pair gets its own lane.
+    Once the file reaches `max_file_bytes` it is renamed to `<path>.1` (replacing the
+    previous one) and a new file is started.
+    """
+
+    def __init__(self, enabled: bool, path: str, turns_per_session: int, max_sessions: int, max_file_bytes: int):
+        self.enabled = enabled
+        self.path = path
+        self.turns_per_session = turns_per_session
+        self.max_sessions = max_sessions
+        self.max_file_bytes = max_file_bytes
+        self._sessions: OrderedDict[str, OrderedDict[Any, list[Span]]] = OrderedDict()
+        # Writer thread only. Bounded like the in-memory window: an evicted turn that shows up
+        # again just gets a new lane.
+        self._lanes: OrderedDict[tuple, int] = OrderedDict()
+        self._next_lane = 1
+        self._queue: queue.Queue = queue.Queue(maxsize=10000)
+        self._writer: Optional[threading.Thread] = None
+        self.exported = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def record(self, span: Span):
+        if span.session_id is not None:
+            turns = self._sessions.get(span.session_id)
+            if turns is None:
+                turns = self._sessions[span.session_id] = OrderedDict()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(span.session_id)
+            spans = turns.get(span.turn_id)
+            if spans is None:
+                spans = turns[span.turn_id] = []
+                while len(turns) > self.turns_per_session:
+                    turns.popitem(last=False)
+            spans.append(span)
+        self._export(span)
+
+    def _export(self, span: Span):
+        if not self.path:
+            return
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+            self._writer.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _lane(self, span: Span, out) -> int:
+        key = (span.session_id, span.turn_id)
+        lane = self._lanes.get(key)
+        if lane is not None:
+            self._lanes.move_to_end(key)
+        else:
+            lane = self._lanes[key] = self._next_lane
+            self._next_lane += 1
+            while len(self._lanes) > self.max_sessions * self.turns_per_session:
+                self._lanes.popitem(last=False)
+            label = f"session {span.session_id} turn {span.turn_id}" if span.session_id else "process"
+            out.write(json.dumps({"ph": "M", "name": "thread_name", "pid": os.getpid(), "tid": lane, "args": {"name": label}}) + ",\n")
+        return lane
+
+    def _open(self):
+        out = open(self.path, "a", encoding="utf-8")
+        if out.tell() == 0:
+            out.write("[\n")
+        return out
+
+    def _rotate(self, out):
+        """Moves the full file to <path>.1 and starts a new one; lane names are written again as they recur."""
+        out.close()
+        os.replace(self.path, f"{self.path}.1")
+        self._lanes.clear()
+        self.rotations += 1
+        return self._open()
+
+    def _write_loop(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        out = self._open()
+        try:
+            while True:
+                span = self._queue.get()
+                if self.max_file_bytes > 0 and out.tell() >= self.max_file_bytes:
+                    out = self._rotate(out)
+                event = {
+                    "name": span.name,
+                    "cat": span.name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": span.start_ns // 1000,
+                    "dur": (span.end_ns - span.start_ns) // 1000,
+                    "pid": os.getpid(),
+                    "tid": self._lane(span, out),
+                    "args": {"session_id": span.session_id, "turn_id": span.turn_id, "span_id": span.span_id, "parent_id": span.parent_id, **span.attrs},
+                }
+                out.write(json.dumps(event, default=str) + ",\n")
+                self.exported += 1
+                if self._queue.empty():
+                    out.flush()
+        finally:
+            out.close()
+
+    def waterfall(self, session_id: str, last_turns: int) -> list[Dict[str, Any]]:
+        """The last `last_turns` turns of a session, each as spans ordered by start with offsets from the turn start."""
+        turns = self._sessions.get(session_id) or {}
+        result = []
+        for turn_id, spans in list(turns.items())[-last_turns:]:
+            spans = sorted(spans, key=lambda s: s.start_ns)
+            turn_start = spans[0].start_ns
+            turn_end = max(s.end_ns for s in spans)
+            depth: Dict[int, int] = {}
+            rows = []
+            for s in spans:
+                depth[s.span_id] = depth[s.parent_id] + 1 if s.parent_id in depth else 0
+                rows.append({
+                    "name": s.name,
+                    "depth": depth[s.span_id],
+                    "offset_ms": round((s.start_ns - turn_start) / 1e6, 2),
+                    "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 2),
+                    "attrs": s.attrs,
+                })
+            result.append({"turn_id": turn_id, "total_ms": round((turn_end - turn_start) / 1e6, 2), "spans": rows})
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, "sessions": len(self._sessions), "exported": self.exported, "dropped": self.dropped, "rotations": self.rotations, "file": self.path}
+
+@contextmanager
+def span(name: str, **attrs):
+    """Times the enclosed block as a child of the current span."""
+    if not tracer.enabled:
+        yield None
+        return
+    current = Span(name, _current_span.get(), attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+def start_span(name: str, **attrs) -> Optional[Span]:
+    """A leaf span ended explicitly with .end(), for stages that don't fit a with block."""
+    if not tracer.enabled:
+        return None
+    return Span(name, _current_span.get(), attrs)
+
+def end_span(current: Optional[Span], **attrs):
+    if current is not None:
+        current.end(**attrs)
+
+def traced(name: str):
+    """Decorator form of span() for coroutine functions."""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+# Shared by every session in the process; /debug/traces reads it.
+tracer = Tracer(TRACE_ENABLED, TRACE_FILE, TRACE_TURNS_PER_SESSION, TRACE_MAX_SESSIONS, TRACE_FILE_MAX_BYTES)
@@ -0,0 +1,109 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict
+
+import config
+from image_utils import sprite_registry, PLACEHOLDER_IMAGE_PATH
+from image_workers import image_workers
+from openai_agent_service import get_storyteller_agent, validate_story_response_schema
+from app_logging import get_logger
+
+logger = get_logger("warmup")
+
+STATIC_DIR = "static"
+
+class Readiness:
+    """Outcome of the startup warm-up, reported by /readyz.
+
+    A worker is ready once every required check has passed, and stops being ready
+    when it starts shutting down, so the load balancer drains it.
+    """
+
+    REQUIRED_CHECKS = ("agent", "sprites", "static_assets")
+
+    def __init__(self):
+        self.checks: Dict[str, Dict[str, Any]] = {}
+        self.shutting_down = False
+        self.warmup_seconds: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return not self.shutting_down and all(self.checks.get(name, {}).get("ok") for name in self.REQUIRED_CHECKS)
+
+    def mark(self, name: str, ok: bool, **detail):
+        self.checks[name] = {"ok": ok, **detail}
+        logger.info("%s: %s %s", name, 'ok' if ok else 'FAILED', detail or '')
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "shutting_down": self.shutting_down,
+            "warmup_seconds": self.warmup_seconds,
+            "checks": self.checks,
+        }
+
+def _warm_agent(readiness: Readiness):
+    try:
+        json_schema = validate_story_response_schema()
+        agent = get_storyteller_agent()
+        readiness.mark("agent", True, agent_name=agent.name, tools=len(agent.tools), schema_fields=len(json_schema.get("properties", {})))
+    except Exception as e:
+        readiness.mark("agent", False, error=str(e))
+
+def _warm_sprites(readiness: Readiness):
+    paths = [*config.CHARACTER_IMAGE_PATHS.values(), PLACEHOLDER_IMAGE_PATH]
+    loaded = sprite_registry.preload(paths)
+    readiness.mark("sprites", loaded == len(paths), loaded=loaded, expected=len(paths))
+
+def _warm_static_assets(readiness: Readiness):
+    """Reads every client asset once, so the first page load is served from the page cache."""
+    files = total_bytes = 0
+    for root, _, names in os.walk(STATIC_DIR):
+        for name in names:
+            with open(os.path.join(root, name), "rb") as f:
+                total_bytes += len(f.read())
+            files += 1
+    has_index = os.path.isfile(os.path.join(STATIC_DIR, "index.html"))
+    readiness.mark("static_assets", has_index, files=files, bytes=total_bytes)
+
+async def _warm_image_workers(readiness: Readiness):
+    """Spawns the image worker processes, which import PIL and the image modules once each."""
+    started = time.monotonic()
+    try:
+        started_workers = await image_workers.start()
+        readiness.mark("image_workers", True, processes=started_workers, seconds=round(time.monotonic() - started, 3))
+    except Exception as e: # Image work fails per call instead; the worker still serves stories
+        readiness.mark("image_workers", False, error=str(e))
+
+async def _warm_provider_connections(readiness: Readiness, count: int):
+    """Opens `count` pooled connections to the provider with cheap metadata requests. Never blocks readiness."""
+    async def touch():
+        await config.client.with_options(max_retries=0).models.retrieve("gpt-4.1")
+
+    started = time.monotonic()
+    results = await asyncio.gather(
+        *(asyncio.wait_for(touch(), config.WARMUP_TIMEOUT_SECONDS) for _ in range(count)),
+        return_exceptions=True,
+    )
+    errors = [r for r in results if isinstance(r, BaseException)]
+    readiness.mark(
+        "provider_connections", not errors,
+        requested=count, opened=count - len(errors), seconds=round(time.monotonic() - started, 3),
+        **({"error": repr(errors[0])} if errors else {}),
+    )
+
+async def warm_up(readiness: Readiness):
+    """Startup work that would otherwise land on the first requests."""
+    started = time.monotonic()
+    await asyncio.to_thread(_warm_agent, readiness)
+    await asyncio.to_thread(_warm_sprites, readiness)
+    await asyncio.to_thread(_warm_static_assets, readiness)
+    await _warm_image_workers(readiness)
+    if config.WARMUP_PROVIDER_CONNECTIONS > 0:
+        await _warm_provider_connections(readiness, config.WARMUP_PROVIDER_CONNECTIONS)
+    readiness.warmup_seconds = round(time.monotonic() - started, 3)
+    logger.info("Finished in %ss. Ready: %s", readiness.warmup_seconds, readiness.ready)
+
+# Shared by the app's lifespan and /readyz.
+readiness = Readiness()
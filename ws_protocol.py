@@ -0,0 +1,45 @@
+import struct
+
+# Capabilities a client may advertise on connect via the `caps` query parameter,
+# e.g. /ws/<session_id>?caps=binary_images. Unknown values are ignored, and a
+# client that sends nothing gets the original JSON-only protocol.
+CAP_BINARY_IMAGES = "binary_images"
+CAP_IMAGE_URLS = "image_urls" # Image messages carry a /media URL instead of the bytes
+CAP_IMAGE_PREVIEWS = "image_previews" # Client accepts image_preview messages while an image renders
+SUPPORTED_CAPABILITIES = {CAP_BINARY_IMAGES, CAP_IMAGE_URLS, CAP_IMAGE_PREVIEWS}
+
+# Binary frame layout (network byte order):
+#   u8  protocol version
+#   u8  message type (FRAME_* below)
+#   u32 turn_id
+#   u8  length of the MIME type string
+#   ... MIME type (ASCII), then the raw payload bytes
+PROTOCOL_VERSION = 1
+FRAME_IMAGE = 1
+FRAME_IMAGE_PREVIEW = 2
+
+_HEADER = struct.Struct("!BBIB")
+
+def parse_capabilities(raw_caps: str | None) -> set[str]:
+    """Parses a comma-separated capability list, keeping only ones the server supports."""
+    if not raw_caps:
+        return set()
+    requested = {cap.strip() for cap in raw_caps.split(",") if cap.strip()}
+    return requested & SUPPORTED_CAPABILITIES
+
+def encode_binary_frame(frame_type: int, turn_id: int, mime: str, payload: bytes) -> bytes:
+    """Builds a binary WebSocket frame: typed header followed by the raw payload."""
+    mime_bytes = mime.encode("ascii")
+    if len(mime_bytes) > 255:
+        raise ValueError(f"MIME type too long for binary frame header: {mime}")
+    header = _HEADER.pack(PROTOCOL_VERSION, frame_type, turn_id, len(mime_bytes)) + mime_bytes
+    return header + payload
+
+def decode_binary_frame(frame: bytes) -> tuple[int, int, str, memoryview]:
+    """Inverse of encode_binary_frame. Returns (frame_type, turn_id, mime, payload view)."""
+    version, frame_type, turn_id, mime_len = _HEADER.unpack_from(frame, 0)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary frame version: {version}")
+    mime_start = _HEADER.size
+    mime = bytes(frame[mime_start:mime_start + mime_len]).decode("ascii")
+    return frame_type, turn_id, mime, memoryview(frame)[mime_start + mime_len:]